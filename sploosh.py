@@ -23,13 +23,21 @@
 # The program also utilizes SQL as its backend storage method throught the use of
 # the SQLLite3 library.
 #
+# The loading, counting and searching itself is done by sploosh_engine.py, which
+# does not need a display and is also used by the command line interface in
+# sploosh_cli.py. This file holds the GUI.
+#
 # Authors:  Noah Bender
 #           Joseph Dabkowski
 # Starting: 7/25/2024
 
 # import statement(s)
 import os
-import re as regex
+import itertools
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 #import customtkinter as ctk
 from tkinter import *
@@ -37,176 +45,294 @@ from tkinter import filedialog
 from tkinter import Button
 from tkinter import ttk
 import sqlite3
+from sploosh_engine import (dropdown_dict, log_columns, connect, load_file, load_files, follow_file, default_host,
+                            count, parse_filter, filter_rows, filter_span, search_condition, range_condition, search_span, host_condition, search_pages,
+                            format_rows, format_timestamp, write_output)
+import sploosh_metrics as metrics
 
 # global variables
 
 global file_path    # keeps track of the file path for the logs being analyzed.
+global file_paths   # keeps track of every file (or folder) chosen to be read, file_path is the first of them.
 global file_status  # keeps track of the status of the file being analyzed.
 
-# regex pattern for logs
-
-re_pat = regex.compile(
-    r'(?P<ip>[\d\.]+) - - \[(?P<timestamp>[^\]]+)\] "(?P<method>[A-Z]+) (?P<endpoint>[^ ]+) HTTP/1.1" '
-    r'(?P<status>\d+) (?P<packet_size>\d+) "(?P<referrer>[^"]+)" "(?P<user_agent>[^"]+)" (?P<response_time>\d+)'
-)
-
-# legend for dictionary
-
-dict_legend = {
-  1: 'ip: ',
-  2: 'timestamp: ',
-  3: 'method: ',
-  4: 'endpoint: ',
-  5: 'status: ',
-  6: 'packet size: ',
-  7: 'referrer: ',
-  8: 'user agent: ',
-  9: 'response time: '
-}
-
-# legend for dropdown menu
-
-dropdown_dict = {
-  "IP Address": "ip_addr",
-  "Timestamp": "timestamp",
-  "Method": "method",
-  "Endpoint": "endpoint",
-  "Status": "status",
-  "Packet Size": "packet_size",
-  "Referrer": "referrer",
-  "User Agent": "user_agent",
-  "Response Time": "response_time"
-}
+# number of background threads used to run counts and searches (loads always run one at a time on their own thread)
+job_worker_count = 4
+
+# how often (in milliseconds) the GUI checks for progress and results from background jobs
+poll_interval = 100
+
+# background job state
+# jobs keeps track of every queued or running job by its id, and job_events carries (job id, kind, value) messages
+# from the worker threads back to the GUI thread, which reads them in poll_jobs
+jobs = {}
+job_events = queue.Queue()
+job_ids = itertools.count(1)
+job_executors = {}
+job_local = threading.local()
+
+# live follow mode state
+# follow_state keeps track of the follow job, and every open count window registers a function in count_listeners
+# (called with every micro-batch of new rows) and one in count_refreshers (called to re-run its count)
+follow_state = {"job": None}
+count_listeners = {}
+count_refreshers = {}
 
 ### FUNCTIONS START HERE ###
 
-# function to get the file path for a log file
+# function to get the file paths for one or more log files
 # uses a standard file explorer window as part of the tkinter library
 def browse_files():
-  # using global file_path
-  global file_path 
-  # sets file_path to the user's chosen file
-  file_path = filedialog.askopenfilename()
-  # Enter the file_path into the text box after it is selected
-  t.insert(tk.END, file_path)
+  # using global file_path and file_paths
+  global file_path, file_paths
+  # sets file_paths to the user's chosen files (nothing changes if the window is closed without choosing any)
+  chosen = filedialog.askopenfilenames()
+  if not chosen:
+    return
+  file_paths = list(chosen)
+  file_path = file_paths[0]
+  # Enter the file paths into the text box after they are selected
+  t.insert(tk.END, "\n".join(file_paths))
 
+# function to choose a folder of log files (ex. one folder per host), every log file inside it is read
+def browse_folder():
+  global file_path, file_paths
+  folder = filedialog.askdirectory()
+  if not folder:
+    return
+  file_paths = [folder]
+  file_path = folder
+  t.insert(tk.END, folder)
 
 # read file takes in a text box and SQLLite3 cursor as parameters
 def read_file(t, cursor):
-  # global variables
-  global file_status  # The file_status global variable determines whether the read_file function can function
-  global file_path    # The global file_path will allow for the reading of the chosen file.
-
   # if the file_path is set to "none", there cannot be an attempt to read it. 
   if file_path == "none":
     t.insert(tk.END, "\nPlease select a file before attempting to read it.")
     return # End function early
   
-  # Try to open the selected file
-  try:
-    # open the file from file_path in read mode
-    file = open(file_path,'r')
-    # get the lines of the file in an array
-    lines = file.readlines()
-
-    # for loop iterates through each line within lines array
-    for line in lines:
-      # temporary empty variables for SQL command
-      ip_addr = ''
-      timestamp = ''
-      method = ''
-      endpoint = ''
-      status = ''
-      packet_size = ''
-      referrer = ''
-      user_agent = ''
-      response_time = ''
-
-      # check if the line can be split based on the previously defined regex command
-      if re_pat.match(line):
-        # split the line up based on the re_pat regex command
-        match = re_pat.match(line)
-        # if match returns true, there was a match found
-        if match:
-          # set the results of match into a dictionary object line_dict
-          line_dict = match.groupdict()
-          # Enter the values of the dictionary into the temporary variables
-          ip_addr = line_dict['ip']
-          timestamp = line_dict['timestamp']
-          method = line_dict['method']
-          endpoint = line_dict['endpoint']
-          status = line_dict['status']
-          packet_size = line_dict['packet_size']
-          referrer = line_dict['referrer']
-          user_agent = line_dict['user_agent']
-          response_time = line_dict['response_time']
-
-        # formulate an SQL command with fields for each field of the logs 
-        sql_command = "INSERT INTO logs (ip_addr, timestamp, method, endpoint, status, packet_size, referrer, user_agent, response_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
-        # try to execute the command
-        try:
-            # execute the command whilst filling in the slots for each field
-            cursor.execute(sql_command,
-                         (ip_addr, timestamp, method, endpoint, status, int(packet_size),
-                          referrer, user_agent, int(response_time)))
-        # if the execution failed, it is likely due to an improper command
-        except:
-          # Output an error statement to the text box
-          t.insert("\nInvalid log format detected,\n please attempt again with a different file.")
-        # commit the changes to the database connection.
-        conn.commit()
-        # set the file status to 1, valid
-        file_status = 1 # Valid Status
-      # if the regex command fails
-      else:
-        # set the file status to -1, meaning Wrong File Format
-        file_status = -1 # Invalid Status - Wrong File Format
-    # If the file_status was set to 1
-    if (file_status == 1):
-      # print a successful read statement
-      t.insert(tk.END, "\nFile Read Successfully.")
-    # If the file_status was set to -1 (Wrong File Format)
-    if (file_status == -1):
+  # the paths are copied since the user may browse for another file while this one is being loaded
+  path = file_path
+  paths = list(file_paths)
+
+  # inner function show_progress displays how much of the file has been read in the progress bar
+  def show_progress(done, total):
+    progress_bar.stop()
+    progress_bar.config(mode="determinate", maximum=max(total, 1), value=done)
+
+  # inner function on_done reports the result of the load
+  def on_done(stats):
+    global file_status
+    # several files are reported as one load
+    if isinstance(stats, list):
+      stats = combine_stats(stats)
+    # if nothing was added to a file that was already read, it is still valid
+    if stats["lines"] == 0 and stats["start"] > 0:
+      file_status = 1 # Valid Status
+      t.insert(tk.END, "\nFile is already up to date.")
+    # the file is valid if any of its lines were valid log lines
+    elif stats["rows"] > 0:
+      # set the file status to 1, valid
+      file_status = 1 # Valid Status
+      # print a successful read statement along with the load speed
+      new = "new " if stats["start"] > 0 else ""
+      t.insert(tk.END, f"\nFile Read Successfully. ({stats['rows']} {new}rows in {stats['seconds']:.2f}s, {stats['rows_per_sec']:.0f} rows/sec)")
+      # mention any lines that were not log lines (ex. blank lines or lines cut short)
+      if stats["rejected"]:
+        t.insert(tk.END, f"\n{stats['rejected']} lines were not valid log lines and were skipped.")
+    # otherwise the file is in the wrong format
+    else:
+      # set the file status to -1, meaning Wrong File Format
+      file_status = -1 # Invalid Status - Wrong File Format
       # Output an error statement to the text box
       t.insert(tk.END, "\nInvalid Log Format.")
-  # If the file cannot be read (ex. deleted after file_path was chosen)
-  except:
+
+  # inner function on_error is called if the file cannot be read (ex. deleted after file_path was chosen)
+  def on_error(error):
+    global file_status
     # print error statement to text box
     t.insert(tk.END, "\nInvalid File. Please try again.")
     # set the file status to -2, meaning FNF
     file_status = -2 #Invalid Status - File Not Found
 
-# The count function will count the occurences of each type of log field and return them in dictionary format
-def count(search_cur, term):
-  # Using search cursor execute the below command to collect all of each column based on the chosen term
-  search_cur.execute('SELECT ' + term + ' FROM logs')
-  # take the results from the command and store them in rows
-  rows = search_cur.fetchall()
-  # create an empty dictionary
-  count_dict = {}
-  # for loop iterates through row in the collected rows
-  for row in rows:
-    # get the first item in the row and set it as the key
-    key = row[0]
-    # if the key is in the dictionary
-    if key in count_dict:
-      # increment the dictionary based on that key by 1
-      count_dict[key] += 1
-    # if the key is not in the dictionary
-    else:
-      # create a new dictionary entry based on the key and set it to 1
-      count_dict[key] = 1
-  # sort the dictionary
-  sorted_dict = {key: value for key, value in sorted(count_dict.items(), key=lambda item: item[1], reverse=True)}
-  # return the sorted dictionary
-  return sorted_dict
+  # load every line of the file (or files) into the database on a background thread
+  if len(paths) > 1 or os.path.isdir(path):
+    t.insert(tk.END, f"\nReading {len(paths)} files..." if len(paths) > 1 else f"\nReading the files in {os.path.basename(path)}...")
+    submit_job("Read File", lambda conn, progress, cancelled: load_files(conn, paths, progress, cancelled=cancelled), on_done, show_progress, on_error, pool="write")
+  else:
+    t.insert(tk.END, f"\nReading {os.path.basename(path)}...")
+    submit_job("Read File", lambda conn, progress, cancelled: load_file(conn, path, progress, cancelled=cancelled), on_done, show_progress, on_error, pool="write")
+
+# combine_stats takes in the list of (path, statistics) returned by load_files and returns the statistics of the files
+# added together, as if they were one file
+def combine_stats(results):
+  stats = {"lines": 0, "rows": 0, "rejected": 0, "seconds": 0.0, "start": 0}
+  for path, file_stats in results:
+    for key in ("lines", "rows", "rejected", "seconds"):
+      stats[key] += file_stats[key]
+    # the load only counts as new rows if any file was read before
+    stats["start"] = max(stats["start"], file_stats["start"])
+  stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+  return stats
+
+# worker_connection returns the database connection of the current worker thread, opening it the first time it is needed
+# every worker thread has its own connection since a SQLite connection cannot be shared between threads
+def worker_connection():
+  if getattr(job_local, "conn", None) is None:
+    job_local.conn = sqlite3.connect(db_path, timeout=30)
+  return job_local.conn
+
+# submit_job queues a function to be run on a background thread and returns the id of the job
+# work is called with the worker's database connection, a progress function (usually given the amount done and the total)
+# and a function that returns True once the job has been cancelled
+# on_done, on_progress and on_error are called on the GUI thread (by poll_jobs) with the result, progress or exception,
+# and on_cancel is called if the job is cancelled (by default the cancellation is reported in the main text box)
+# pool picks which threads run the job: "read" jobs share a pool of threads, "write" jobs (loads) run one at a time so
+# that SQLite only ever has a single bulk writer, and "follow" jobs (which run until cancelled) each get their own thread
+def submit_job(name, work, on_done=None, on_progress=None, on_error=None, pool="read", on_cancel=None):
+  # create the executors the first time a job is submitted
+  if not job_executors:
+    job_executors["read"] = ThreadPoolExecutor(max_workers=job_worker_count, thread_name_prefix="sploosh-read")
+    job_executors["write"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sploosh-write")
+    job_executors["follow"] = ThreadPoolExecutor(thread_name_prefix="sploosh-follow")
+  job_id = next(job_ids)
+  job = {"name": name, "cancelled": False, "conn": None, "on_done": on_done, "on_progress": on_progress, "on_error": on_error, "on_cancel": on_cancel}
+  jobs[job_id] = job
+  # inner function run is what actually runs on the worker thread
+  def run():
+    # the job may have been cancelled while it was waiting in the queue
+    if job["cancelled"]:
+      job_events.put((job_id, "cancelled", None))
+      return
+    job["conn"] = worker_connection()
+    try:
+      # with SPLOOSH_PROFILE set, every job writes a profile report (see sploosh_metrics.profile_operation)
+      with metrics.profile_operation(name.lower().replace(" ", "_")):
+        result = work(job["conn"], lambda *value: job_events.put((job_id, "progress", value)), lambda: job["cancelled"])
+      job_events.put((job_id, "cancelled" if job["cancelled"] else "done", result))
+    except Exception as error:
+      # an interrupted query raises an error, which is expected if the job was cancelled
+      job_events.put((job_id, "cancelled" if job["cancelled"] else "error", error))
+    finally:
+      job["conn"] = None
+  job_executors[pool].submit(run)
+  return job_id
+
+# cancel_job takes in a job id and cancels the job, interrupting its query if it is currently running
+def cancel_job(job_id):
+  job = jobs.get(job_id)
+  if job is None:
+    return
+  job["cancelled"] = True
+  # interrupt whatever the job's connection is running
+  conn = job["conn"]
+  if conn is not None:
+    conn.interrupt()
+
+# poll_jobs runs on the GUI thread every poll_interval milliseconds and hands messages from the worker threads to the job callbacks
+def poll_jobs():
+  while True:
+    try:
+      job_id, kind, value = job_events.get_nowait()
+    except queue.Empty:
+      break
+    job = jobs.get(job_id)
+    if job is None:
+      continue
+    # progress messages can arrive many times, every other message means the job is finished
+    if kind == "progress":
+      if job["on_progress"]:
+        try:
+          job["on_progress"](*value)
+        except tk.TclError:
+          pass
+      continue
+    del jobs[job_id]
+    try:
+      if kind == "done" and job["on_done"]:
+        job["on_done"](value)
+      elif kind == "error" and job["on_error"]:
+        job["on_error"](value)
+      elif kind == "cancelled" and job["on_cancel"]:
+        job["on_cancel"]()
+      elif kind == "cancelled":
+        t.insert(tk.END, f"\n{job['name']} cancelled.")
+    # the window the job was started from may have been closed while it was running
+    except tk.TclError:
+      pass
+  # show how many jobs are still queued or running
+  update_job_status()
+  # check again after the poll interval
+  window.after(poll_interval, poll_jobs)
+
+# update_job_status shows the number of active jobs in the status label and runs the progress bar while there are any
+def update_job_status():
+  if jobs:
+    v.set(f"{len(jobs)} job(s) running")
+    # without any load progress to show, the progress bar just shows that something is happening
+    if progress_bar["mode"] == "indeterminate":
+      progress_bar.start()
+  else:
+    v.set("")
+    progress_bar.stop()
+    progress_bar.config(mode="indeterminate", value=0)
+
+# cancel_all_jobs cancels every queued or running job, it is used by the cancel button in the menu
+def cancel_all_jobs():
+  for job_id in list(jobs):
+    cancel_job(job_id)
+
+# follow_button_click starts following the chosen file, or stops following it if it is already being followed
+def follow_button_click():
+  # stop following if a file is already being followed
+  if follow_state["job"] in jobs:
+    cancel_job(follow_state["job"])
+    return
+  if file_path == "none":
+    t.insert(tk.END, "\nPlease select a file before attempting to follow it.")
+    return
+  # only a single file can be followed
+  if os.path.isdir(file_path):
+    t.insert(tk.END, "\nPlease select a file (not a folder) to follow.")
+    return
+  path = file_path
+  host = default_host(path)
+  # inner function on_rows hands every micro-batch of new rows to the open count windows, along with the host they came from
+  def on_rows(rows):
+    for listener in list(count_listeners.values()):
+      listener(rows, host)
+  # inner function on_stop reports that following has stopped
+  def on_stop():
+    button_follow.config(text="Follow File")
+    t.insert(tk.END, f"\nStopped following {os.path.basename(path)}.")
+  # inner function on_error reports why following stopped
+  def on_error(error):
+    button_follow.config(text="Follow File")
+    t.insert(tk.END, f"\nStopped following {os.path.basename(path)}: {error}")
+  t.insert(tk.END, f"\nFollowing {os.path.basename(path)}...")
+  button_follow.config(text="Stop Following")
+  follow_state["job"] = submit_job("Follow File", lambda conn, progress, cancelled: follow_file(conn, path, progress, cancelled),
+                                   on_error=on_error, on_progress=on_rows, pool="follow", on_cancel=on_stop)
+  # open count windows need every value counted (not just the top N) to be able to update their counts
+  for listener in list(count_refreshers.values()):
+    listener()
+
+# show_stats shows the timings of every stage of loading and querying so far in the main text box (see sploosh_metrics)
+def show_stats():
+  t.insert(tk.END, "\n" + metrics.format_summary())
+  t.see(tk.END)
+
+# following returns True while a file is being followed
+def following():
+  return follow_state["job"] in jobs
 
 # the count_button_click function takes in the cursor as a parameter, it is used from the count button created in the menu
 def count_button_click(cursor):
   # using global file_path variable
   global file_path
   # if the file_path is set to none, it indicates that the user has not attempted to select a file, thus it cannot be read
-  if (file_path == "none"):
+  # (unless logs from an earlier run are already in the database)
+  if (file_path == "none") and (file_status != 1):
     # send a warning message to the user via the text box
     t.insert(tk.END, "\nPlease select a file before attempting to count.")
     # end the function
@@ -227,7 +353,7 @@ def count_button_click(cursor):
   else:
     # create a new window for the count functionality
     count_window = tk.Toplevel(window)
-    count_window.geometry("300x150")
+    count_window.geometry("300x200")
     # create a label for the count window
     label = tk.Label(count_window, text="Select an option from the dropdown")
     label.pack()
@@ -236,6 +362,17 @@ def count_button_click(cursor):
     # create the combo (dropdown) object
     combo = ttk.Combobox(count_window, values=options, state="readonly")
     combo.pack()
+    # create a frame for the optional top-N and filter inputs
+    input_frame = tk.Frame(count_window)
+    input_frame.pack(fill=tk.X, padx=10)
+    # create a label and text box for how many of the top values to show (blank shows all)
+    tk.Label(input_frame, text="Top:").pack(side=tk.LEFT)
+    top_text_box = tk.Entry(input_frame, width=5)
+    top_text_box.pack(side=tk.LEFT, padx=5)
+    # create a label and text box for an optional filter (ex. status >= 500)
+    tk.Label(input_frame, text="Filter:").pack(side=tk.LEFT)
+    filter_text_box = tk.Entry(input_frame)
+    filter_text_box.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
     # create a bottomframe to separate the window
     bottom_frame = tk.Frame(count_window)
     bottom_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -247,20 +384,93 @@ def count_button_click(cursor):
     scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     text_box.config(yscrollcommand=scrollbar.set)
     
+    # keeps track of the count job of this window, and the counts being shown so they can be updated while following a file
+    state = {"job": None, "counts": None, "column": None, "top_n": None, "check": None, "redraw": False}
+    # inner function show_counts draws the current counts in the text box, most common first
+    def show_counts():
+      state["redraw"] = False
+      results = sorted(state["counts"].items(), key=lambda item: item[1], reverse=True)
+      if state["top_n"]:
+        results = results[:state["top_n"]]
+      # timestamps are stored as epoch seconds, so turn them back into readable timestamps
+      if state["column"] == "timestamp":
+        results = ((format_timestamp(key), value) for key, value in results)
+      text_box.delete("1.0",tk.END)
+      # insert the results of the count into the text box 
+      text_box.insert(tk.END, outputDict(results))
     # inner function on_select activates when the combo (dropdown menu) selects an item
-    def on_select(event):
+    def on_select(event=None):
       # clear the text box
       text_box.delete("1.0",tk.END)
+      state["counts"] = None
       # get the selected option from the combo (dropdown menu)
       selected_option = combo.get()
+      # nothing can be counted until an option is selected
+      if not selected_option:
+        return
       # Change the label to the selected option
       label.config(text=f"Selected: {selected_option}")
       # get the proper variable name for the selected option via dropdown_dict
       selected_option = dropdown_dict[selected_option]
-      # insert the results of the count into the text box 
-      text_box.insert(tk.END, outputDict(count(cursor, selected_option)))
+      # get the top-N and filter inputs, if the user entered them
+      top_n = top_text_box.get().strip()
+      condition, params, check = None, (), None
+      # a filter on the timestamp only needs the days it covers to be counted
+      start, end = None, None
+      try:
+        if filter_text_box.get().strip():
+          condition, params = parse_filter(filter_text_box.get())
+          check = filter_rows(filter_text_box.get())
+          start, end = filter_span(filter_text_box.get())
+        top_n = int(top_n) if top_n else None
+      except ValueError as error:
+        text_box.insert(tk.END, f"Invalid input: {error}")
+        return
+      # cancel the previous count of this window if it is still running
+      if state["job"] in jobs:
+        cancel_job(state["job"])
+      text_box.insert(tk.END, "Counting...")
+      # while a file is being followed every value is counted, since any of them could move into the top N
+      limit = None if following() else top_n
+      # inner function run_count counts on a background thread and collects the results
+      def run_count(conn, progress, cancelled):
+        return list(count(conn.cursor(), selected_option, limit, condition, params, start, end))
+      # inner function show_count keeps the results of the count and shows them
+      def show_count(results):
+        state.update(counts=dict(results), column=selected_option, top_n=top_n, check=check)
+        show_counts()
+      # inner function show_error tells the user that the count failed
+      def show_error(error):
+        text_box.delete("1.0",tk.END)
+        text_box.insert(tk.END, f"Count failed: {error}")
+      # run the count in the background so the window stays responsive
+      state["job"] = submit_job("Count", run_count, show_count, on_error=show_error)
+    # inner function on_rows adds the rows loaded by follow mode to the counts being shown
+    def on_rows(rows, host=None):
+      if state["counts"] is None:
+        return
+      index = log_columns.index(state["column"])
+      if state["check"]:
+        rows = [row for row in rows if state["check"](row, host)]
+      for key, value in Counter(row[index] for row in rows).items():
+        state["counts"][key] = state["counts"].get(key, 0) + value
+      # redraw at most once a second, since new rows can arrive many times a second
+      if not state["redraw"]:
+        state["redraw"] = True
+        text_box.after(1000, show_counts)
+    # register the window with follow mode, and unregister it once the window is closed
+    count_listeners[id(count_window)] = on_rows
+    count_refreshers[id(count_window)] = on_select
+    def on_destroy(event):
+      if event.widget is count_window:
+        count_listeners.pop(id(count_window), None)
+        count_refreshers.pop(id(count_window), None)
+    count_window.bind("<Destroy>", on_destroy)
     # bind the combo (dropdown menu) to the on_select function
     combo.bind("<<ComboboxSelected>>", on_select)
+    # pressing enter in either input box re-runs the count
+    top_text_box.bind("<Return>", on_select)
+    filter_text_box.bind("<Return>", on_select)
 
 # debug function - prints a dictionary in a formatted manner given a dictionary as a parameter
 def printDict(dict):
@@ -269,84 +479,53 @@ def printDict(dict):
     # print the key and respective value
     print(f"{key}:\t\t\t{value}")
 
-# returns a string with a formatted dictionary
+# returns a string with a formatted dictionary (or any iterable of key and value pairs, such as the results of count)
 def outputDict(dict):
-  # create an empty string for output return
-  out = ""
-  # for every key and value in dictionary's items
-  for key, value in dict.items():
-    # store the key and respective value in out
-    out += f"{key}:\t\t\t{value}\n"
-  # return the out
-  return out
-
-# searchFile performs a search in the database based on a given term and category and the cursor for the SQL database
-def searchFile(cursor, term, cat):
-  # create an empty string 
-  out = ""
-  # open a new file 'output.txt' in write mode
-  file = open("output.txt", "w")
-  # create an SQL command with an empty place for the category and term
-  query = f'SELECT * FROM logs WHERE {cat} LIKE ?'
-  # execute the command with the fields filled in
-  cursor.execute(query, (f'%{term}%',))
-  # retrieve the results from the command into rows
-  rows = cursor.fetchall()
-  # create a counter variable set to 0
-  x = 0
-  # loop through the length of the output
-  while x < len(rows):
-    # for the length of the subarray
-    for i in range(1, len(rows[x])):
-      # write the output to the file
-      file.writelines(dict_legend[i] + str(rows[x][i]) + "\n")
-      # append the output to the out variable
-      out += dict_legend[i] + str(rows[x][i]) + "\n"
-    # write two newlines to the file for formatting
-    file.writelines('\n\n')
-    # append two newlines to the out variable for formatting
-    out += '\n\n'
-    # increment the counter variable by 1
-    x += 1
-  # return the output variable
-  return out
-
-# searchFileRange performs a search in the database based on a range of terms (defined by term1 and term2) and category and the cursor for the SQL database
-def searchFileRange(cursor, term, term2, cat):
-  # create an empty output variable
-  out = ""
-  # open a new output file in write format
-  file = open("output.txt", "w")
-  # create a SQL command to retrieve items based on a range in a category
-  query = f'SELECT * FROM logs WHERE {cat} BETWEEN {term} AND {term2};'
-  # execute the command
-  cursor.execute(query)
-  # retrieve the results of the command
-  rows = cursor.fetchall()
-  # create a new counter variable
-  x = 0
-  # loop throught the length of the output
-  while x < len(rows):
-    # for the length of the subarray
-    for i in range(1, len(rows[x])):
-      # write the output to the file
-      file.writelines(dict_legend[i] + str(rows[x][i]) + "\n")
-      # append the output to the out variable
-      out += dict_legend[i] + str(rows[x][i]) + "\n"
-    # write two newlines to the file for formatting
-    file.writelines('\n\n')
-    # append two newlines to the out variable for formatting
-    out += '\n\n'
-    # increment the counter variable by 1
-    x += 1
-  # return the output variable
-  return out
+  # accept a dictionary as well as plain pairs
+  items = dict.items() if hasattr(dict, "items") else dict
+  # join a line for every key and respective value
+  return "".join(f"{key}:\t\t\t{value}\n" for key, value in items)
+
+# show_pages takes in a text box, its scrollbar and a function that reads a page of results and shows the results in the text box
+# read_page is run on a read worker (see submit_job) with the worker's database connection and the id of the last row shown
+# (None for the first page), and returns the next page of rows (an empty list once there are no more)
+# only the first page is read straight away, the rest are read as the user scrolls near the bottom of the text box
+def show_pages(text_box, scrollbar, read_page):
+  # keeps track of whether every page has been shown, whether a page is being read and the last row shown
+  state = {"done": False, "loading": False, "after": None}
+  # inner function show_page inserts a page of results into the text box once it has been read
+  def show_page(rows):
+    state["loading"] = False
+    if not rows:
+      state["done"] = True
+      return
+    state["after"] = rows[-1][0]
+    text_box.insert(tk.END, format_rows(rows))
+  # inner function show_error stops reading pages and tells the user why
+  def show_error(error):
+    state["done"] = True
+    text_box.insert(tk.END, f"\nReading more results failed: {error}")
+  # inner function load_page reads the next page of results in the background
+  def load_page():
+    state["loading"] = True
+    after = state["after"]
+    submit_job("Search Page", lambda conn, progress, cancelled: read_page(conn, after), show_page, on_error=show_error)
+  # inner function on_scroll updates the scrollbar and loads another page once the user is near the bottom
+  def on_scroll(first, last):
+    scrollbar.set(first, last)
+    if float(last) > 0.9 and not state["done"] and not state["loading"]:
+      load_page()
+  # set the text box to call on_scroll whenever it is scrolled
+  text_box.config(yscrollcommand=on_scroll)
+  # show the first page
+  load_page()
+
 # search_button_click takes in one parameter cursor and enables the functionality of the search feature
 def search_button_click(cursor):
     # using the global file_path variable
     global file_path
-    # if the file_path is not defined
-    if file_path == "none":
+    # if the file_path is not defined (and there are no logs from an earlier run in the database)
+    if file_path == "none" and file_status != 1:
         # write an error statement to the text box
         t.insert(tk.END, "\nPlease select a file before attempting to search.")
         # end the function
@@ -385,7 +564,14 @@ def search_button_click(cursor):
         user_input_text_box = tk.Entry(input_frame)
         user_input_text_box.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         # Create Submit button 
-        submit_button = tk.Button(master=count_window, text="Submit", width=10, bg='white', fg='black', activebackground='#AFAFAF', command=lambda: process_input(cursor, combo, user_input_text_box, text_box))
+        # create a frame and text box for the optional host to search
+        host_frame = tk.Frame(count_window)
+        host_frame.pack(fill=tk.X, padx=10, pady=5)
+        host_label = tk.Label(host_frame, text="Host (optional):")
+        host_label.pack(side=tk.LEFT, padx=5)
+        host_text_box = tk.Entry(host_frame)
+        host_text_box.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        submit_button = tk.Button(master=count_window, text="Submit", width=10, bg='white', fg='black', activebackground='#AFAFAF', command=lambda: process_input(cursor, combo, user_input_text_box, text_box, scrollbar, host_text_box))
         submit_button.pack(pady=10)
         # inner function for the combo (dropdown box)
         def on_select(event):
@@ -395,6 +581,9 @@ def search_button_click(cursor):
             if selected_option == "Packet Size" or selected_option == "Response Time":
                 # set the input label to add instructions asking for a range
                 user_input_label.config(text="Enter your search range (X-Y):")
+            # timestamps can be searched on their own or as a range
+            elif selected_option == "Timestamp":
+                user_input_label.config(text="Enter a time or range (X to Y):")
             # if it is anything else
             else:
                 # set the input label to be what it normally is
@@ -415,9 +604,9 @@ def search_button_click(cursor):
         # set the text_box to have a scrollbar
         text_box.config(yscrollcommand=scrollbar.set)
 
-# process_input takes in the cursor, combo (dropdown box), user input box, and output text box and allows for the usage of the
-# search feature within the search window
-def process_input(cursor, combo, user_input_text_box, text_box):
+# process_input takes in the cursor, combo (dropdown box), user input box, output text box with its scrollbar and the host
+# text box and allows for the usage of the search feature within the search window
+def process_input(cursor, combo, user_input_text_box, text_box, scrollbar, host_text_box=None):
   # clear the output text box
   text_box.delete("1.0",tk.END)
   # get the selected option from the dropdown menu
@@ -426,58 +615,80 @@ def process_input(cursor, combo, user_input_text_box, text_box):
   selected_option = dropdown_dict[selected_option]
   # get the user input from the text box
   user_input = user_input_text_box.get()
-  # if the selected option is packet_size or response_time, it requires the usage of the searchFileRange function
+  # only timestamp searches are limited to the days they cover
+  start, end = None, None
+  # if the selected option is packet_size or response_time, it requires the usage of the range search
   if (selected_option == "packet_size") or (selected_option == "response_time"):
     # Split the range by the '-' delimeter
     user_input_arr = user_input.split("-")
     # if the user input is proper (there are two values in the array), continue with the process
     if len(user_input_arr) == 2:
-      # get the output of the searchFileRange function
-      x = searchFileRange(cursor, user_input_arr[0], user_input_arr[1], selected_option)
-      # send the output of the searchFileRange function to the output text box
-      text_box.insert(tk.END, x)
+      condition, params = range_condition(user_input_arr[0], user_input_arr[1], selected_option)
     # if the user input is improper
     else:
-      # send the output of the regular search file function to the text box
-      #   we treat the inserted value as one (which will likely output nothing)
-      text_box.insert(tk.END, searchFile(cursor, user_input_arr[0], selected_option))
+      # we treat the inserted value as one (which will likely output nothing)
+      condition, params = search_condition(user_input_arr[0], selected_option)
+  # a timestamp range is written as 'X to Y' since timestamps can contain '-'
+  elif selected_option == "timestamp" and " to " in user_input:
+    range_start, range_end = user_input.split(" to ", 1)
+    condition, params = range_condition(range_start, range_end, selected_option)
+    start, end = search_span(range_start, selected_option, range_end)
   # if the chosen category is not packet size or response time
   else:
-    # send the output of the regular search file function to the text box
-    text_box.insert(tk.END, searchFile(cursor, user_input, selected_option))
+    condition, params = search_condition(user_input, selected_option)
+    start, end = search_span(user_input, selected_option)
+  # only search the rows of one host if one was entered
+  host = host_text_box.get().strip() if host_text_box else ""
+  if host:
+    extra, extra_params = host_condition(host)
+    condition, params = f"({condition}) AND {extra}", tuple(params) + extra_params
+  text_box.insert(tk.END, "Searching...")
+  # inner function read_page reads the page of results after the row with the id after on a worker's connection
+  # (each page is its own query, so no query is left open while the results are shown)
+  def read_page(conn, after):
+    pages = search_pages(conn.cursor(), condition, params, start=start, end=end, after=after)
+    try:
+      return next(pages, [])
+    finally:
+      pages.close()
+  # inner function show_results shows the first page of results once output.txt has been written
+  def show_results(written):
+    text_box.delete("1.0",tk.END)
+    text_box.insert(tk.END, f"{written} results (also written to output.txt)\n\n")
+    # the remaining pages are read as the user scrolls
+    show_pages(text_box, scrollbar, read_page)
+  # inner function show_error tells the user that the search failed
+  def show_error(error):
+    text_box.delete("1.0",tk.END)
+    text_box.insert(tk.END, f"Search failed: {error}")
+  # write every result to output.txt in the background so the window stays responsive
+  submit_job("Search", lambda conn, progress, cancelled: write_output(conn.cursor(), condition, params, cancelled=cancelled, start=start, end=end), show_results, on_error=show_error)
 
 ### END OF FUNCTIONS SECTION ###
 
-### SET UP SECTION ###
-
-# path variable
-path = os.getcwd()
-print(path)
-# set a directory name
-directory = "sploosh"
-# if in the working directory, there is not already a sploosh folder
-if not os.path.exists(directory):
-    # Create the directory based on the directory name
-    os.makedirs(directory)
-# change the directory to within sploosh directory
-os.chdir("sploosh")
-# create an SQL database 'logs.db' within sploosh and connect a cursor to the database
-conn = sqlite3.connect('logs.db')
-# create a cursor to interact with the database
-cursor = conn.cursor()
-# execute a command that drops the table if the logs database already exists (this is to prevent information overflow)
-cursor.execute('''DROP TABLE IF EXISTS logs;''')
-# create a new logs table with all of the proper sections
-cursor.execute('''CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, ip_addr TEXT, timestamp TEXT, method TEXT, endpoint TEXT, status TEXT, packet_size INT, referrer TEXT, user_agent TEXT, response_time INT)''')
-
-### END OF SET UP SECTION ###
-
 # main function - program driver
 if __name__ == '__main__':
-  # the file_path is set initially to "none"
+  ### SET UP SECTION ###
+  # the set up is done here rather than on import so other modules can import this file without side effects
+  # path variable
+  path = os.getcwd()
+  print(path)
+  # create the sploosh folder if needed and connect to the SQL database 'logs.db' within it
+  # (logs.db is kept between runs, so files that were already read do not need to be read again)
+  conn = connect()
+  # change the directory to within sploosh directory
+  os.chdir("sploosh")
+  # create a cursor to interact with the database
+  cursor = conn.cursor()
+  # keep the full path of the database so background threads can open their own connections to it
+  db_path = os.path.abspath('logs.db')
+  ### END OF SET UP SECTION ###
+
+  # the file_path is set initially to "none", and no files have been chosen
   file_path = "none"
-  # the file_status is set to 0, meaning that nothing is selected
-  file_status = 0
+  file_paths = []
+  # the file_status is set to 0, meaning that nothing is selected, or to 1 if logs.db already holds logs from an earlier run
+  file_status = 1 if cursor.execute("SELECT EXISTS (SELECT 1 FROM logs)").fetchone()[0] else 0
   # create the main window
   window = tk.Tk()
   window.title("Sploosh")
@@ -489,16 +700,28 @@ if __name__ == '__main__':
   # create, configure, and pack the buttons
   button_explore = Button(window, text="Browse Files", command=browse_files)
   button_explore.configure(bg="gray")
+  button_folder = Button(window, text="Browse Folder", command=browse_folder)
+  button_folder.configure(bg="gray")
   button_count = Button(window, text="Count By...", command=lambda: count_button_click(cursor))
   button_count.configure(bg="gray")
   button_read = Button(window, text="Read File", command=lambda: read_file(t,cursor))
   button_read.configure(bg="gray")
   button_search = Button(window, text="Search By...",command=lambda: search_button_click(cursor))
   button_search.configure(bg="gray")
+  button_follow = Button(window, text="Follow File", command=follow_button_click)
+  button_follow.configure(bg="gray")
+  button_cancel = Button(window, text="Cancel", command=cancel_all_jobs)
+  button_cancel.configure(bg="gray")
+  button_stats = Button(window, text="Show Stats", command=show_stats)
+  button_stats.configure(bg="gray")
   button_explore.pack()
+  button_folder.pack()
   button_read.pack()
   button_count.pack()
   button_search.pack()
+  button_follow.pack()
+  button_cancel.pack()
+  button_stats.pack()
   # create a new label
   l = Label(window, text = "none")
   # pack the text box
@@ -506,6 +729,11 @@ if __name__ == '__main__':
   # create and pack the label
   l = Label(window, textvariable=v)
   l.pack()
+  # create and pack the progress bar used by background jobs
+  progress_bar = ttk.Progressbar(window, mode="indeterminate", length=300)
+  progress_bar.pack(pady=5)
+  # start checking for progress and results from background jobs
+  window.after(poll_interval, poll_jobs)
   # start the mainloop
   window.mainloop()
 ### END OF PROGRAM ###
\ No newline at end of file
@@ -0,0 +1,276 @@
+# Project Name: Sploosh
+#
+# sploosh_analytics.py
+# Numeric analytics for Sploosh: response time percentiles per endpoint (or per
+# status), totals per time bucket (ex. bytes served per minute) and histograms.
+#
+# Instead of reading rows out of SQLite for every report, the timestamp, status,
+# packet_size, response_time and endpoint columns are copied once into compact
+# column files in the sploosh/columns folder (one flat binary file per column)
+# and only the rows added since the last report are appended to them afterwards.
+# The column files are memory-mapped as NumPy arrays, so a report over every row
+# is a handful of vectorized operations instead of a Python loop.
+#
+# NumPy is only needed for this module (pip install numpy), the rest of Sploosh
+# works without it.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import json
+import sploosh_engine as engine
+
+# NumPy, which is only imported by require_numpy once analytics are actually run, so that importing this module
+# (ex. sploosh_cli.py building its help) does not slow down everything else
+np = None
+
+# name of the folder (next to logs.db) that holds the column files
+column_directory_name = "columns"
+
+# columns of the logs table copied into column files and the NumPy type each one is stored as
+# the endpoint is stored as its id in the endpoints table, and a missing status or response time (some log formats
+# do not record them) is stored as missing_value
+column_types = {
+  "timestamp": "int64",
+  "status": "int16",
+  "packet_size": "int64",
+  "response_time": "int32",
+  "endpoint": "int32"
+}
+
+# columns that can be grouped by when calculating percentiles
+group_columns = ("endpoint", "status")
+
+# columns that can be measured (percentiles, bucket totals and histograms)
+value_columns = ("response_time", "packet_size")
+
+# value stored in a column file for a status or response time that the log line did not have
+missing_value = -1
+
+# number of rows read from the logs table at a time while copying them into the column files
+export_batch_size = 200000
+
+# percentiles reported when none are asked for
+default_percentiles = (50, 95, 99)
+
+# require_numpy imports NumPy the first time it is called, raising an ImportError explaining how to install it if it is not available
+def require_numpy():
+  global np
+  if np is None:
+    try:
+      import numpy
+    except ImportError:
+      raise ImportError("analytics need NumPy, install it with: pip install numpy") from None
+    np = numpy
+
+# column_directory takes in a database connection and returns the folder that holds its column files
+def column_directory(conn):
+  # the third field of database_list is the file of the main database
+  db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+  return os.path.join(os.path.dirname(db_file) or os.getcwd(), column_directory_name)
+
+# new_column_meta takes in a database connection and returns the description of empty column files
+def new_column_meta(conn):
+  return {"schema": engine.schema_version, "rows": 0, "last_id": 0, "last_row": None, "dropped": engine.partitions_dropped(conn)}
+
+# read_column_meta takes in a database connection and a column folder and returns what was recorded about its column files
+# (or a description of empty column files if there are none yet)
+def read_column_meta(conn, directory):
+  try:
+    with open(os.path.join(directory, "columns.json")) as file:
+      meta = json.load(file)
+  except (OSError, ValueError):
+    meta = {}
+  # column files written by a different database layout cannot be appended to
+  if meta.get("schema") != engine.schema_version:
+    meta = new_column_meta(conn)
+  return meta
+
+# write_column_meta takes in a column folder and its description and saves the description
+# the description is written to a temporary file first so a crash cannot leave half of it behind
+def write_column_meta(directory, meta):
+  path = os.path.join(directory, "columns.json")
+  with open(path + ".tmp", "w") as file:
+    json.dump(meta, file)
+  os.replace(path + ".tmp", path)
+
+# columns_valid takes in a database connection and a column folder description and returns whether the column files
+# still match the logs (rows can be removed by a cancelled load, old partitions being dropped or a rebuilt database)
+def columns_valid(conn, meta):
+  if meta.get("dropped") != engine.partitions_dropped(conn):
+    return False
+  if meta["rows"] == 0:
+    return True
+  # the last row copied must still be the same row
+  row = conn.execute(f"SELECT timestamp, COALESCE(response_time, {missing_value}) FROM logs WHERE id = ?", (meta["last_id"],)).fetchone()
+  return row is not None and list(row) == meta["last_row"]
+
+# export_columns takes in a database connection and appends every row added to the logs table since the last
+# export to the column files, starting them over if they no longer match the logs table
+# returns the description of the column files
+def export_columns(conn, directory=None):
+  require_numpy()
+  directory = directory or column_directory(conn)
+  os.makedirs(directory, exist_ok=True)
+  meta = read_column_meta(conn, directory)
+  if not columns_valid(conn, meta):
+    meta = new_column_meta(conn)
+  # an export that was interrupted can leave rows at the end of the files that columns.json does not count, so every
+  # file is cut back to the rows it counts (and they are all started over if one of them is missing some)
+  paths = {name: os.path.join(directory, f"{name}.bin") for name in column_types}
+  file_sizes = {name: meta["rows"] * np.dtype(dtype).itemsize for name, dtype in column_types.items()}
+  if meta["rows"] and not all(os.path.exists(paths[name]) and os.path.getsize(paths[name]) >= file_sizes[name] for name in column_types):
+    meta = new_column_meta(conn)
+  # start the column files over if needed, otherwise only add to them
+  mode = "ab" if meta["rows"] else "wb"
+  files = {name: open(path, mode) for name, path in paths.items()}
+  if meta["rows"]:
+    for name, file in files.items():
+      file.truncate(file_sizes[name])
+  cursor = conn.cursor()
+  # every partition is read in turn, so the rows are only in order within each partition
+  # (the reports do not depend on the order of the rows)
+  last_id = meta["last_id"]
+  try:
+    for table in engine.partition_tables(conn):
+      cursor.execute(f"SELECT id, timestamp, COALESCE(status, {missing_value}), packet_size, COALESCE(response_time, {missing_value}), endpoint_id "
+                     f"FROM {table} WHERE id > ? ORDER BY id", (last_id,))
+      while True:
+        rows = cursor.fetchmany(export_batch_size)
+        if not rows:
+          break
+        ids, timestamps, statuses, sizes, times, endpoints = zip(*rows)
+        columns = {
+          "timestamp": timestamps,
+          "status": statuses,
+          "packet_size": sizes,
+          "response_time": times,
+          "endpoint": endpoints
+        }
+        # append each column as raw values of its type
+        for name, values in columns.items():
+          files[name].write(np.asarray(values, dtype=column_types[name]).tobytes())
+        meta["rows"] += len(rows)
+        # remember the newest row copied, which is checked by columns_valid next time
+        if ids[-1] > meta["last_id"]:
+          meta["last_id"] = ids[-1]
+          meta["last_row"] = [timestamps[-1], times[-1]]
+  finally:
+    cursor.close()
+    for file in files.values():
+      file.close()
+  write_column_meta(directory, meta)
+  return meta
+
+# load_columns takes in a database connection, brings the column files up to date and returns a dictionary of
+# each column as a read-only memory-mapped NumPy array, along with a dictionary of each endpoint id and its
+# endpoint under "endpoints"
+def load_columns(conn, directory=None):
+  directory = directory or column_directory(conn)
+  meta = export_columns(conn, directory)
+  columns = {"endpoints": dict(conn.execute("SELECT id, value FROM endpoints"))}
+  for name, dtype in column_types.items():
+    # an empty file cannot be memory-mapped
+    if meta["rows"] == 0:
+      columns[name] = np.zeros(0, dtype=dtype)
+    else:
+      columns[name] = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode="r", shape=(meta["rows"],))
+  return columns
+
+# filter_mask takes in the columns from load_columns and a filter string (see sploosh_engine.parse_filter)
+# and returns a boolean array of the rows that pass the filter, or None if there is no filter
+# only the columns that are stored as numbers (and the endpoint) can be filtered on
+def filter_mask(columns, text):
+  if not text:
+    return None
+  column, op, value = engine.split_filter(text)
+  if column not in column_types:
+    raise ValueError(f"cannot filter on {column} in analytics, use one of: {', '.join(column_types)}")
+  # endpoints are compared by their id, so only = and != make sense
+  if column == "endpoint":
+    if op not in ("=", "!="):
+      raise ValueError("endpoints can only be filtered with = or !=")
+    endpoint_id = next((endpoint_id for endpoint_id, endpoint in columns["endpoints"].items() if endpoint == value), -1)
+    return engine.filter_functions[op](columns["endpoint"], endpoint_id)
+  return engine.filter_functions[op](columns[column], value)
+
+# known_mask takes in the columns from load_columns, a value column and a boolean array of rows (or None) and returns
+# the boolean array of those rows that have the value, leaving out rows where it is missing_value
+def known_mask(columns, value, mask):
+  known = columns[value] != missing_value
+  return known if mask is None else mask & known
+
+# group_label takes in the columns from load_columns, a group column and a group value and returns the value
+# as it is stored in the logs table (endpoints are turned back from their ids into text)
+def group_label(columns, group, value):
+  if group == "endpoint":
+    return columns["endpoints"][value]
+  return value
+
+# percentiles takes in the columns from load_columns and returns the given percentiles of a value column for every
+# value of a group column (ex. response time per endpoint), as a list of (group, requests, [percentile values])
+# ordered by the number of requests, most first
+# every group is calculated at once: the rows are sorted by group and then by value, which puts each group's values
+# next to each other in order, so each percentile is a single lookup
+def percentiles(columns, group="endpoint", value="response_time", points=default_percentiles, mask=None):
+  require_numpy()
+  if group not in group_columns or value not in value_columns:
+    raise ValueError(f"percentiles are grouped by one of {', '.join(group_columns)} over one of {', '.join(value_columns)}")
+  mask = known_mask(columns, value, mask)
+  keys = columns[group][mask]
+  values = columns[value][mask]
+  if len(values) == 0:
+    return []
+  order = np.lexsort((values, keys))
+  sorted_keys = keys[order]
+  sorted_values = values[order]
+  # find where each group starts and how many rows it has
+  starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+  sizes = np.diff(np.r_[starts, len(order)])
+  # linear interpolation between the closest ranks (the same as numpy.percentile's default)
+  results = []
+  for point in points:
+    rank = (sizes - 1) * (point / 100.0)
+    low = np.floor(rank).astype(np.int64)
+    high = np.minimum(low + 1, sizes - 1)
+    fraction = rank - low
+    results.append(sorted_values[starts + low] * (1 - fraction) + sorted_values[starts + high] * fraction)
+  order = np.lexsort((sorted_keys[starts], -sizes))
+  return [(group_label(columns, group, int(sorted_keys[starts[i]])), int(sizes[i]), [float(result[i]) for result in results]) for i in order]
+
+# time_buckets takes in the columns from load_columns and a bucket size in seconds and returns a list of
+# (bucket start, requests, total, maximum) for every bucket from the first to the last request, where total and maximum
+# are of the value column (ex. bytes served per minute with the default packet_size and a size of 60)
+def time_buckets(columns, size=60, value="packet_size", mask=None):
+  require_numpy()
+  if value not in value_columns:
+    raise ValueError(f"buckets total one of {', '.join(value_columns)}")
+  mask = known_mask(columns, value, mask)
+  timestamps = columns["timestamp"][mask]
+  values = columns[value][mask]
+  if len(timestamps) == 0:
+    return []
+  # buckets line up with the epoch so that minutes and hours start on the minute and hour
+  first = int(timestamps.min()) // size * size
+  buckets = (timestamps - first) // size
+  requests = np.bincount(buckets)
+  totals = np.bincount(buckets, weights=values)
+  maximums = np.zeros(len(requests), dtype=np.int64)
+  np.maximum.at(maximums, buckets, values)
+  return [(first + i * size, int(requests[i]), int(totals[i]), int(maximums[i])) for i in range(len(requests))]
+
+# histogram takes in the columns from load_columns and returns a list of (bin start, bin end, requests) for the
+# value column split into the given number of equal bins (between low and high if given, otherwise over every value)
+def histogram(columns, value="response_time", bins=20, low=None, high=None, mask=None):
+  require_numpy()
+  if value not in value_columns:
+    raise ValueError(f"histograms are of one of {', '.join(value_columns)}")
+  values = columns[value][known_mask(columns, value, mask)]
+  if len(values) == 0:
+    return []
+  low = values.min() if low is None else low
+  high = values.max() if high is None else high
+  counts, edges = np.histogram(values, bins=bins, range=(low, high))
+  return [(float(edges[i]), float(edges[i + 1]), int(counts[i])) for i in range(len(counts))]
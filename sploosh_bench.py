@@ -0,0 +1,347 @@
+# Project Name: Sploosh
+#
+# sploosh_bench.py
+# Benchmarks for Sploosh. Writes a synthetic access log in the Combined Log Format
+# (the same lines for the same settings every time), loads it into a fresh
+# database and times the load, a count of every column, a search of every column
+# and a range search of every numeric column, along with how fast lines are
+# parsed. The results are written as JSON so runs can be saved and compared:
+#
+#   python sploosh_bench.py generate access.log --lines 1000000
+#   python sploosh_bench.py run --lines 1000000 --output before.json
+#   python sploosh_bench.py run --lines 1000000 --baseline before.json
+#
+# With --baseline, every timing that is more than --tolerance slower than in the
+# saved results is reported and the exit status is 1, so a run can be used to
+# catch regressions before deploying.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import platform
+import argparse
+import tempfile
+import sploosh_engine as engine
+import sploosh_parsers as parsers
+import sploosh_metrics as metrics
+# resource is only available on Unix, peak memory is not reported without it
+try:
+  import resource
+except ImportError:
+  resource = None
+
+# version of the layout of the results, saved with them so that results from a different layout are not compared
+results_version = 1
+
+# default settings of the synthetic log
+default_lines = 1000000
+default_ips = 5000
+default_endpoints = 500
+default_user_agents = 50
+default_seed = 1
+
+# time of the first line of the synthetic log (10/Oct/2024:00:00:00 UTC) and the number of lines written per second
+start_time = 1728518400
+lines_per_second = 100
+
+# number of lines generated and written at a time
+generate_chunk_size = 100000
+
+# number of lines of the synthetic log used to measure parsing speed
+parse_sample_lines = 200000
+
+# how much slower (as a fraction) a timing can be than the baseline before it is reported as a regression
+default_tolerance = 0.10
+
+# timings that are slower than the baseline by less than this many seconds are not reported, since very short timings vary
+# by more than the tolerance from run to run
+regression_noise = 0.05
+
+# pieces that the synthetic endpoints, user agents and referrers are built from
+endpoint_parts = ("api/v1/users", "api/v1/orders", "api/v2/search", "static/js", "static/css", "images", "blog", "account")
+agent_templates = (
+  "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36",
+  "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{v}.0 Safari/605.1.15",
+  "Mozilla/5.0 (X11; Linux x86_64; rv:{v}.0) Gecko/20100101 Firefox/{v}.0",
+  "curl/8.{v}.0",
+  "Googlebot/2.{v} (+http://www.google.com/bot.html)"
+)
+referrers = ("-", "https://www.google.com/", "https://example.com/", "https://example.com/blog", "https://news.ycombinator.com/")
+
+# methods and statuses of the synthetic log with how often each one appears
+method_weights = {"GET": 85, "POST": 10, "PUT": 3, "DELETE": 2}
+status_weights = {200: 80, 304: 6, 301: 3, 404: 7, 500: 3, 503: 1}
+
+# search terms used for each column, chosen so every search matches some of the synthetic lines
+search_terms = {
+  "ip_addr": "10.0.1.",
+  "timestamp": "10/Oct/2024:00:30",
+  "method": "DELETE",
+  "endpoint": "orders",
+  "status": "404",
+  "packet_size": "1024",
+  "referrer": "google",
+  "user_agent": "bot",
+  "response_time": "100"
+}
+
+# ranges searched for each column that can be searched by range
+range_terms = {
+  "timestamp": ("10/Oct/2024:00:10", "00:19"),
+  "packet_size": ("1000", "2000"),
+  "response_time": ("100", "200")
+}
+
+# synthetic_values takes in the number of distinct IP addresses, endpoints and user agents and returns the list of each,
+# generated the same way every time
+def synthetic_values(ips, endpoints, user_agents):
+  ip_list = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(ips)]
+  endpoint_list = [f"/{endpoint_parts[i % len(endpoint_parts)]}/{i // len(endpoint_parts)}" for i in range(endpoints)]
+  agent_list = [agent_templates[i % len(agent_templates)].format(v=60 + i // len(agent_templates)) for i in range(user_agents)]
+  return ip_list, endpoint_list, agent_list
+
+# skewed_weights takes in a number of values and returns cumulative weights that make the first values the most common
+# (the nth value appears about 1/n as often as the first, like real traffic)
+def skewed_weights(n):
+  total = 0.0
+  weights = []
+  for i in range(n):
+    total += 1.0 / (i + 1)
+    weights.append(total)
+  return weights
+
+# generate_lines takes in the number of lines and the number of distinct IP addresses, endpoints and user agents and
+# yields the lines of a synthetic access log (each ending in a newline) in chunks of generate_chunk_size
+# the same settings and seed always give the same lines
+def generate_lines(lines, ips=default_ips, endpoints=default_endpoints, user_agents=default_user_agents, seed=default_seed):
+  rng = random.Random(seed)
+  ip_list, endpoint_list, agent_list = synthetic_values(ips, endpoints, user_agents)
+  ip_weights = skewed_weights(len(ip_list))
+  endpoint_weights = skewed_weights(len(endpoint_list))
+  agent_weights = skewed_weights(len(agent_list))
+  methods = list(method_weights)
+  statuses = list(status_weights)
+  # timestamps only change once every lines_per_second lines, so each one is only formatted once
+  timestamps = {}
+  for first in range(0, lines, generate_chunk_size):
+    n = min(generate_chunk_size, lines - first)
+    columns = zip(
+      range(first, first + n),
+      rng.choices(ip_list, cum_weights=ip_weights, k=n),
+      rng.choices(methods, weights=method_weights.values(), k=n),
+      rng.choices(endpoint_list, cum_weights=endpoint_weights, k=n),
+      rng.choices(statuses, weights=status_weights.values(), k=n),
+      rng.choices(referrers, k=n),
+      rng.choices(agent_list, cum_weights=agent_weights, k=n)
+    )
+    chunk = []
+    for i, ip, method, endpoint, status, referrer, agent in columns:
+      second = start_time + i // lines_per_second
+      if second not in timestamps:
+        timestamps = {second: engine.format_timestamp(second)}
+      # sizes are spread between 200 bytes and about 20kB and response times between 1 and about 1000 milliseconds
+      size = 200 + int(rng.random() ** 2 * 20000)
+      response_time = 1 + int(rng.random() ** 3 * 1000)
+      chunk.append(f'{ip} - - [{timestamps[second]}] "{method} {endpoint} HTTP/1.1" {status} {size} "{referrer}" "{agent}" {response_time}\n')
+    yield "".join(chunk)
+
+# generate_log takes in a file path and the settings of generate_lines and writes a synthetic access log to the file
+# returns the number of seconds it took
+def generate_log(path, lines, ips=default_ips, endpoints=default_endpoints, user_agents=default_user_agents, seed=default_seed):
+  start = time.perf_counter()
+  with open(path, "w", encoding="utf-8", newline="\n") as file:
+    for chunk in generate_lines(lines, ips, endpoints, user_agents, seed):
+      file.write(chunk)
+  return time.perf_counter() - start
+
+# peak_memory returns the most memory (resident set size) in megabytes used by this process and by any one of its
+# worker processes, or None for both if it cannot be measured on this system
+def peak_memory():
+  if resource is None:
+    return None, None
+  # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+  scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+  own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+  workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+  return round(own, 1), round(workers, 1)
+
+# database_size takes in the path of a database and returns its size in bytes, including its write-ahead log
+def database_size(db_path):
+  return sum(os.path.getsize(db_path + suffix) for suffix in ("", "-wal") if os.path.exists(db_path + suffix))
+
+# timed takes in a function and returns the number of seconds calling it took along with what it returned
+def timed(function):
+  start = time.perf_counter()
+  result = function()
+  return time.perf_counter() - start, result
+
+# run_benchmark takes in the path of a log file (in the Combined Log Format) and a folder to work in, loads the file
+# into a new database in the folder and returns a dictionary of the results of every benchmark
+def run_benchmark(log_path, directory, workers=None):
+  db_path = os.path.join(directory, "logs.db")
+  output_path = os.path.join(directory, "output.txt")
+  conn = engine.connect(db_path)
+  cursor = conn.cursor()
+  results = {}
+  try:
+    # load the file the same way "Read File" does
+    metrics.reset()
+    seconds, stats = timed(lambda: engine.ingest(conn, log_path, workers=workers))
+    results["ingest"] = {"seconds": seconds, "rows": stats["rows"], "rejected": stats["rejected"], "rows_per_sec": stats["rows"] / seconds if seconds else 0.0}
+    # count every column, reading every value and count
+    results["count"] = {}
+    for column in engine.log_columns:
+      seconds, counts = timed(lambda: list(engine.count(cursor, column)))
+      results["count"][column] = {"seconds": seconds, "values": len(counts)}
+    # count every column again, which should be answered by the query cache
+    for column in engine.log_columns:
+      results["count"][column]["cached_seconds"] = timed(lambda: list(engine.count(cursor, column)))[0]
+    # search every column, writing the results to a file the same way "Search By..." does
+    results["search"] = {}
+    for column, term in search_terms.items():
+      condition, params = engine.search_condition(term, column)
+      seconds, rows = timed(lambda: engine.write_output(cursor, condition, params, output_path))
+      results["search"][column] = {"term": term, "seconds": seconds, "rows": rows}
+    results["range_search"] = {}
+    for column, (term, term2) in range_terms.items():
+      condition, params = engine.range_condition(term, term2, column)
+      seconds, rows = timed(lambda: engine.write_output(cursor, condition, params, output_path))
+      results["range_search"][column] = {"terms": [term, term2], "seconds": seconds, "rows": rows}
+    results["db_bytes"] = database_size(db_path)
+    results["query_cache"] = engine.cache_stats(conn)
+    # how the time was split between the stages of loading and querying
+    results["metrics"] = metrics.summary()
+  finally:
+    cursor.close()
+    conn.close()
+  # measure parsing speed on the start of the file
+  with open(log_path, encoding="utf-8", errors="replace") as file:
+    sample = [line.rstrip("\n") for _, line in zip(range(parse_sample_lines), file)]
+  results["parse_lines_per_sec"] = parsers.benchmark(sample)
+  results["peak_rss_mb"], results["peak_worker_rss_mb"] = peak_memory()
+  return results
+
+# find_regressions takes in the results of a run and the results of an earlier run and returns a list of
+# (name, seconds, baseline seconds) for every timing that is more than tolerance slower than in the earlier run
+def find_regressions(results, baseline, tolerance=default_tolerance):
+  regressions = []
+  for section in ("ingest", "count", "search", "range_search"):
+    # the ingest section is a single timing, the others have one timing for each column
+    timings = {section: results.get(section, {})} if section == "ingest" else results.get(section, {})
+    earlier = {section: baseline.get(section, {})} if section == "ingest" else baseline.get(section, {})
+    for name, timing in timings.items():
+      old = earlier.get(name, {}).get("seconds")
+      if old and timing["seconds"] > old * (1 + tolerance) and timing["seconds"] - old > regression_noise:
+        regressions.append((name if name == section else f"{section}.{name}", timing["seconds"], old))
+  return regressions
+
+# generate_command writes a synthetic access log to the given path
+def generate_command(args):
+  seconds = generate_log(args.path, args.lines, args.ips, args.endpoints, args.user_agents, args.seed)
+  print(f"{args.path}: {args.lines} lines written in {seconds:.2f}s", file=sys.stderr)
+  return 0
+
+# run_command runs every benchmark on a synthetic access log (or a given one) and writes the results as JSON
+def run_command(args):
+  # read the baseline first so a missing or wrong file is reported before the benchmarks are run
+  baseline = None
+  if args.baseline:
+    try:
+      with open(args.baseline) as file:
+        baseline = json.load(file)
+    except (OSError, ValueError) as error:
+      raise ValueError(f"cannot read {args.baseline}: {error}") from error
+    if baseline.get("version") != results_version:
+      raise ValueError(f"{args.baseline} was written by a different version of the benchmarks")
+  directory = args.keep or tempfile.mkdtemp(prefix="sploosh_bench_")
+  os.makedirs(directory, exist_ok=True)
+  try:
+    settings = {"lines": args.lines, "ips": args.ips, "endpoints": args.endpoints, "user_agents": args.user_agents, "seed": args.seed}
+    log_path = args.log
+    generate_seconds = None
+    # a database left from an earlier run in the same folder would make the load a no-op
+    if os.path.exists(os.path.join(directory, "logs.db")):
+      raise ValueError(f"{directory} already has a logs.db from an earlier run")
+    if log_path is None:
+      log_path = os.path.join(directory, "access.log")
+      generate_seconds = generate_log(log_path, args.lines, args.ips, args.endpoints, args.user_agents, args.seed)
+      print(f"generated {args.lines} lines in {generate_seconds:.2f}s", file=sys.stderr)
+    results = {
+      "version": results_version,
+      "time": int(time.time()),
+      "python": platform.python_version(),
+      "sqlite": sqlite3.sqlite_version,
+      "cpus": os.cpu_count(),
+      "workers": args.workers or engine.worker_count,
+      "log": args.log,
+      "settings": None if args.log else settings,
+      "log_bytes": os.path.getsize(log_path),
+      "generate_seconds": generate_seconds
+    }
+    results.update(run_benchmark(log_path, directory, args.workers))
+  finally:
+    if not args.keep:
+      shutil.rmtree(directory, ignore_errors=True)
+  text = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, "w") as file:
+      file.write(text + "\n")
+  print(text)
+  # compare against an earlier run
+  if baseline:
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for name, seconds, old in regressions:
+      print(f"regression: {name} took {seconds:.3f}s, was {old:.3f}s ({seconds / old - 1:+.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+  return 0
+
+# add_log_settings takes in a subcommand's argument parser and adds the options of the synthetic log to it
+def add_log_settings(parser):
+  parser.add_argument("--lines", type=int, default=default_lines, help=f"number of lines (default: {default_lines})")
+  parser.add_argument("--ips", type=int, default=default_ips, help=f"number of distinct IP addresses (default: {default_ips})")
+  parser.add_argument("--endpoints", type=int, default=default_endpoints, help=f"number of distinct endpoints (default: {default_endpoints})")
+  parser.add_argument("--user-agents", type=int, default=default_user_agents, help=f"number of distinct user agents (default: {default_user_agents})")
+  parser.add_argument("--seed", type=int, default=default_seed, help=f"seed of the random lines (default: {default_seed})")
+
+# build_parser returns the argument parser for both subcommands
+def build_parser():
+  parser = argparse.ArgumentParser(prog="sploosh_bench.py", description="Benchmark loading, counting and searching access logs.")
+  commands = parser.add_subparsers(dest="command", required=True)
+  generate = commands.add_parser("generate", help="write a synthetic access log")
+  generate.add_argument("path", help="file to write")
+  add_log_settings(generate)
+  generate.set_defaults(run=generate_command)
+  run = commands.add_parser("run", help="run every benchmark and write the results as JSON")
+  add_log_settings(run)
+  run.add_argument("--log", help="benchmark this log file instead of a synthetic one")
+  run.add_argument("--workers", type=int, help="number of parsing processes (default: one per CPU)")
+  run.add_argument("--output", help="also save the results to this file")
+  run.add_argument("--baseline", help="results of an earlier run to compare against")
+  run.add_argument("--tolerance", type=float, default=default_tolerance, help=f"how much slower a timing can be than the baseline (default: {default_tolerance})")
+  run.add_argument("--keep", help="work in this folder and keep the log and database afterwards (default: a temporary folder)")
+  run.set_defaults(run=run_command)
+  return parser
+
+# main takes in the command line arguments (sys.argv by default) and runs the chosen subcommand
+# returns the exit status
+def main(argv=None):
+  parser = build_parser()
+  args = parser.parse_args(argv)
+  for name in ("lines", "ips", "endpoints", "user_agents"):
+    if getattr(args, name) < 1:
+      parser.error(f"--{name.replace('_', '-')} must be at least 1")
+  try:
+    return args.run(args)
+  except ValueError as error:
+    parser.error(str(error))
+
+if __name__ == '__main__':
+  sys.exit(main())
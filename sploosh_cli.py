@@ -0,0 +1,319 @@
+# Project Name: Sploosh
+#
+# sploosh_cli.py
+# Command line interface for Sploosh. Loads, counts, searches and follows access
+# log files with sploosh_engine.py without opening the GUI, so it can be run over
+# SSH, from cron jobs and in scripts, for example:
+#
+#   python sploosh_cli.py ingest access.log access.log.1.gz
+#   python sploosh_cli.py ingest --log-format common old_access.log
+#   python sploosh_cli.py ingest --workers 8 /var/log/hosts "/archive/*/access.log*"
+#   python sploosh_cli.py count endpoint --top 10 --filter "status >= 500"
+#   python sploosh_cli.py count status --start 2024-10-10T13:00 --end 14:00
+#   python sploosh_cli.py --format json search user_agent bot
+#   python sploosh_cli.py search --host web01 status 500
+#   python sploosh_cli.py search response_time 100 200
+#   python sploosh_cli.py search timestamp 10/Oct/2024:13:00 13:15
+#   python sploosh_cli.py rollup --start 2024-10-10 --end 2024-10-17 --size 3600 --by status
+#   python sploosh_cli.py follow access.log
+#   python sploosh_cli.py partitions --keep-days 30
+#   python sploosh_cli.py percentiles --by endpoint --filter "status < 500"
+#   python sploosh_cli.py buckets --size 60 --value packet_size
+#
+# Results are written to standard output as tab separated values (with a header
+# row) or as JSON lines, and progress and statistics are written to standard error.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import sys
+import json
+import time
+import argparse
+import sploosh_engine as engine
+import sploosh_analytics as analytics
+import sploosh_metrics as metrics
+
+# output_formats are the formats results can be written in
+output_formats = ("tsv", "json")
+
+# help text of the --log-format option
+log_format_help = ("layout of the log lines: 'combined' or 'common', or an nginx log_format string "
+                   "(ex. '$remote_addr [$time_local] \"$request\" $status $request_time') (default: combined, with an optional response time)")
+
+# column names of the logs table as written in the header row of tsv output
+header_columns = ("id",) + engine.log_columns
+
+# write_rows takes in an iterable of tuples, the names of their fields and an output format and writes them to standard output
+# timestamps are written in access log format for tsv output and as seconds since the epoch for json output
+def write_rows(rows, names, output_format):
+  out = sys.stdout
+  # find the timestamp field (if any) so it can be formatted
+  time_field = names.index("timestamp") if "timestamp" in names else None
+  if output_format == "json":
+    for row in rows:
+      out.write(json.dumps(dict(zip(names, row))) + "\n")
+    return
+  out.write("\t".join(names) + "\n")
+  for row in rows:
+    fields = ["" if value is None else str(value) for value in row]
+    if time_field is not None and row[time_field] is not None:
+      fields[time_field] = engine.format_timestamp(row[time_field])
+    out.write("\t".join(fields) + "\n")
+
+# report takes in a message and writes it to standard error so it does not mix with the results
+def report(message):
+  print(message, file=sys.stderr)
+
+# ingest_command loads every file given on the command line (folders and glob patterns are expanded, see
+# sploosh_engine.find_log_files) and reports the statistics of each load
+def ingest_command(conn, args):
+  for path, stats in engine.ingest_many(conn, args.paths, workers=args.workers, log_format=args.log_format, host=args.host):
+    if stats["lines"] == 0 and stats["start"] > 0:
+      report(f"{path}: already up to date")
+    else:
+      report(f"{path}: {stats['rows']} rows loaded, {stats['rejected']} lines rejected "
+             f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec)")
+  return 0
+
+# count_command counts the values of a column and writes each value with its count
+def count_command(conn, args):
+  column = engine.column_name(args.column)
+  conditions = []
+  params = ()
+  # only the partitions holding the time range of the filter and --start and --end are counted
+  start = end = None
+  if args.filter:
+    condition, params = engine.parse_filter(args.filter)
+    conditions.append(f"({condition})")
+    start, end = engine.filter_span(args.filter)
+  # only count the rows of one host
+  if args.host:
+    condition, host_params = engine.host_condition(args.host)
+    conditions.append(condition)
+    params = tuple(params) + host_params
+  if args.start:
+    range_start = engine.parse_time(args.start)[0]
+    conditions.append("timestamp >= ?")
+    params = tuple(params) + (range_start,)
+    start = range_start if start is None else max(start, range_start)
+  if args.end:
+    range_end = engine.parse_time(args.end, args.start)[1]
+    conditions.append("timestamp <= ?")
+    params = tuple(params) + (range_end,)
+    end = range_end if end is None else min(end, range_end)
+  condition = " AND ".join(conditions) or None
+  write_rows(engine.count(conn.cursor(), column, args.top, condition, params, start, end), (column, "count"), args.format)
+  return 0
+
+# search_command searches a column for a term (or a range between two terms) and writes every matching row
+def search_command(conn, args):
+  column = engine.column_name(args.column)
+  write_rows(engine.search(conn.cursor(), column, args.term, args.term2, args.host), header_columns, args.format)
+  return 0
+
+# partitions_command drops the partitions before --drop-before (or older than --keep-days) if asked, and writes every
+# partition that is left with the day it holds and its number of rows
+def partitions_command(conn, args):
+  before = None
+  if args.drop_before:
+    before = engine.parse_time(args.drop_before)[0]
+  elif args.keep_days is not None:
+    # today counts as one of the days kept
+    before = (int(time.time()) // engine.partition_size - args.keep_days + 1) * engine.partition_size
+  if before is not None:
+    dropped = engine.drop_partitions(conn, before)
+    report(f"{len(dropped)} partitions dropped" + (f" ({dropped[0]} to {dropped[-1]})" if dropped else ""))
+  rows = [(name, start, rows) for name, start, end, rows in engine.partitions(conn.cursor())]
+  write_rows(rows, ("partition", "timestamp", "rows"), args.format)
+  return 0
+
+# sources_command writes every file rows have been loaded from, with its host and number of rows
+def sources_command(conn, args):
+  write_rows(engine.sources(conn.cursor()), ("path", "host", "rows"), args.format)
+  return 0
+
+# follow_command keeps loading the lines added to a file until interrupted, writing each new row as it is loaded
+def follow_command(conn, args):
+  # rows from load_appended have no id, so only the columns are written
+  names = engine.log_columns
+  # the header row is only written once
+  header = [args.format == "tsv"]
+  def on_rows(rows):
+    if header[0]:
+      sys.stdout.write("\t".join(names) + "\n")
+      header[0] = False
+    for row in rows:
+      if args.format == "json":
+        sys.stdout.write(json.dumps(dict(zip(names, row))) + "\n")
+      else:
+        fields = ["" if value is None else str(value) for value in row]
+        fields[1] = engine.format_timestamp(row[1])
+        sys.stdout.write("\t".join(fields) + "\n")
+    sys.stdout.flush()
+    report(f"{args.path}: {len(rows)} rows loaded")
+  try:
+    engine.follow_file(conn, args.path, on_rows, log_format=args.log_format, host=args.host)
+  # Ctrl-C stops following, every micro-batch is already committed
+  except KeyboardInterrupt:
+    pass
+  return 0
+
+# rollup_command writes the totals of every time bucket in a time range from the rollup tables
+def rollup_command(conn, args):
+  start = engine.parse_time(args.start)[0] if args.start else None
+  end = engine.parse_time(args.end, args.start)[1] if args.end else None
+  results = engine.rollup(conn.cursor(), start, end, args.size, args.by, args.endpoint, args.status)
+  names = ("timestamp",) + ((args.by,) if args.by else ()) + ("requests", "errors", "bytes", "avg_response_time", "max_response_time")
+  write_rows(results, names, args.format)
+  return 0
+
+# plans_command reports whether the search for each column can use an index, along with the plan SQLite chose
+def plans_command(conn, args):
+  rows = [(cat, int(indexed), plan) for cat, (indexed, plan) in engine.check_query_plans(conn.cursor()).items()]
+  write_rows(rows, ("column", "indexed", "plan"), args.format)
+  return 0
+
+# cache_command writes how the query cache has been used (see sploosh_engine.cache_stats), after clearing it if asked
+def cache_command(conn, args):
+  if args.clear:
+    engine.clear_cache(conn)
+  stats = engine.cache_stats(conn)
+  write_rows([tuple(stats.values())], tuple(stats), args.format)
+  return 0
+
+# percentiles_command writes the percentiles of a value column for every value of a group column
+def percentiles_command(conn, args):
+  points = [float(point) for point in args.points.split(",")]
+  columns = analytics.load_columns(conn)
+  results = analytics.percentiles(columns, args.by, args.value, points, analytics.filter_mask(columns, args.filter))
+  names = (args.by, "requests") + tuple(f"p{point:g}" for point in points)
+  write_rows(((group, requests, *values) for group, requests, values in results), names, args.format)
+  return 0
+
+# buckets_command writes the number of requests and the total and maximum of a value column for every time bucket
+def buckets_command(conn, args):
+  columns = analytics.load_columns(conn)
+  results = analytics.time_buckets(columns, args.size, args.value, analytics.filter_mask(columns, args.filter))
+  write_rows(results, ("timestamp", "requests", f"{args.value}_total", f"{args.value}_max"), args.format)
+  return 0
+
+# histogram_command writes the number of requests in each bin of a value column
+def histogram_command(conn, args):
+  columns = analytics.load_columns(conn)
+  results = analytics.histogram(columns, args.value, args.bins, args.low, args.high, analytics.filter_mask(columns, args.filter))
+  write_rows(results, ("start", "end", "requests"), args.format)
+  return 0
+
+# build_parser returns the argument parser for every subcommand
+def build_parser():
+  parser = argparse.ArgumentParser(prog="sploosh_cli.py", description="Load, count and search access log files.")
+  parser.add_argument("--db", help="path of the database (default: sploosh/logs.db)")
+  parser.add_argument("--format", choices=output_formats, default="tsv", help="format of the results (default: tsv)")
+  parser.add_argument("--no-cache", action="store_true", help="always run counts and searches instead of reusing cached results")
+  parser.add_argument("--cache-stats", action="store_true", help="write the query cache hits and misses of this run to standard error when done")
+  parser.add_argument("--stats", action="store_true", help="write the timings of every stage of this run to standard error as JSON when done")
+  parser.add_argument("--profile", metavar="FOLDER", help="profile the command with cProfile and tracemalloc and write a report to this folder")
+  commands = parser.add_subparsers(dest="command", required=True)
+  ingest = commands.add_parser("ingest", help="load log files (only lines that were not loaded before are read)")
+  ingest.add_argument("paths", nargs="+", help="log files (plain, .gz or .bz2), folders or glob patterns to load")
+  ingest.add_argument("--workers", type=int, help="number of parsing processes (default: one per CPU)")
+  ingest.add_argument("--log-format", help=log_format_help)
+  ingest.add_argument("--host", help="host that wrote the files (default: the name of the folder holding each file)")
+  ingest.set_defaults(run=ingest_command)
+  count = commands.add_parser("count", help="count the values of a column, most common first")
+  count.add_argument("column", help="column to count (ex. endpoint or 'User Agent')")
+  count.add_argument("--top", type=int, help="only show this many of the most common values")
+  count.add_argument("--filter", help="only count rows that pass a filter (ex. 'status >= 500' or 'host != web01')")
+  count.add_argument("--host", help="only count rows loaded from the files of this host")
+  count.add_argument("--start", help="only count rows from this time on (ex. 10/Oct/2024:13:00 or 2024-10-10T13:00)")
+  count.add_argument("--end", help="only count rows up to this time, a time of day on its own uses the date of --start")
+  count.set_defaults(run=count_command)
+  search = commands.add_parser("search", help="search a column for a term, or for a range of values")
+  search.add_argument("column", help="column to search (ex. ip_addr or 'IP Address')")
+  search.add_argument("term", help="search term, or the start of the range")
+  search.add_argument("term2", nargs="?", help="end of the range (for timestamps, a time of day on its own uses the date of the start)")
+  search.add_argument("--host", help="only search rows loaded from the files of this host")
+  search.set_defaults(run=search_command)
+  rollup = commands.add_parser("rollup", help="requests, errors, bytes and response times for every time bucket")
+  rollup.add_argument("--start", help="start of the time range (ex. 10/Oct/2024:13:00 or 2024-10-10T13:00)")
+  rollup.add_argument("--end", help="end of the time range, a time of day on its own uses the date of --start")
+  rollup.add_argument("--size", type=int, default=3600, help="bucket size in seconds, a whole number of minutes (default: 3600)")
+  rollup.add_argument("--by", choices=("endpoint", "status"), help="split every bucket up by endpoint or status")
+  rollup.add_argument("--endpoint", help="only add up requests to this endpoint")
+  rollup.add_argument("--status", type=int, help="only add up requests with this status")
+  rollup.set_defaults(run=rollup_command)
+  follow = commands.add_parser("follow", help="keep loading lines as they are added to a file (Ctrl-C to stop)")
+  follow.add_argument("path", help="log file to follow")
+  follow.add_argument("--log-format", help=log_format_help)
+  follow.add_argument("--host", help="host that wrote the file (default: the name of the folder holding it)")
+  follow.set_defaults(run=follow_command)
+  sources = commands.add_parser("sources", help="list every file that has been loaded, with its host and number of rows")
+  sources.set_defaults(run=sources_command)
+  partitions = commands.add_parser("partitions", help="list the partitions (one per day) that the logs are kept in, or drop old ones")
+  drop = partitions.add_mutually_exclusive_group()
+  drop.add_argument("--drop-before", metavar="TIME", help="drop the partitions of every day before this time (ex. 2024-10-01)")
+  drop.add_argument("--keep-days", type=int, help="only keep the partitions of this many days, counting today")
+  partitions.set_defaults(run=partitions_command)
+  plans = commands.add_parser("plans", help="show whether the search for each column uses an index")
+  plans.set_defaults(run=plans_command)
+  cache = commands.add_parser("cache", help="show how many counts and searches were answered from the cache")
+  cache.add_argument("--clear", action="store_true", help="forget every cached result first")
+  cache.set_defaults(run=cache_command)
+  # the analytics subcommands need NumPy (see sploosh_analytics.py)
+  percentiles = commands.add_parser("percentiles", help="percentiles of a value for every endpoint or status (needs NumPy)")
+  percentiles.add_argument("--by", choices=analytics.group_columns, default="endpoint", help="column to group by (default: endpoint)")
+  percentiles.add_argument("--value", choices=analytics.value_columns, default="response_time", help="column to measure (default: response_time)")
+  percentiles.add_argument("--points", default=",".join(map(str, analytics.default_percentiles)), help="comma separated percentiles (default: 50,95,99)")
+  percentiles.add_argument("--filter", help="only measure rows that pass a filter (ex. 'status >= 500')")
+  percentiles.set_defaults(run=percentiles_command)
+  buckets = commands.add_parser("buckets", help="requests and totals of a value for every time bucket (needs NumPy)")
+  buckets.add_argument("--size", type=int, default=60, help="bucket size in seconds (default: 60)")
+  buckets.add_argument("--value", choices=analytics.value_columns, default="packet_size", help="column to total (default: packet_size)")
+  buckets.add_argument("--filter", help="only count rows that pass a filter (ex. 'status >= 500')")
+  buckets.set_defaults(run=buckets_command)
+  histogram = commands.add_parser("histogram", help="histogram of a value (needs NumPy)")
+  histogram.add_argument("--value", choices=analytics.value_columns, default="response_time", help="column to measure (default: response_time)")
+  histogram.add_argument("--bins", type=int, default=20, help="number of bins (default: 20)")
+  histogram.add_argument("--low", type=float, help="start of the first bin (default: the smallest value)")
+  histogram.add_argument("--high", type=float, help="end of the last bin (default: the largest value)")
+  histogram.add_argument("--filter", help="only count rows that pass a filter (ex. 'status >= 500')")
+  histogram.set_defaults(run=histogram_command)
+  return parser
+
+# main takes in the command line arguments (sys.argv by default) and runs the chosen subcommand
+# returns the exit status
+def main(argv=None):
+  parser = build_parser()
+  args = parser.parse_args(argv)
+  engine.query_cache_enabled = not args.no_cache
+  if args.profile:
+    metrics.profile_directory = args.profile
+  conn = engine.connect(args.db)
+  try:
+    with metrics.profile_operation(args.command):
+      status = args.run(conn, args)
+    if args.cache_stats:
+      report(json.dumps(engine.cache_stats(conn)))
+    if args.stats:
+      report(json.dumps(metrics.summary()))
+    return status
+  # a bad column or filter is reported the same way as a bad argument
+  except ValueError as error:
+    parser.error(str(error))
+  # an optional module (ex. NumPy for analytics) is missing
+  except ImportError as error:
+    report(error)
+    return 1
+  # the reader of the output (ex. head) went away, so stop quietly
+  # (standard output is pointed at devnull so flushing it on exit does not fail again)
+  except BrokenPipeError:
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 1
+  finally:
+    conn.close()
+
+if __name__ == '__main__':
+  sys.exit(main())
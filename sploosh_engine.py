@@ -0,0 +1,1810 @@
+# Project Name: Sploosh
+#
+# sploosh_engine.py
+# The headless engine behind Sploosh. This module holds everything needed to load
+# access log files into the SQLite database and to count and search them, without
+# any GUI code, so it can be used from scripts, cron jobs and the command line
+# interface (sploosh_cli.py) as well as from the TKinter GUI (sploosh.py).
+#
+# Importing this module does not touch the file system or the database, nothing
+# happens until connect() is called. Modules that are only needed by some features
+# (such as the process pool used for parallel parsing) are imported when first used
+# to keep start up fast.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import glob
+import fnmatch
+import re as regex
+import time
+import calendar
+import gzip
+import bz2
+import threading
+import select
+import operator
+import itertools
+import heapq
+from collections import deque
+from collections import OrderedDict
+from collections import Counter
+import sqlite3
+import json
+from sploosh_parsers import month_numbers, get_parser, parse_lines
+import sploosh_metrics as metrics
+
+# name of the folder (within the working directory) that holds logs.db by default
+data_directory = "sploosh"
+
+# legend for dictionary
+
+dict_legend = {
+  1: 'ip: ',
+  2: 'timestamp: ',
+  3: 'method: ',
+  4: 'endpoint: ',
+  5: 'status: ',
+  6: 'packet size: ',
+  7: 'referrer: ',
+  8: 'user agent: ',
+  9: 'response time: '
+}
+
+# legend for dropdown menu
+
+dropdown_dict = {
+  "IP Address": "ip_addr",
+  "Timestamp": "timestamp",
+  "Method": "method",
+  "Endpoint": "endpoint",
+  "Status": "status",
+  "Packet Size": "packet_size",
+  "Referrer": "referrer",
+  "User Agent": "user_agent",
+  "Response Time": "response_time"
+}
+
+# columns of the logs table (after the id) in the order they appear in a parsed row
+log_columns = tuple(dropdown_dict.values())
+
+# number of parsed rows that are inserted into the database together in one transaction
+batch_size = 50000
+
+# number of bytes read from a log file at a time while streaming it
+read_chunk_size = 1024 * 1024
+
+# seconds since a plain file was last written within which its last line is treated as possibly still being written
+# (see plan_load), a file that has been left alone for longer is loaded to its end even if it does not end with a newline
+unfinished_line_seconds = 2
+
+# number of bytes from the start of a file that are remembered to recognise it when it is loaded again
+head_size = 256
+
+# version of the database layout, stored in logs.db so that a database from an older version is rebuilt
+schema_version = 7
+
+# statement used to create the files table, which remembers how far into each file has been loaded
+create_files_command = "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, offset INTEGER, head BLOB, loaded_at INTEGER)"
+
+# statement used to create the meta table, which holds single values about the database as a whole (see data_version)
+create_meta_command = "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+
+# statement used to create the query_cache table, which keeps the results of recent counts between runs
+# (see cached_rows), each result is saved as JSON along with the data_version it was read at
+create_query_cache_command = "CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, data_version INTEGER, rows TEXT, used_at INTEGER)"
+
+# whether the results of counts and searches are cached (see cached_rows)
+query_cache_enabled = True
+
+# whether cached counts are also saved in the query_cache table, so they last between runs and are shared by
+# every program using the same database (ex. the GUI and cron jobs running the command line interface)
+# search results are only cached in memory, since saving whole rows would make logs.db grow by a copy of them
+query_cache_persist = True
+
+# most results kept in memory (and in the query_cache table) before the least recently used (oldest saved) ones are forgotten
+query_cache_size = 128
+
+# most rows kept in memory across every cached result, so a few large searches cannot fill up memory
+# (a result with more rows than this is not cached at all)
+query_cache_rows = 50000
+
+# cached results in memory for each database file and query, least recently used first, along with the
+# data_version they were read at, the lock is held while the cache is used since the GUI counts and searches
+# on several threads at once
+query_cache = OrderedDict()
+query_cache_lock = threading.Lock()
+
+# counts of how the cache has been used since the program started (see cache_stats)
+query_cache_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "uncached": 0, "evictions": 0}
+
+# number of worker processes used to parse a file in parallel (1 disables parallel parsing)
+worker_count = os.cpu_count() or 1
+
+# size in bytes of each piece of a file that is handed to a parsing worker
+parallel_chunk_size = 16 * 1024 * 1024
+
+# size in bytes of the largest compressed file that is handed to a parsing worker as a whole, larger ones are streamed by
+# the writer instead (logs compress about ten times, so this is already about as much text as one parallel_chunk_size piece)
+parallel_compressed_size = 2 * 1024 * 1024
+
+# number of search results shown in a results window at a time (more are loaded as the user scrolls)
+page_size = 500
+
+# number of search results read and written to output.txt at a time
+output_page_size = 10000
+
+# longest time (in seconds) follow mode waits for a followed file to change before checking it anyway
+follow_interval = 0.25
+
+# most bytes of new lines follow mode reads from a followed file in one micro-batch
+follow_max_bytes = 4 * 1024 * 1024
+
+# inotify event flags (see inotify(7)) for a file in a watched directory being written to, created or renamed
+inotify_events = 0x2 | 0x80 | 0x100
+
+# SQL command used to insert one parsed log line (with its id first and its text values swapped for their ids, see encode_rows)
+# into a partition of the logs (the partition name is filled in)
+insert_command = "INSERT INTO {table} (id, ip_addr_id, timestamp, method_id, endpoint_id, status, packet_size, referrer_id, user_agent_id, response_time, source_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# pragmas applied to the database connection while a file is being loaded
+# WAL journaling and synchronous=OFF avoid an fsync for every transaction, and the
+# negative cache_size is measured in KiB (roughly 200MB of page cache)
+load_pragmas = {
+  "journal_mode": "WAL",
+  "synchronous": "OFF",
+  "cache_size": "-200000",
+  "temp_store": "MEMORY"
+}
+
+# pragmas restored once the load has finished so that normal use is crash safe again
+normal_pragmas = {
+  "synchronous": "NORMAL"
+}
+
+# text columns whose values repeat from line to line and the dictionary table each one's values are kept in
+# every distinct value is stored once in its dictionary table, and the logs table only holds its id (ex. endpoint_id)
+dictionary_tables = {
+  "ip_addr": "ip_addrs",
+  "method": "methods",
+  "endpoint": "endpoints",
+  "referrer": "referrers",
+  "user_agent": "user_agents"
+}
+
+# statement used to create a dictionary table (the table name is filled in for each of the dictionary_tables)
+create_dictionary_command = "CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, value TEXT UNIQUE)"
+
+# size in seconds of the time range held by each partition of the logs (one day, UTC)
+# the rows of each day are kept in their own table (ex. logs_20241010), so a query over the last hour only reads the
+# newest partition, and old days are removed by dropping their tables (see drop_partitions)
+partition_size = 86400
+
+# statement used to create the partitions table, which lists every partition with the first and last second it holds
+create_partitions_command = "CREATE TABLE IF NOT EXISTS partitions (name TEXT PRIMARY KEY, start INTEGER UNIQUE, end INTEGER)"
+
+# statement used to create a partition of the logs (the partition name is filled in)
+# status and timestamp are stored as integers (the timestamp as seconds since the epoch, UTC) so they can be range searched,
+# and the repeated text columns are stored as ids into their dictionary tables
+# ids are given out in the order rows are loaded across every partition (see last_row_id), so they are never reused
+create_logs_command = "CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, ip_addr_id INTEGER, timestamp INTEGER, method_id INTEGER, endpoint_id INTEGER, status INTEGER, packet_size INT, referrer_id INTEGER, user_agent_id INTEGER, response_time INT, source_id INTEGER)"
+
+# columns of a partition, used to build the logs view when there are no partitions yet
+partition_columns = ("id", "ip_addr_id", "timestamp", "method_id", "endpoint_id", "status", "packet_size", "referrer_id", "user_agent_id", "response_time", "source_id")
+
+# most partitions joined together in one compound SELECT of the logs view (SQLite allows 500 by default)
+view_group_size = 400
+
+# number of threads that query partitions at the same time (see fan_out)
+query_workers = min(os.cpu_count() or 1, 4)
+
+# ids of the connections that are bulk loading, whose new partitions are indexed once the load is done (see load_batches)
+bulk_loads = set()
+
+# statement used to create the sources table, which holds the path of every file rows have been loaded from and the
+# host that wrote it, every row of the logs table has the id of its source in source_id
+create_sources_command = "CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, path TEXT UNIQUE, host TEXT)"
+
+# condition on the logs table that matches the rows loaded from the files of a host (the comparison is filled in)
+host_condition_command = "source_id IN (SELECT id FROM sources WHERE host {op} ?)"
+
+# patterns of the file names that are loaded when a folder is loaded (ex. access.log, access.log.1 and access.log.2.gz)
+log_file_patterns = ("*.log", "*.log.*", "*.txt", "*access*")
+
+# query that reads rows of a partition with their ids turned back into text, in the same order as log_columns
+# (the id of the row comes first), the partition name is filled in and conditions are added after it
+select_rows_command = ("SELECT {table}.id, ip_addrs.value, timestamp, methods.value, endpoints.value, status, packet_size, referrers.value, user_agents.value, response_time "
+                       "FROM {table} JOIN ip_addrs ON ip_addrs.id = ip_addr_id JOIN methods ON methods.id = method_id JOIN endpoints ON endpoints.id = endpoint_id "
+                       "JOIN referrers ON referrers.id = referrer_id JOIN user_agents ON user_agents.id = user_agent_id")
+
+# indexes on every partition of the logs and the column each one covers (each is named after its partition, ex. idx_logs_20241010_status)
+# they are created after a bulk load into an empty partition so that they do not slow down the inserts
+log_indexes = {
+  "ip_addr": "ip_addr_id",
+  "endpoint": "endpoint_id",
+  "user_agent": "user_agent_id",
+  "referrer": "referrer_id",
+  "status": "status",
+  "timestamp": "timestamp",
+  "response_time": "response_time",
+  "source": "source_id"
+}
+
+# most values of each dictionary column kept in memory while loading, so most lines need no lookup in the database
+intern_cache_size = 100000
+
+# caches of the id of recently loaded values for each connection and dictionary table, least recently used first
+# (see intern_values), they only ever hold ids that have been saved in that database
+intern_caches = {}
+
+# columns whose dictionary tables are also indexed for substring searches in a full-text table (ex. endpoints_fts)
+fts_columns = ("endpoint", "referrer", "user_agent")
+
+# statement used to create the full-text table of a dictionary table, which indexes every three character sequence (trigram)
+# of its values so that substring searches do not need to scan every value
+# only distinct values are indexed, so the index stays small no matter how many lines use them
+create_fts_command = "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(value, content='{table}', content_rowid='id', tokenize='trigram')"
+
+# trigger that adds every new value of a dictionary table to its full-text table
+# new values are rare once a few batches have been loaded, so indexing them one at a time costs very little
+create_fts_trigger_command = "CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN INSERT INTO {table}_fts (rowid, value) VALUES (new.id, new.value); END"
+
+# status codes at or above this are counted as errors in the rollup tables
+error_status = 500
+
+# rollup tables and the size in seconds of the time buckets each one adds up requests into
+# every bucket has one row per endpoint and status, so reports over days or weeks read these instead of the logs table
+rollup_tables = {
+  "rollup_minute": 60,
+  "rollup_hour": 3600
+}
+
+# statement used to create a rollup table (the table name is filled in for each of the rollup_tables)
+create_rollup_command = "CREATE TABLE IF NOT EXISTS {table} (bucket INTEGER, endpoint_id INTEGER, status INTEGER, requests INTEGER, errors INTEGER, bytes INTEGER, rt_count INTEGER, rt_sum INTEGER, rt_max INTEGER, PRIMARY KEY (bucket, endpoint_id, status)) WITHOUT ROWID"
+
+# statement used to add the rows of a partition that match a condition to a rollup table
+# buckets that already exist are added to, so each batch only has to add up its own rows
+# only rows with a response time count towards rt_count, rt_sum and rt_max (some log formats do not record it)
+rollup_command = ("INSERT INTO {table} SELECT timestamp / {size} * {size}, endpoint_id, status, COUNT(*), TOTAL(status >= {errors}), TOTAL(packet_size), "
+                  "COUNT(response_time), TOTAL(response_time), IFNULL(MAX(response_time), 0) FROM {partition} WHERE {condition} GROUP BY 1, 2, 3 ON CONFLICT DO UPDATE SET "
+                  "requests = requests + excluded.requests, errors = errors + excluded.errors, bytes = bytes + excluded.bytes, "
+                  "rt_count = rt_count + excluded.rt_count, rt_sum = rt_sum + excluded.rt_sum, rt_max = MAX(rt_max, excluded.rt_max)")
+
+# patterns for the ways a time can be written in a search: an access log timestamp (ex. '10/Oct/2024:13:55:36 -0700'),
+# an ISO 8601 time (ex. '2024-10-10T13:55:36Z') or a time of day on its own (ex. '13:55'), where anything after the
+# date can be left off
+access_time_pattern = regex.compile(r'(\d{1,2})/([A-Za-z]{3})/(\d{4})(?::(\d{1,2})(?::(\d{2})(?::(\d{2}))?)?)?\s*(Z|[+-]\d{2}:?\d{2})?$')
+iso_time_pattern = regex.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ](\d{1,2})(?::(\d{2})(?::(\d{2}))?)?)?\s*(Z|[+-]\d{2}:?\d{2})?$')
+clock_time_pattern = regex.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*(Z|[+-]\d{2}:?\d{2})?$')
+
+# month abbreviations in order, used to turn an epoch timestamp back into access log format
+month_names = list(month_numbers)
+
+# sample search terms for each category, used by check_query_plans to test how each search is run
+plan_samples = {
+  "ip_addr": "10.0.0.1",
+  "timestamp": "10/Oct/2024:13:55:36 -0700",
+  "method": "GET",
+  "endpoint": "index",
+  "status": "200",
+  "packet_size": "1000-2000",
+  "referrer": "example.com",
+  "user_agent": "Mozilla",
+  "response_time": "100-200"
+}
+
+### FUNCTIONS START HERE ###
+
+# open_log takes in a file path and returns the raw file along with a binary stream of its contents
+# gzip and bz2 compressed logs (ex. access.log.1.gz) are detected by their magic bytes and decompressed as they are read
+def open_log(path):
+  # open the file in binary mode
+  raw = open(path, 'rb')
+  # identify the file type from its first few bytes
+  compression = log_compression(path)
+  if compression == "gzip":
+    return raw, gzip.GzipFile(fileobj=raw)
+  if compression == "bz2":
+    return raw, bz2.BZ2File(raw)
+  # otherwise the file is read as is
+  return raw, raw
+
+# log_compression takes in a file path and returns "gzip" or "bz2" if the file is compressed, or None if it is plain text
+def log_compression(path):
+  # read the first few bytes of the file
+  with open(path, 'rb') as file:
+    magic = file.read(3)
+  # gzip files start with the bytes 1f 8b
+  if magic[:2] == b'\x1f\x8b':
+    return "gzip"
+  # bz2 files start with the bytes 'BZh'
+  if magic == b'BZh':
+    return "bz2"
+  return None
+
+# split_lines takes in bytes read from a log file and returns the list of lines in them, decoded as UTF-8
+# lines end at '\n' only (with a '\r' before it removed), unlike str.splitlines, which would also cut a line at
+# characters such as '\x0b', '\x1c' or '\u2028' that can show up in a user agent or endpoint
+def split_lines(data):
+  text = data.decode('utf-8', errors='replace')
+  lines = text.split('\n')
+  # the text ends with a newline, which leaves an empty string after it
+  if not lines[-1]:
+    lines.pop()
+  if '\r' in text:
+    lines = [line[:-1] if line.endswith('\r') else line for line in lines]
+  return lines
+
+# stream_lines takes in a file path and yields the lines of the file one at a time
+# the file is read in fixed-size chunks so memory stays constant no matter how large the file is
+# if progress is given, it is called after every chunk with the number of bytes read so far and the total size of the file
+# for plain files, start and end limit the lines to a byte range of the file (compressed files are always read in full)
+def stream_lines(path, progress=None, chunk_size=read_chunk_size, start=0, end=None):
+  # get the size of the file on disk for progress reporting
+  total = os.path.getsize(path)
+  # open the file (decompressing it if needed)
+  raw, stream = open_log(path)
+  with raw, stream:
+    # jump to the start of the range for plain files
+    limit = None
+    if stream is raw:
+      raw.seek(start)
+      if end is not None:
+        limit = end - start
+    # holds a partial line left over from the end of the previous chunk
+    remainder = b''
+    while True:
+      # read the next chunk of the file (without going past the end of the range)
+      if limit is not None:
+        chunk = stream.read(min(chunk_size, limit))
+        limit -= len(chunk)
+      else:
+        chunk = stream.read(chunk_size)
+      # an empty chunk means the end of the file was reached
+      if not chunk:
+        break
+      # join the leftover partial line with the new chunk and cut it after the last full line
+      data = remainder + chunk
+      cut = data.rfind(b'\n') + 1
+      remainder = data[cut:]
+      # yield every full line in the chunk
+      if cut:
+        yield from split_lines(data[:cut])
+      # report how far through the file we are (the raw position is used so compressed files report properly)
+      if progress:
+        progress(raw.tell(), total)
+    # yield the final line if the file does not end with a newline
+    if remainder:
+      yield from split_lines(remainder)
+
+# set_pragmas takes in a database connection and a dictionary of pragma names and values and applies each of them
+def set_pragmas(conn, pragmas):
+  # for every pragma name and value in the dictionary
+  for name, value in pragmas.items():
+    # apply the pragma to the connection
+    conn.execute(f"PRAGMA {name}={value}")
+
+# split_time takes in a time written in one of the ways matched by the time patterns and returns a list of its
+# year, month, day, hour, minute, second and UTC offset in seconds, with None for every part that was left off
+# raises ValueError if the time is not written in one of those ways
+def split_time(text):
+  text = text.strip()
+  match = access_time_pattern.match(text)
+  if match:
+    day, month, year, hour, minute, second, zone = match.groups()
+    month = month_numbers.get(month.title())
+    if month is None:
+      raise ValueError(f"invalid time: {text}")
+    parts = [int(year), month, int(day)]
+  else:
+    match = iso_time_pattern.match(text)
+    if match:
+      year, month, day, hour, minute, second, zone = match.groups()
+      parts = [int(year), int(month), int(day)]
+    else:
+      match = clock_time_pattern.match(text)
+      if not match:
+        raise ValueError(f"invalid time: {text}")
+      hour, minute, second, zone = match.groups()
+      parts = [None, None, None]
+  parts += [None if value is None else int(value) for value in (hour, minute, second)]
+  # turn the zone (ex. -0700, +05:30 or Z) into an offset in seconds
+  if zone is None:
+    parts.append(None)
+  elif zone == "Z":
+    parts.append(0)
+  else:
+    digits = zone[1:].replace(":", "")
+    offset = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+    parts.append(-offset if zone[0] == "-" else offset)
+  return parts
+
+# parse_time takes in a time written in a search (see split_time) or as seconds since the epoch and returns the first
+# and last second it covers, so a date covers the whole day, '13:55' covers the whole minute and so on
+# a time of day on its own takes its date (and UTC offset, if it has none) from base, another time such as the start
+# of the range it ends, and times without a UTC offset are taken to be in UTC like the stored timestamps
+# raises ValueError if the time cannot be read
+def parse_time(text, base=None):
+  text = text.strip()
+  if text.isdigit():
+    return int(text), int(text)
+  year, month, day, hour, minute, second, offset = split_time(text)
+  if year is None:
+    if base is None or base.strip().isdigit():
+      raise ValueError(f"a time of day needs a date: {text}")
+    base_parts = split_time(base)
+    year, month, day = base_parts[:3]
+    if offset is None:
+      offset = base_parts[6]
+  # the parts that were left off decide how long the time lasts
+  if hour is None:
+    length = 86400
+  elif minute is None:
+    length = 3600
+  elif second is None:
+    length = 60
+  else:
+    length = 1
+  try:
+    start = calendar.timegm((year, month, day, hour or 0, minute or 0, second or 0)) - (offset or 0)
+    # timegm accepts days and hours past the end of the month or day, so check them by converting back
+    if time.gmtime(start + (offset or 0))[:6] != (year, month, day, hour or 0, minute or 0, second or 0):
+      raise ValueError
+  except (ValueError, OverflowError):
+    raise ValueError(f"invalid time: {text}") from None
+  return start, start + length - 1
+
+# format_timestamp takes in seconds since the epoch and returns it as an access log timestamp in UTC
+def format_timestamp(seconds):
+  t = time.gmtime(seconds)
+  return f"{t.tm_mday:02d}/{month_names[t.tm_mon - 1]}/{t.tm_year}:{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d} +0000"
+
+# format_field takes in a column number (as used by dict_legend) and a value from the logs table and returns it as a string
+def format_field(i, value):
+  # timestamps are stored as epoch seconds, so turn them back into a readable timestamp
+  if i == 2 and value is not None:
+    return format_timestamp(value)
+  # fields missing from the log format (ex. the response time of the Common Log Format) are shown as '-'
+  if value is None:
+    return "-"
+  return str(value)
+
+# parse_line takes in a single line of a log file and returns a row tuple ready to be inserted, or None if it is not a valid log line
+# log_format chooses how the line is read (see sploosh_parsers.get_parser), by default the Combined Log Format
+def parse_line(line, log_format=None):
+  return get_parser(log_format)(line)
+
+# intern_values takes in a database connection, a dictionary table and a list of values and returns the list of
+# their ids, adding any value that is not in the table yet without committing
+# ids are looked up in the connection's cache first, so only values that have not been seen recently are looked up
+def intern_values(conn, table, values):
+  cache = intern_caches.setdefault((id(conn), conn.execute("PRAGMA database_list").fetchone()[2], table), OrderedDict())
+  missing = set(values).difference(cache)
+  if missing:
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", ((value,) for value in missing))
+    for value in missing:
+      cache[value] = conn.execute(f"SELECT id FROM {table} WHERE value = ?", (value,)).fetchone()[0]
+  ids = [cache[value] for value in values]
+  # mark the values as recently used and forget the least recently used ones
+  for value in set(values).difference(missing):
+    cache.move_to_end(value)
+  while len(cache) > intern_cache_size:
+    cache.popitem(last=False)
+  return ids
+
+# forget_interned takes in a database connection and forgets the cached ids of its dictionary values
+# used when a transaction is rolled back, since ids added by it were never saved
+def forget_interned(conn):
+  for key in [key for key in intern_caches if key[0] == id(conn)]:
+    del intern_caches[key]
+
+# partition_name takes in a time (in seconds since the epoch) and returns the name of the partition that holds it
+# (ex. 'logs_20241010')
+def partition_name(seconds):
+  return time.strftime("logs_%Y%m%d", time.gmtime(seconds // partition_size * partition_size))
+
+# partition_tables takes in a database connection and a time range (None for no limit) and returns the names of the
+# partitions holding any time in the range, oldest first
+def partition_tables(conn, start=None, end=None):
+  start = -2 ** 63 if start is None else start
+  end = 2 ** 63 - 1 if end is None else end
+  return [name for (name,) in conn.execute("SELECT name FROM partitions WHERE end >= ? AND start <= ? ORDER BY start", (start, end))]
+
+# add_partition takes in a database connection and a time and returns the name of the partition that holds it,
+# creating the partition without committing if it does not exist yet
+# a new partition is indexed straight away, unless the connection is bulk loading (see load_batches)
+def add_partition(conn, seconds):
+  name = partition_name(seconds)
+  if conn.execute("SELECT 1 FROM partitions WHERE name = ?", (name,)).fetchone() is None:
+    start = seconds // partition_size * partition_size
+    conn.execute(create_logs_command.format(table=name))
+    conn.execute("INSERT INTO partitions (name, start, end) VALUES (?, ?, ?)", (name, start, start + partition_size - 1))
+    if id(conn) not in bulk_loads:
+      index_partition(conn, name)
+    update_logs_view(conn)
+  return name
+
+# remove_partition takes in a database connection and the name of a partition and drops it (along with its indexes)
+# without committing
+def remove_partition(conn, name):
+  conn.execute(f"DROP TABLE IF EXISTS {name}")
+  conn.execute("DELETE FROM partitions WHERE name = ?", (name,))
+  update_logs_view(conn)
+
+# update_logs_view takes in a database connection and recreates the logs view without committing, which joins every
+# partition together so that every row can still be read from 'logs' (ex. SELECT COUNT(*) FROM logs)
+# counts and searches query the partitions themselves (see fan_out and search_pages) so only the partitions they need are read
+def update_logs_view(conn):
+  tables = partition_tables(conn)
+  conn.execute("DROP VIEW IF EXISTS logs")
+  if not tables:
+    conn.execute(f"CREATE VIEW logs AS SELECT {', '.join(f'NULL AS {column}' for column in partition_columns)} WHERE 0")
+    return
+  # SQLite limits how many SELECTs can be joined at once, so the partitions are joined in groups
+  groups = [" UNION ALL ".join(f"SELECT * FROM {table}" for table in tables[i:i + view_group_size]) for i in range(0, len(tables), view_group_size)]
+  conn.execute("CREATE VIEW logs AS " + (groups[0] if len(groups) == 1 else " UNION ALL ".join(f"SELECT * FROM ({group})" for group in groups)))
+
+# last_row_id takes in a database connection and returns the id of the last row loaded (0 if none have been)
+def last_row_id(conn):
+  return conn.execute("SELECT value FROM meta WHERE name = 'last_row_id'").fetchone()[0]
+
+# id_groups takes in a database connection and a list of partitions and returns them split into groups that each hold
+# a range of row ids no other group overlaps, with the groups in order of their ids
+# files are usually loaded in the order they were written, so each day's rows come after the day before and most
+# groups are a single partition, but a file loaded late (ex. an old rotated file) overlaps the days loaded before it
+def id_groups(conn, tables):
+  ranges = [(conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone(), table) for table in tables]
+  groups = []
+  last = None
+  # an empty partition has nothing to search
+  for (first_id, last_id), table in sorted(item for item in ranges if item[0][0] is not None):
+    if groups and first_id <= last:
+      groups[-1].append(table)
+      last = max(last, last_id)
+    else:
+      groups.append([table])
+      last = last_id
+  return groups
+
+# partitions_dropped takes in a database connection and returns the number of times old partitions have been dropped
+def partitions_dropped(conn):
+  return conn.execute("SELECT value FROM meta WHERE name = 'partitions_dropped'").fetchone()[0]
+
+# fan_out takes in a database connection, a list of partitions and a query (with {table} in place of the partition name)
+# along with its parameters, and returns an iterable of the rows the query returned for each partition, in the same order
+# the partitions are shared between up to query_workers threads that each open their own connection to the database,
+# so the partitions are queried at the same time (SQLite lets go of the GIL while it runs a query)
+# when the partitions are queried one after another, each partition is only queried once the rows of the one before
+# it have been read, and its rows are read straight from the cursor
+def fan_out(conn, tables, query, params=()):
+  db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+  workers = min(query_workers, len(tables))
+  # an in-memory database cannot be opened by another connection
+  if workers <= 1 or not db_file:
+    return (conn.execute(query.format(table=table), params) for table in tables)
+  # the thread pool is only imported when partitions are actually queried at the same time
+  from concurrent.futures import ThreadPoolExecutor
+  # inner function run queries a group of partitions on its own connection
+  def run(group):
+    group_conn = sqlite3.connect(db_file, timeout=30)
+    try:
+      return [group_conn.execute(query.format(table=table), params).fetchall() for table in group]
+    finally:
+      group_conn.close()
+  groups = [tables[i::workers] for i in range(workers)]
+  results = [None] * len(tables)
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    for i, group_results in enumerate(pool.map(run, groups)):
+      results[i::workers] = group_results
+  return results
+
+# encode_rows takes in a database connection, a list of parsed rows, the id of the source they were read from and the
+# id of the first row, and returns the rows with their ids added at the start, the values of every dictionary column
+# swapped for their ids and the source id added on the end, ready to be inserted with insert_command
+def encode_rows(conn, rows, source_id=None, first_id=1):
+  columns = list(zip(*rows))
+  for index, column in enumerate(log_columns):
+    if column in dictionary_tables:
+      columns[index] = intern_values(conn, dictionary_tables[column], columns[index])
+  columns.insert(0, range(first_id, first_id + len(rows)))
+  columns.append(itertools.repeat(source_id, len(rows)))
+  return list(zip(*columns))
+
+# insert_rows takes in a database connection, a list of parsed rows and the id of the source they were read from
+# (see source_id) and inserts them into the partition of their day without committing
+def insert_rows(conn, rows, source_id=None):
+  if not rows:
+    return
+  # the new rows are numbered on from the last row loaded, so they can be found by their ids
+  # the ids are taken as the first write of the transaction, which locks the database, so two connections loading at
+  # the same time (ex. a load while a file is being followed) can never be given the same ids
+  last_id = conn.execute("UPDATE meta SET value = value + ? WHERE name = 'last_row_id' RETURNING value", (len(rows),)).fetchone()[0]
+  first_id = last_id - len(rows) + 1
+  try:
+    with metrics.timer("encode", len(rows)):
+      encoded = encode_rows(conn, rows, source_id, first_id)
+    with metrics.timer("insert", len(rows)):
+      # the rows of a batch almost always fall on a single day, in which case they do not need to be split up
+      timestamp = log_columns.index("timestamp") + 1
+      first_day = encoded[0][timestamp] // partition_size
+      days = {}
+      if all(row[timestamp] // partition_size == first_day for row in encoded):
+        days[first_day * partition_size] = encoded
+      else:
+        for row in encoded:
+          days.setdefault(row[timestamp] // partition_size * partition_size, []).append(row)
+      tables = [add_partition(conn, day) for day in days]
+      for table, day_rows in zip(tables, days.values()):
+        conn.executemany(insert_command.format(table=table), day_rows)
+    # add the new rows to the rollup tables
+    with metrics.timer("rollup", len(rows)):
+      update_rollups(conn, "id >= ?", (first_id,), tables)
+    # results cached before these rows were added are out of date
+    bump_data_version(conn)
+  except BaseException:
+    # the caller rolls the transaction back, taking any new dictionary values with it
+    forget_interned(conn)
+    raise
+
+# update_rollups takes in a database connection, an SQL condition with its parameters and a list of partitions and adds
+# the rows of those partitions that match the condition to every rollup table without committing
+def update_rollups(conn, condition, params, partitions):
+  for partition in partitions:
+    for table, size in rollup_tables.items():
+      conn.execute(rollup_command.format(table=table, partition=partition, size=size, errors=error_status, condition=condition), params)
+
+# rebuild_rollups takes in a database connection and a time range and adds up the rollup buckets in that range again
+# from the logs table without committing, used after rows are removed since their maximums cannot be taken back out
+def rebuild_rollups(conn, start, end):
+  # widen the range to whole hours so that it covers whole buckets of every rollup table
+  size = max(rollup_tables.values())
+  start = start // size * size
+  end = end // size * size + size - 1
+  for table in rollup_tables:
+    conn.execute(f"DELETE FROM {table} WHERE bucket BETWEEN ? AND ?", (start, end))
+  update_rollups(conn, "timestamp BETWEEN ? AND ?", (start, end), partition_tables(conn, start, end))
+
+# insert_batch takes in a database connection, a list of parsed rows and the id of their source and inserts them all
+# within a single transaction
+def insert_batch(conn, batch, source_id=None):
+  # the batch is committed once the whole batch has been inserted (or rolled back on an error)
+  # this is what the connection context manager does, written out so the commit can be timed on its own
+  try:
+    insert_rows(conn, batch, source_id)
+  except BaseException:
+    conn.rollback()
+    raise
+  with metrics.timer("commit", len(batch)):
+    conn.commit()
+
+# new_load_stats returns a dictionary for keeping statistics about a load
+def new_load_stats():
+  return {"lines": 0, "rows": 0, "rejected": 0, "seconds": 0.0, "rows_per_sec": 0.0, "start": 0, "cancelled": False}
+
+# parse_batches takes in an iterable of lines and a statistics dictionary and yields lists of parsed rows of up to batch_size
+# log_format chooses how the lines are read (see sploosh_parsers.get_parser)
+def parse_batches(lines, stats, log_format=None):
+  parser = get_parser(log_format)
+  lines = iter(lines)
+  # parse the lines a batch at a time so the garbage collector is only paused once per batch (see parse_lines)
+  while True:
+    # when streaming a file, reading the lines includes reading and decompressing the file itself
+    with metrics.timer("read"):
+      chunk = list(itertools.islice(lines, batch_size))
+    if not chunk:
+      break
+    stats["lines"] += len(chunk)
+    with metrics.timer("parse", len(chunk)):
+      batch = [row for row in parse_lines(parser, chunk) if row is not None]
+    # lines that could not be parsed are counted as rejected
+    stats["rejected"] += len(chunk) - len(batch)
+    if batch:
+      yield batch
+
+# create_indexes takes in a database connection and creates any of the log_indexes that do not exist yet on every partition
+def create_indexes(conn):
+  with conn:
+    for table in partition_tables(conn):
+      index_partition(conn, table)
+
+# index_partition takes in a database connection and the name of a partition and creates any of its log_indexes that
+# do not exist yet without committing
+def index_partition(conn, table):
+  for name, column in log_indexes.items():
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table} ({column})")
+
+# drop_indexes takes in a database connection and drops all of the log_indexes of every partition
+def drop_indexes(conn):
+  with conn:
+    for table in partition_tables(conn):
+      for name in log_indexes:
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_{name}")
+
+# load_batches takes in a database connection, an iterable of row batches and a statistics dictionary
+# each batch is inserted with executemany in its own transaction while the load pragmas are applied
+# returns the statistics dictionary
+# source_id is the id of the file the rows were read from (see source_id), and defer_indexes leaves the indexes
+# alone for a caller that is loading several files and drops and creates them itself
+# partitions created by the load are indexed at the end instead of being updated on every insert
+def load_batches(conn, batches, stats, cancelled=None, source_id=None, defer_indexes=False):
+  # record the starting time of the load
+  start = time.perf_counter()
+  # if there are no logs yet, drop the indexes so they are built once at the end instead of updated on every insert
+  if not defer_indexes and conn.execute("SELECT NOT EXISTS (SELECT 1 FROM logs)").fetchone()[0]:
+    drop_indexes(conn)
+  # tune the connection for a bulk load
+  set_pragmas(conn, load_pragmas)
+  bulk_loads.add(id(conn))
+  # try to load the batches, restoring the normal pragmas and indexes no matter what happens
+  try:
+    for batch in batches:
+      # stop loading if the load was cancelled
+      if cancelled and cancelled():
+        stats["cancelled"] = True
+        break
+      # a piece of a file with no valid lines (ex. a README.txt among the logs) has no rows to insert
+      if not batch:
+        continue
+      insert_batch(conn, batch, source_id)
+      stats["rows"] += len(batch)
+  finally:
+    bulk_loads.discard(id(conn))
+    if not defer_indexes:
+      with metrics.timer("index"):
+        create_indexes(conn)
+    set_pragmas(conn, normal_pragmas)
+  # calculate the time the load took and the throughput
+  stats["seconds"] = time.perf_counter() - start
+  if stats["seconds"] > 0:
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"]
+  # return the statistics
+  return stats
+
+# bulk_load takes in a database connection and an iterable of lines and loads every valid line into the logs table
+# rows are collected into batches of batch_size and each batch is inserted with executemany in one transaction
+# returns a dictionary of statistics about the load
+def bulk_load(conn, lines, cancelled=None, log_format=None, source_id=None):
+  stats = new_load_stats()
+  return load_batches(conn, parse_batches(lines, stats, log_format), stats, cancelled, source_id)
+
+# split_file takes in a file path and returns a list of (start, end) byte offsets that divide the file into pieces
+# of roughly chunk_size bytes, with every piece ending right after a newline so no line is cut in half
+# start and end limit the pieces to a byte range of the file
+def split_file(path, chunk_size=parallel_chunk_size, start=0, end=None):
+  total = os.path.getsize(path) if end is None else end
+  offsets = []
+  with open(path, 'rb') as file:
+    while start < total:
+      end = start + chunk_size
+      # if the piece does not reach the end of the file, move its end forward to the end of the current line
+      if end < total:
+        file.seek(end)
+        file.readline()
+        end = file.tell()
+      else:
+        end = total
+      offsets.append((start, end))
+      start = end
+  return offsets
+
+# parse_chunk takes in a file path and a byte range of the file and parses every line within that range
+# it is run inside of a worker process, so it returns the parsed rows along with the counts needed for the load statistics
+# a compressed file cannot be split, so it is always parsed as a whole (start and end are ignored)
+def parse_chunk(path, start, end, log_format=None):
+  if log_compression(path) is not None:
+    lines = list(stream_lines(path))
+  else:
+    # read the piece of the file
+    with open(path, 'rb') as file:
+      file.seek(start)
+      lines = split_lines(file.read(end - start))
+  # parse every line of the piece, timing it here since the worker's own timings stay in the worker process
+  start = time.perf_counter()
+  stats = new_load_stats()
+  rows = [row for batch in parse_batches(lines, stats, log_format) for row in batch]
+  return rows, stats["lines"], stats["rejected"], end, time.perf_counter() - start
+
+# parallel_batches takes in a file path, a worker count, a statistics dictionary and an optional progress function
+# the file is split into pieces that are parsed by a pool of worker processes, and the parsed rows of each piece are yielded
+# in file order so the rows are always inserted in the same order as the file
+def parallel_batches(path, workers, stats, progress=None, start=0, end=None, log_format=None):
+  # the process pool is only imported when a file is actually parsed in parallel
+  from concurrent.futures import ProcessPoolExecutor
+  total = os.path.getsize(path)
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    # the pieces currently being parsed, oldest first
+    pending = deque()
+    for start, end in split_file(path, start=start, end=end):
+      pending.append(pool.submit(parse_chunk, path, start, end, log_format))
+      # only keep a couple of pieces per worker in flight so parsed rows do not pile up in memory
+      if len(pending) >= workers * 2:
+        yield collect_chunk(pending.popleft(), stats, total, progress)
+    # collect the remaining pieces
+    while pending:
+      yield collect_chunk(pending.popleft(), stats, total, progress)
+
+# collect_chunk takes in a finished parse_chunk job and adds its counts to the load statistics, returning its rows
+def collect_chunk(future, stats, total, progress):
+  # the time spent waiting for the worker is the time the load was held up by parsing
+  with metrics.timer("parse_wait"):
+    rows, lines, rejected, end, seconds = future.result()
+  metrics.add_time("parse", seconds, lines)
+  stats["lines"] += lines
+  stats["rejected"] += rejected
+  # report how far through the file we are (total is None when the progress function works it out itself)
+  if progress:
+    progress(end, total)
+  return rows
+
+# parallel_load takes in a database connection and a file path and loads the file using worker processes for parsing
+# the rows are written to the database by this process only, so SQLite only ever has a single writer
+# returns a dictionary of statistics about the load
+def parallel_load(conn, path, workers=None, progress=None, cancelled=None, start=0, end=None, log_format=None, source_id=None):
+  stats = new_load_stats()
+  return load_batches(conn, parallel_batches(path, workers or worker_count, stats, progress, start, end, log_format), stats, cancelled, source_id)
+
+# read_head takes in a file path and returns its first head_size bytes, which are used to recognise the file later on
+# the bytes of a compressed file are read from its decompressed content, so it can be recognised as the plain file
+# it was made from
+def read_head(path):
+  raw, stream = open_log(path)
+  with raw, stream:
+    return stream.read(head_size)
+
+# file_start takes in a database connection, a file path, the file's os.stat result and its first bytes and returns
+# the byte offset that loading the file should start from, using what the files table remembers about earlier loads
+# a file that was renamed (ex. access.log rotated to access.log.1) is recognised by its inode and first bytes and its
+# entry is moved to the new path, while a file that was replaced or truncated is loaded again from the start
+# a compressed file (ex. access.log.1 compressed into access.log.2.gz by logrotate) is a new file with a new inode, so
+# it is recognised by its decompressed first bytes instead, and is skipped if the file it was made from was loaded in full
+def file_start(conn, path, info, head, compressed=False):
+  # look up the file by its path first, then by its inode in case it was renamed
+  known = conn.execute("SELECT path, inode, offset, head FROM files WHERE path = ?", (path,)).fetchone()
+  if known is None or known[1] != info.st_ino:
+    known = conn.execute("SELECT path, inode, offset, head FROM files WHERE inode = ? AND path != ?", (info.st_ino, path)).fetchone()
+  # the file has been replaced or truncated if it starts differently or is now smaller than what was already loaded
+  if known is not None and head[:len(known[3])] == known[3] and info.st_size >= known[2]:
+    known_path, inode, offset, known_head = known
+    # a renamed file keeps its progress under its new path
+    if known_path != path:
+      with conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        conn.execute("UPDATE files SET path = ? WHERE path = ?", (path, known_path))
+    return offset
+  if compressed and conn.execute("SELECT EXISTS (SELECT 1 FROM files WHERE head = ? AND offset = size AND path != ?)", (head, path)).fetchone()[0]:
+    return info.st_size
+  return 0
+
+# record_file takes in a database connection, a file path, the file's os.stat result, its first bytes and the byte offset
+# that has been loaded up to, and saves them in the files table so the next load can carry on from there
+def record_file(conn, path, info, head, offset):
+  with conn:
+    conn.execute("INSERT OR REPLACE INTO files (path, inode, size, offset, head, loaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                 (path, info.st_ino, info.st_size, offset, head, int(time.time())))
+
+# delete_rows_after takes in a database connection, a row id and optionally the id of a source (see source_id) and
+# deletes every row of the logs after it, only those read from that source if one is given
+# it is used to undo a load that was cancelled part way through, and partitions left empty are dropped
+# (the rows of other files loaded at the same time, ex. a file being followed, are left alone by giving the source)
+def delete_rows_after(conn, last_id, source_id=None):
+  condition, params = ("id > ?", (last_id,)) if source_id is None else ("id > ? AND source_id = ?", (last_id, source_id))
+  with conn:
+    for table in partition_tables(conn):
+      # remember the times the rows cover so those rollup buckets can be added up again without them
+      start, end = conn.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} WHERE {condition}", params).fetchone()
+      if start is None:
+        continue
+      # the values of the rows are left in the dictionary tables, where they are ready if the file is loaded again
+      conn.execute(f"DELETE FROM {table} WHERE {condition}", params)
+      if conn.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table})").fetchone()[0]:
+        remove_partition(conn, table)
+      rebuild_rollups(conn, start, end)
+      bump_data_version(conn)
+
+# drop_partitions takes in a database connection and a time (in seconds since the epoch) and drops every partition
+# that only holds times before it, returning the names of the partitions dropped
+# this is how old logs are removed: a whole day is dropped at once instead of deleting its rows one by one
+# the rollup tables keep their totals for the dropped days, so reports over long time ranges still cover them
+def drop_partitions(conn, before):
+  with conn:
+    names = [name for (name,) in conn.execute("SELECT name FROM partitions WHERE end < ? ORDER BY start", (before,))]
+    for name in names:
+      remove_partition(conn, name)
+    if names:
+      # column files (see sploosh_analytics.py) that hold the dropped rows have to be started over
+      conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'partitions_dropped'")
+      bump_data_version(conn)
+  return names
+
+# partitions takes in a cursor and returns a list of (name, start, end, rows) for every partition, oldest first
+def partitions(cursor):
+  conn = cursor.connection
+  tables = partition_tables(conn)
+  counts = fan_out(conn, tables, "SELECT COUNT(*) FROM {table}")
+  ranges = dict((name, (start, end)) for name, start, end in conn.execute("SELECT name, start, end FROM partitions"))
+  return [(table, *ranges[table], next(iter(rows))[0]) for table, rows in zip(tables, counts)]
+
+# default_host takes in the path of a log file and returns the host it is assumed to come from when no host is given,
+# which is the name of the folder holding it (ex. 'web01' for /var/log/hosts/web01/access.log)
+def default_host(path):
+  return os.path.basename(os.path.dirname(os.path.abspath(path))) or "-"
+
+# source_id takes in a database connection, the path of a log file and the host that wrote it and returns the id of the
+# file in the sources table, adding it (or changing its host) if needed
+# if host is None, a file seen before keeps its host and a new file gets the default_host
+def source_id(conn, path, host=None):
+  with conn:
+    if host is None:
+      conn.execute("INSERT OR IGNORE INTO sources (path, host) VALUES (?, ?)", (path, default_host(path)))
+    else:
+      conn.execute("INSERT INTO sources (path, host) VALUES (?, ?) ON CONFLICT (path) DO UPDATE SET host = excluded.host WHERE host != excluded.host", (path, host))
+    return conn.execute("SELECT id FROM sources WHERE path = ?", (path,)).fetchone()[0]
+
+# last_line_end takes in the path of a plain file and its size and returns the byte offset just after its last newline
+# (0 if it has none), so a line that is still being written is left for a later load instead of being cut short
+def last_line_end(path, size):
+  with open(path, 'rb') as file:
+    end = size
+    # search backwards through the file a chunk at a time
+    while end > 0:
+      start = max(end - read_chunk_size, 0)
+      file.seek(start)
+      cut = file.read(end - start).rfind(b'\n')
+      if cut >= 0:
+        return start + cut + 1
+      end = start
+  return 0
+
+# plan_load takes in a database connection and a file path and returns a dictionary describing what loading the
+# file involves: its full path, its os.stat result and first bytes (as they are right now, only the bytes that exist
+# at this point are loaded), whether it is compressed, the byte offset to start from (see file_start) and the byte
+# offset to stop at, which is the end of the file, or the end of its last complete line if it was written to in the
+# last unfinished_line_seconds (see last_line_end)
+def plan_load(conn, path):
+  path = os.path.abspath(path)
+  info = os.stat(path)
+  head = read_head(path)
+  compressed = log_compression(path) is not None
+  start = file_start(conn, path, info, head, compressed)
+  # a compressed file is either already loaded in full or loaded again from the start
+  if compressed and start != info.st_size:
+    start = 0
+  end = info.st_size
+  if not compressed and start < end and time.time() - info.st_mtime < unfinished_line_seconds:
+    end = last_line_end(path, info.st_size)
+  return {"path": path, "info": info, "head": head, "compressed": compressed, "start": start, "end": end}
+
+# finish_load takes in a database connection, a plan from plan_load, the statistics of loading it, the last row id
+# before the load and the id of the file in the sources table, and undoes the load if it was cancelled or otherwise
+# remembers how much of the file has been loaded
+def finish_load(conn, plan, stats, last_id, source=None):
+  stats["start"] = plan["start"]
+  if stats["cancelled"]:
+    delete_rows_after(conn, last_id, source)
+  else:
+    record_file(conn, plan["path"], plan["info"], plan["head"], plan["end"])
+  metrics.count_event("lines_read", stats["lines"])
+  metrics.count_event("rows_loaded", 0 if stats["cancelled"] else stats["rows"])
+  metrics.count_event("rejected_lines", stats["rejected"])
+  return stats
+
+# abandon_load takes in a database connection, the last row id before a load and the id of the file in the sources
+# table, and undoes a load that stopped with an
+# error (ex. its query was interrupted by cancelling it), since the batches it already committed would otherwise be left
+# in the logs without the file being recorded as loaded, and be loaded a second time by the next load
+def abandon_load(conn, last_id, source):
+  conn.rollback()
+  delete_rows_after(conn, last_id, source)
+
+# load_file takes in a database connection and a file path and loads the file with the fastest method available
+# plain files larger than one piece are parsed in parallel, everything else (including compressed files) is streamed
+# only the part of the file that has not been loaded before is read (see file_start), and compressed files
+# that have already been loaded are skipped since they cannot be appended to, while the last line of a plain file that
+# is being written to right now is left for the next load if it does not end with a newline yet (see plan_load)
+# if cancelled is given, it is checked between batches, and once it returns True the load stops and its rows are removed
+# (as they are if the load stops with an error)
+# log_format chooses how the lines are read (see sploosh_parsers.get_parser), by default the Combined Log Format
+# host is recorded as the host that wrote the file (by default the name of the folder holding it, see default_host)
+def load_file(conn, path, progress=None, workers=None, cancelled=None, log_format=None, host=None):
+  workers = workers or worker_count
+  with metrics.profile_operation("load"):
+    plan = plan_load(conn, path)
+    start, end = plan["start"], plan["end"]
+    # remember the last row before the load in case it needs to be undone
+    last_id = last_row_id(conn)
+    source = None
+    if start >= end:
+      stats = new_load_stats()
+    else:
+      source = source_id(conn, plan["path"], host)
+      try:
+        if workers > 1 and not plan["compressed"] and end - start > parallel_chunk_size:
+          stats = parallel_load(conn, plan["path"], workers, progress, cancelled, start, end, log_format, source)
+        else:
+          stats = bulk_load(conn, stream_lines(plan["path"], progress, start=start, end=end), cancelled, log_format, source)
+      except BaseException:
+        abandon_load(conn, last_id, source)
+        raise
+  return finish_load(conn, plan, stats, last_id, source)
+
+# find_log_files takes in a list of file paths, folders and glob patterns (ex. '/var/log/hosts/*/access.log*') and
+# returns the list of every log file they name, oldest first so that rotated files are loaded in the order they were written
+# folders are searched (along with every folder inside them) for files named like logs (see log_file_patterns)
+# raises ValueError if a path does not exist or a pattern matches nothing
+def find_log_files(paths):
+  found = []
+  for path in paths:
+    if os.path.isdir(path):
+      for folder, folders, names in os.walk(path):
+        # hidden folders (ex. .git) are skipped
+        folders[:] = [name for name in folders if not name.startswith(".")]
+        found += [os.path.join(folder, name) for name in names
+                  if not name.startswith(".") and any(fnmatch.fnmatch(name, pattern) for pattern in log_file_patterns)]
+    elif os.path.exists(path):
+      found.append(path)
+    else:
+      matches = [match for match in glob.glob(path, recursive=True) if os.path.isfile(match)]
+      if not matches:
+        raise ValueError(f"no such file or folder: {path}")
+      found += matches
+  # a file named more than once is only loaded once
+  found = list(dict.fromkeys(os.path.abspath(path) for path in found))
+  return sorted(found, key=lambda path: (os.path.getmtime(path), path))
+
+# load_files takes in a database connection and a list of file paths, folders and glob patterns (see find_log_files) and
+# loads every file they name, returning a list of (path, statistics) for each file in the order they were loaded
+# the files are split into pieces (compressed files are one piece each) that are parsed by a pool of worker processes
+# working ahead across file boundaries, while this process writes the rows of one file after another, so SQLite only
+# ever has a single writer, compressed files larger than parallel_compressed_size are streamed by the writer itself
+# progress is called with the bytes done and the total bytes of every file, and host is recorded for every file
+# (by default the name of the folder holding each one, see default_host)
+# if the load is cancelled, the file being loaded is undone (see load_file) and the files after it are not loaded
+def load_files(conn, paths, progress=None, workers=None, cancelled=None, log_format=None, host=None):
+  workers = workers or worker_count
+  files = find_log_files(paths)
+  # with a single worker there is nothing to overlap, so load one file after another
+  if workers <= 1 or len(files) <= 1:
+    results = []
+    for path in files:
+      if cancelled and cancelled():
+        break
+      results.append((path, load_file(conn, path, progress, workers, cancelled, log_format, host)))
+    return results
+  with metrics.profile_operation("load"):
+    return load_in_parallel(conn, [plan_load(conn, path) for path in files], progress, workers, cancelled, log_format, host)
+
+# load_in_parallel takes in a database connection and a list of plans from plan_load along with the parameters of
+# load_files, and loads the files with a pool of parsing processes (see load_files)
+def load_in_parallel(conn, plans, progress, workers, cancelled, log_format, host):
+  # the process pool is only imported when files are actually parsed in parallel
+  from concurrent.futures import ProcessPoolExecutor
+  total = sum(plan["end"] - plan["start"] for plan in plans) or 1
+  # the pieces of every file that are parsed by the workers, in the order they are loaded
+  # (files that are already loaded have no pieces)
+  pieces = ((i, start, end) for i, plan in enumerate(plans) if plan["start"] < plan["end"] and not streamed(plan)
+            for start, end in (split_file(plan["path"], start=plan["start"], end=plan["end"])
+                               if not plan["compressed"] else [(0, plan["info"].st_size)]))
+  results = []
+  done = [0]
+  # if there are no logs yet, the indexes are dropped once, and they are built once all of the files are loaded
+  # (along with the indexes of any partition the files added)
+  if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM logs)").fetchone()[0]:
+    drop_indexes(conn)
+  try:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      # the pieces currently being parsed, oldest first, as (file number, future)
+      pending = deque()
+      # inner function top_up keeps a couple of pieces per worker in flight so parsed rows do not pile up in memory
+      def top_up():
+        while len(pending) < workers * 2:
+          piece = next(pieces, None)
+          if piece is None:
+            return
+          i, start, end = piece
+          pending.append((i, pool.submit(parse_chunk, plans[i]["path"], start, end, log_format)))
+      # inner function file_progress reports the progress of one file as progress through every file
+      def file_progress(plan):
+        base = done[0] - plan["start"]
+        return lambda position, size: progress(base + position, total) if progress else None
+      try:
+        for i, plan in enumerate(plans):
+          if cancelled and cancelled():
+            break
+          stats = new_load_stats()
+          # a file that is already loaded is only reported
+          if plan["start"] >= plan["end"]:
+            stats["start"] = plan["start"]
+            results.append((plan["path"], stats))
+            continue
+          top_up()
+          last_id = last_row_id(conn)
+          source = source_id(conn, plan["path"], host)
+          if streamed(plan):
+            batches = parse_batches(stream_lines(plan["path"], file_progress(plan)), stats, log_format)
+          else:
+            batches = piece_batches(i, pending, top_up, stats, file_progress(plan))
+          try:
+            load_batches(conn, batches, stats, cancelled, source, defer_indexes=True)
+          except BaseException:
+            abandon_load(conn, last_id, source)
+            raise
+          results.append((plan["path"], finish_load(conn, plan, stats, last_id, source)))
+          done[0] += plan["end"] - plan["start"]
+          if stats["cancelled"]:
+            break
+      finally:
+        # throw away the pieces that were parsed ahead but will not be loaded
+        for _, future in pending:
+          future.cancel()
+  finally:
+    with metrics.timer("index"):
+      create_indexes(conn)
+  return results
+
+# streamed takes in a plan from plan_load and returns whether the file is streamed by the writer instead of being parsed
+# by a worker, which is the case for compressed files too large to hand to a worker as a whole
+def streamed(plan):
+  return plan["compressed"] and plan["info"].st_size > parallel_compressed_size
+
+# piece_batches takes in a file number, the deque of (file number, future) pieces being parsed, the function that keeps
+# the workers busy, a statistics dictionary and a progress function, and yields the parsed rows of each piece of that
+# file in order, until the oldest piece belongs to another file
+def piece_batches(i, pending, top_up, stats, progress):
+  while True:
+    top_up()
+    if not pending or pending[0][0] != i:
+      return
+    yield collect_chunk(pending.popleft()[1], stats, None, progress)
+
+# setup_database takes in a database connection and creates every table, index and trigger that does not exist yet
+# if the database was created by a version of sploosh with a different layout, its tables are dropped and rebuilt first
+def setup_database(conn):
+  with conn:
+    conn.execute(create_meta_command)
+    for name in ("data_version", "last_row_id", "partitions_dropped"):
+      conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES (?, 0)", (name,))
+    conn.execute(create_query_cache_command)
+    # search results saved by older versions are no longer read (see query_cache_persist)
+    conn.execute("""DELETE FROM query_cache WHERE key LIKE '["search"%'""")
+    if conn.execute("PRAGMA user_version").fetchone()[0] != schema_version:
+      # logs_fts is the full-text table of older versions, which indexed every row instead of every distinct value
+      for table in ("logs_fts", "files", "sources", "partitions", *rollup_tables, *dictionary_tables.values(), *(f"{dictionary_tables[column]}_fts" for column in fts_columns)):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+      # logs was a table in older versions and is now a view of the partitions (ex. logs_20241010)
+      for kind, name in conn.execute(r"SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view') AND (name = 'logs' OR name LIKE 'logs\_%' ESCAPE '\')").fetchall():
+        conn.execute(f"DROP {kind} IF EXISTS {name}")
+      conn.execute("UPDATE meta SET value = 0 WHERE name = 'last_row_id'")
+      # ids cached for the old dictionary tables are no longer valid, and neither are results read from the old tables
+      forget_interned(conn)
+      bump_data_version(conn)
+    conn.execute(create_partitions_command)
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'logs')").fetchone()[0]:
+      update_logs_view(conn)
+    conn.execute(create_files_command)
+    conn.execute(create_sources_command)
+    for table in dictionary_tables.values():
+      conn.execute(create_dictionary_command.format(table=table))
+    for column in fts_columns:
+      conn.execute(create_fts_command.format(table=dictionary_tables[column]))
+      conn.execute(create_fts_trigger_command.format(table=dictionary_tables[column]))
+    for table in rollup_tables:
+      conn.execute(create_rollup_command.format(table=table))
+    conn.execute(f"PRAGMA user_version = {schema_version}")
+  # create the indexes on every partition
+  create_indexes(conn)
+
+# inotify_watch takes in a directory path and returns an inotify file descriptor that becomes readable whenever a
+# file in the directory is written to, created or renamed, or None if inotify is not available (ex. not on Linux)
+def inotify_watch(directory):
+  # ctypes is only imported when a file is actually followed
+  import ctypes
+  import ctypes.util
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK)
+  except (OSError, AttributeError, TypeError):
+    return None
+  if fd < 0:
+    return None
+  if libc.inotify_add_watch(fd, os.fsencode(directory), inotify_events) < 0:
+    os.close(fd)
+    return None
+  return fd
+
+# watch_file takes in a file path and returns a wait function and a close function
+# wait(timeout) returns as soon as the file's directory changes (using inotify), or after timeout seconds at the latest,
+# so on systems without inotify it simply polls
+def watch_file(path):
+  fd = inotify_watch(os.path.dirname(os.path.abspath(path)))
+  # fall back to polling
+  if fd is None:
+    return time.sleep, lambda: None
+  # inner function wait blocks until there are inotify events or the timeout passes, then throws the events away
+  def wait(timeout):
+    if select.select([fd], [], [], timeout)[0]:
+      try:
+        os.read(fd, 65536)
+      except BlockingIOError:
+        pass
+  return wait, lambda: os.close(fd)
+
+# load_appended takes in a database connection and the path of a file being followed and loads the complete lines
+# added to the file since it was last loaded (up to follow_max_bytes at a time) in a single transaction
+# a line that is still being written (no newline yet) is left for the next call
+# returns the list of rows that were inserted
+def load_appended(conn, path, log_format=None, host=None):
+  info = os.stat(path)
+  head = read_head(path)
+  # compressed files are never appended to
+  if log_compression(path) is not None:
+    return []
+  start = file_start(conn, path, info, head)
+  if start >= info.st_size:
+    return []
+  # read the new bytes and cut them after the last complete line
+  with open(path, 'rb') as file:
+    file.seek(start)
+    data = file.read(min(info.st_size - start, follow_max_bytes))
+  cut = data.rfind(b'\n') + 1
+  if not cut:
+    return []
+  lines = split_lines(data[:cut])
+  with metrics.timer("parse", len(lines)):
+    rows = [row for row in parse_lines(get_parser(log_format), lines) if row is not None]
+  metrics.count_event("lines_read", len(lines))
+  metrics.count_event("rows_loaded", len(rows))
+  metrics.count_event("rejected_lines", len(lines) - len(rows))
+  source = source_id(conn, path, host) if rows else None
+  # insert the rows and move the file's offset forward together so a crash cannot load a line twice
+  with conn:
+    if rows:
+      insert_rows(conn, rows, source)
+    record_file(conn, path, info, head, start + cut)
+  return rows
+
+# follow_file takes in a database connection and a file path and keeps loading lines as they are added to the file
+# (like tail -f) until cancelled returns True, catching up on anything added since the file was last loaded first
+# on_rows is called with the list of rows inserted by every micro-batch
+# returns the total number of rows inserted
+def follow_file(conn, path, on_rows=None, cancelled=None, log_format=None, host=None):
+  path = os.path.abspath(path)
+  total = 0
+  wait, close = watch_file(path)
+  try:
+    while not (cancelled and cancelled()):
+      rows = load_appended(conn, path, log_format, host)
+      total += len(rows)
+      if rows and on_rows:
+        on_rows(rows)
+      # only wait when caught up, otherwise carry on with the next micro-batch straight away
+      if len(rows) == 0:
+        wait(follow_interval)
+  finally:
+    close()
+  return total
+
+# comparison operators allowed in a count filter
+filter_operators = ("<=", ">=", "!=", "=", "<", ">")
+
+# columns of the logs table that hold integers
+integer_columns = ("timestamp", "status", "packet_size", "response_time")
+
+# functions used to check a filter against parsed rows, for each operator in filter_operators
+filter_functions = {"<=": operator.le, ">=": operator.ge, "!=": operator.ne, "=": operator.eq, "<": operator.lt, ">": operator.gt}
+
+# name used in a filter to match the host that wrote the rows (ex. 'host = web01', see source_id)
+host_filter = "host"
+
+# parse_filter takes in a filter string such as 'status >= 500' and returns an SQL condition along with its parameters
+# the column can be given by its column name or its dropdown label, raises ValueError if the filter is not valid
+def parse_filter(text):
+  column, op, value = split_filter(text)
+  if column == host_filter:
+    return host_condition(value, op)
+  if column in dictionary_tables:
+    return dictionary_condition(column, f"value {op} ?"), (value,)
+  return f"{column} {op} ?", (value,)
+
+# filter_rows takes in a filter string (see parse_filter) and returns a function that checks whether a parsed row
+# (as returned by parse_line) read from a file written by host passes the filter
+def filter_rows(text):
+  column, op, value = split_filter(text)
+  check = filter_functions[op]
+  if column == host_filter:
+    return lambda row, host=None: host is not None and check(host, value)
+  index = log_columns.index(column)
+  # a field missing from the log format never passes
+  return lambda row, host=None: row[index] is not None and check(row[index], value)
+
+# filter_span takes in a filter string (see parse_filter) and returns the time range (start, end) of the rows that can
+# pass it, with None for an end that is not limited, so only the partitions holding that range need to be read
+def filter_span(text):
+  column, op, value = split_filter(text)
+  if column != "timestamp" or op == "!=":
+    return None, None
+  return (value if op in (">", ">=", "=") else None), (value if op in ("<", "<=", "=") else None)
+
+# host_condition takes in a host and a comparison operator and returns an SQL condition along with its parameters
+# that matches the rows loaded from the files of that host (see source_id)
+def host_condition(host, op="="):
+  return host_condition_command.format(op=op), (host,)
+
+# column_name takes in a column name or dropdown label (ex. 'status' or 'Status') and returns the column name
+# raises ValueError if it is not a column of the logs table
+def column_name(text):
+  # look up the column by its dropdown label if needed
+  labels = {label.lower(): name for label, name in dropdown_dict.items()}
+  column = labels.get(text.strip().lower(), text.strip())
+  if column not in log_columns:
+    raise ValueError(f"unknown column: {text}")
+  return column
+
+# split_filter takes in a filter string and returns its column, operator and value (converted to the column's type)
+def split_filter(text):
+  # find the first operator in the filter (two character operators are checked first)
+  for op in filter_operators:
+    if op in text:
+      column, value = (part.strip() for part in text.split(op, 1))
+      break
+  else:
+    raise ValueError(f"no comparison operator in filter: {text}")
+  # the host is not a column of the logs table, but can be filtered on like one
+  column = host_filter if column.lower() == host_filter else column_name(column)
+  # convert the value to the type stored in the column
+  if column == "timestamp":
+    value = parse_time(value)[0]
+  elif column in integer_columns:
+    value = int(value)
+  # remove quotes from around text values
+  else:
+    value = value.strip("'\"")
+  return column, op, value
+
+# The count function will count the occurences of each value of a log field
+# the counting is done by SQLite with a GROUP BY on every partition (which uses the column's index when it has one),
+# with the partitions counted at the same time (see fan_out), and the counts of every partition are added together and
+# yielded as (value, count) pairs from most to least common
+# columns kept in dictionary tables are grouped by their ids, and only the distinct ids are turned back into text
+# top_n limits the results to the most common values, and condition/params filter the rows being counted (see parse_filter)
+# start and end (in seconds since the epoch) limit the count to the partitions holding that time range, the condition
+# still has to limit the rows to the range itself (ex. 'timestamp BETWEEN ? AND ?', see filter_span)
+def count(search_cur, term, top_n=None, condition=None, params=(), start=None, end=None):
+  # only allow real columns since the column name is placed directly into the SQL command
+  if term not in dropdown_dict.values():
+    raise ValueError(f"unknown column: {term}")
+  where = f' WHERE {condition}' if condition else ''
+  # create the SQL command to count each value of the column in a partition
+  column = f'{term}_id' if term in dictionary_tables else term
+  query = f'SELECT {column}, COUNT(*) FROM {{table}}{where} GROUP BY 1'
+  conn = search_cur.connection
+  # most common first, then in order of value (with no value first, as SQLite sorts NULL)
+  order = f' ORDER BY 2 DESC, 1 LIMIT {int(top_n) if top_n else -1}'
+  # inner function run_count counts every partition and adds the counts together
+  def run_count():
+    tables = partition_tables(conn, start, end)
+    if not tables:
+      return
+    # a single partition (ex. a count over the last hour) is sorted and cut to top_n by SQLite, with the ids of the
+    # values turned back into text for only the rows returned
+    if len(tables) == 1:
+      if term in dictionary_tables:
+        table = dictionary_tables[term]
+        yield from conn.execute(f'SELECT {table}.value, total FROM (SELECT {column} AS value_id, COUNT(*) AS total FROM {tables[0]}{where} GROUP BY 1) '
+                                f'JOIN {table} ON {table}.id = value_id{order}', params)
+      else:
+        yield from conn.execute(query.format(table=tables[0]) + order, params)
+      return
+    totals = Counter()
+    for rows in fan_out(conn, tables, query, params):
+      for value, total in rows:
+        totals[value] += total
+    # turn the ids back into text (rows without a value are left out, the same as a join would)
+    if term in dictionary_tables:
+      table = dictionary_tables[term]
+      ids = json.dumps([value_id for value_id in totals if value_id is not None])
+      values = dict(conn.execute(f'SELECT id, value FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (ids,)))
+      totals = {values[value_id]: total for value_id, total in totals.items() if value_id in values}
+    # most common first, then in order of value (with no value first, as SQLite sorts NULL)
+    key = lambda item: (-item[1], item[0] is not None, item[0])
+    yield from heapq.nsmallest(int(top_n), totals.items(), key=key) if top_n else sorted(totals.items(), key=key)
+  # yield the results, or those cached if the same count was run since the logs last changed
+  yield from metrics.timed_pages("count", cached_rows(conn, ("count", query, params, top_n, start, end), run_count))
+
+# rollup takes in a cursor, the start and end of a time range (in seconds since the epoch, None for no limit) and a
+# bucket size in seconds, and returns an iterator of (bucket start, requests, errors, bytes, average response time, maximum response time)
+# for every bucket with requests in it, read from the rollup tables instead of the logs table
+# group ("endpoint" or "status") splits every bucket up by that column, placing its value after the bucket start,
+# and endpoint and status only add up the requests with that endpoint or status
+# the range is widened to whole buckets of the rollup table used, raises ValueError if size is not a whole number of minutes
+def rollup(search_cur, start=None, end=None, size=3600, group=None, endpoint=None, status=None):
+  # use the hour table when the buckets are whole hours, since it has sixty times fewer rows
+  table = "rollup_hour" if size % rollup_tables["rollup_hour"] == 0 else "rollup_minute"
+  if size <= 0 or size % rollup_tables[table]:
+    raise ValueError(f"bucket size must be a whole number of minutes: {size}")
+  if group not in (None, "endpoint", "status"):
+    raise ValueError(f"rollups can only be grouped by endpoint or status: {group}")
+  conditions = []
+  params = []
+  if start is not None:
+    conditions.append("bucket >= ?")
+    params.append(start // rollup_tables[table] * rollup_tables[table])
+  if end is not None:
+    conditions.append("bucket <= ?")
+    params.append(end)
+  if endpoint is not None:
+    conditions.append("endpoint_id = (SELECT id FROM endpoints WHERE value = ?)")
+    params.append(endpoint)
+  if status is not None:
+    conditions.append("status = ?")
+    params.append(int(status))
+  columns = f"bucket / {size} * {size}"
+  if group == "endpoint":
+    columns += ", (SELECT value FROM endpoints WHERE id = endpoint_id)"
+  elif group:
+    columns += f", {group}"
+  query = f"SELECT {columns}, SUM(requests), SUM(errors), SUM(bytes), SUM(rt_sum) * 1.0 / NULLIF(SUM(rt_count), 0), MAX(rt_max) FROM {table}"
+  if conditions:
+    query += " WHERE " + " AND ".join(conditions)
+  # within each bucket, the groups with the most requests come first
+  query += " GROUP BY 1, 2 ORDER BY 1, 3 DESC, 2" if group else " GROUP BY 1 ORDER BY 1"
+  return search_cur.execute(query, params)
+
+# search_condition takes in a search term and category and returns an SQL condition along with its parameters
+# each category is searched in a way that can use its index where one exists:
+#   status is matched exactly, timestamps are matched to the second (or the whole day, hour or minute if cut short),
+#   IP addresses are matched by prefix, endpoints, referrers and user agents are substring searched through the
+#   full-text tables of their dictionary tables, and every other category falls back to a LIKE substring search
+#   (columns kept in dictionary tables are searched by finding the matching values there and then the rows with their ids)
+def search_condition(term, cat):
+  # status codes are stored as integers
+  if cat == "status" and term.strip().isdigit():
+    return "status = ?", (int(term),)
+  # packet size and response time are stored as integers
+  if cat in ("packet_size", "response_time") and term.strip().isdigit():
+    return f"{cat} = ?", (int(term),)
+  # timestamps are stored as epoch seconds
+  if cat == "timestamp":
+    # a time cut short (ex. the date 10/Oct/2024 or the minute 10/Oct/2024:13:55) matches all of the time it covers
+    try:
+      start, end = parse_time(term)
+    except ValueError:
+      # an invalid timestamp cannot match anything
+      return "0", ()
+    if start == end:
+      return "timestamp = ?", (start,)
+    return "timestamp BETWEEN ? AND ?", (start, end)
+  # the trigram index can only be used for terms of at least three characters
+  if cat in fts_columns and len(term) >= 3:
+    # the term is quoted (with any quotes inside it doubled) so it is matched as a plain substring of the value
+    table = dictionary_tables[cat]
+    return f"{cat}_id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)", (f'"{term.replace(chr(34), chr(34) * 2)}"',)
+  # a prefix match is the same as a range from the prefix up to the prefix followed by the highest character
+  if cat == "ip_addr" and term:
+    return dictionary_condition(cat, "value >= ? AND value < ?"), (term, term + "\U0010ffff")
+  # everything else is a substring search
+  if cat in dictionary_tables:
+    return dictionary_condition(cat, "value LIKE ?"), (f'%{term}%',)
+  return f"{cat} LIKE ?", (f'%{term}%',)
+
+# dictionary_condition takes in a column kept in a dictionary table and an SQL condition on the values of that table
+# and returns an SQL condition that matches the rows of the logs table whose value meets it
+def dictionary_condition(column, condition):
+  return f"{column}_id IN (SELECT id FROM {dictionary_tables[column]} WHERE {condition})"
+
+# check_query_plans takes in a cursor and runs EXPLAIN QUERY PLAN on the search for every category using plan_samples
+# returns a dictionary of each category with whether the search uses an index and the plan SQLite chose
+def check_query_plans(cursor):
+  plans = {}
+  tables = partition_tables(cursor.connection)
+  table = tables[-1] if tables else "logs"
+  for cat, sample in plan_samples.items():
+    # ranged categories are searched with a BETWEEN, just like searchFileRange
+    if cat in ("packet_size", "response_time"):
+      low, high = sample.split("-")
+      condition, params = f"{cat} BETWEEN ? AND ?", (int(low), int(high))
+    else:
+      condition, params = search_condition(sample, cat)
+    # the detail of each plan step is the last item of the row (every partition has the same indexes, so the newest is checked)
+    steps = [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {table} WHERE {condition}", params)]
+    # only the step reading the partition itself counts, since a scan of it is slow even if the dictionary lookup
+    # before it uses an index (SQLite only calls a step SEARCH when it uses an index or the row id)
+    plans[cat] = (any(step.startswith(f"SEARCH {table} ") for step in steps), "; ".join(steps))
+  return plans
+
+# search_pages takes in a cursor and an SQL condition with its parameters and yields the matching rows of the logs one
+# page (a list of at most size rows) at a time, in the order they were read from the files
+# every partition is searched on its own cursor, one after another, and rows are only fetched from SQLite as each page
+# is asked for, so only one page is ever held in memory
+# start and end (in seconds since the epoch) limit the search to the partitions holding that time range (see search_span)
+# after is the id of the last row already shown, so only the rows after it are searched (the rows come in order of
+# their ids), which lets the pages be read one at a time by separate queries instead of holding one query open
+def search_pages(cursor, condition, params, size=None, start=None, end=None, after=None):
+  size = size or page_size
+  # inner function search_group reads the matching rows of a group of partitions, merging them back together by their ids
+  def search_group(tables):
+    # create separate cursors so that other queries on the connection do not interrupt the search
+    page_cursors = []
+    try:
+      for table in tables:
+        page_cursor = cursor.connection.cursor()
+        if after is None:
+          page_cursor.execute(f'{select_rows_command.format(table=table)} WHERE {condition} ORDER BY {table}.id', params)
+        else:
+          page_cursor.execute(f'{select_rows_command.format(table=table)} WHERE ({condition}) AND {table}.id > ? ORDER BY {table}.id', (*params, after))
+        page_cursors.append(page_cursor)
+      yield from page_cursors[0] if len(page_cursors) == 1 else heapq.merge(*page_cursors, key=lambda row: row[0])
+    finally:
+      for page_cursor in page_cursors:
+        page_cursor.close()
+  # inner function run_search reads the matching rows of every partition from the database as they are needed
+  def run_search():
+    for tables in id_groups(cursor.connection, partition_tables(cursor.connection, start, end)):
+      yield from search_group(tables)
+  # the rows come from the cache if the same search was run since the logs last changed
+  rows = cached_rows(cursor.connection, ("search", condition, tuple(params), start, end, after), run_search)
+  # inner function pages splits the rows up into pages
+  def pages():
+    while True:
+      page = list(itertools.islice(rows, size))
+      if not page:
+        return
+      yield page
+  yield from metrics.timed_pages("search", pages())
+
+# data_version takes in a database connection and returns the number of times the logs in it have changed
+def data_version(conn):
+  return conn.execute("SELECT value FROM meta WHERE name = 'data_version'").fetchone()[0]
+
+# bump_data_version takes in a database connection and records that the logs have changed without committing
+# every cached result read before the change is thrown away
+def bump_data_version(conn):
+  conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'data_version'")
+  conn.execute("DELETE FROM query_cache")
+
+# remember_rows takes in a cache key, a data version and a list of rows and keeps them in the memory cache,
+# forgetting the least recently used results if there are too many or they hold too many rows between them
+def remember_rows(key, version, rows):
+  with query_cache_lock:
+    query_cache[key] = (version, rows)
+    query_cache.move_to_end(key)
+    total = sum(len(cached[1]) for cached in query_cache.values())
+    while len(query_cache) > query_cache_size or total > query_cache_rows:
+      total -= len(query_cache.popitem(last=False)[1][1])
+      query_cache_stats["evictions"] += 1
+
+# save_rows takes in a database connection, a cache key, a data version and a list of rows and saves them in the
+# query_cache table, forgetting the oldest results there if there are too many
+# saving is skipped if the database is busy (ex. a file is being loaded), without waiting for it, since the result
+# is only a shortcut
+def save_rows(conn, key, version, rows):
+  timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+  conn.execute("PRAGMA busy_timeout = 0")
+  try:
+    with conn:
+      conn.execute("INSERT OR REPLACE INTO query_cache (key, data_version, rows, used_at) VALUES (?, ?, ?, ?)",
+                   (key, version, json.dumps(rows), time.time_ns()))
+      conn.execute("DELETE FROM query_cache WHERE key NOT IN (SELECT key FROM query_cache ORDER BY used_at DESC LIMIT ?)", (query_cache_size,))
+  except sqlite3.OperationalError:
+    pass
+  finally:
+    conn.execute(f"PRAGMA busy_timeout = {timeout}")
+
+# load_rows takes in a database connection, a cache key and a data version and returns the rows saved in the
+# query_cache table for that key at that version, or None if there are none
+def load_rows(conn, key, version):
+  saved = conn.execute("SELECT rows FROM query_cache WHERE key = ? AND data_version = ?", (key, version)).fetchone()
+  if saved is None:
+    return None
+  # JSON has no tuples, so turn each row back into one
+  return [tuple(row) for row in json.loads(saved[0])]
+
+# cached_rows takes in a database connection, a key made up of the kind of query and everything it depends on
+# (ex. ("count", query, params)) and a function that runs the query and returns an iterable of rows, and yields the rows
+# the rows come from the cache if the same query has been run since the logs last changed (see data_version),
+# otherwise the query is run and its rows are yielded as they are read and cached once they have all been read
+# (results of more than query_cache_rows rows, or that are not read to the end, are not cached)
+def cached_rows(conn, key, run):
+  if not query_cache_enabled:
+    yield from run()
+    return
+  version = data_version(conn)
+  saved_key = json.dumps(key)
+  # only counts are saved in the query_cache table (see query_cache_persist)
+  persist = query_cache_persist and key[0] == "count"
+  # the same query on different databases gives different results, so the memory cache is also keyed by the database file
+  # an in-memory database has no file to tell it apart from the others, so only its counts are cached, in its own
+  # query_cache table
+  db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+  memory_key = (db_file, saved_key) if db_file else None
+  rows = None
+  if memory_key is not None:
+    with query_cache_lock:
+      cached = query_cache.get(memory_key)
+      if cached is not None and cached[0] == version:
+        query_cache.move_to_end(memory_key)
+        query_cache_stats["hits"] += 1
+        rows = cached[1]
+  if rows is None and persist:
+    rows = load_rows(conn, saved_key, version)
+    if rows is not None:
+      query_cache_stats["disk_hits"] += 1
+      if memory_key is not None:
+        remember_rows(memory_key, version, rows)
+  if rows is not None:
+    yield from rows
+    return
+  query_cache_stats["misses"] += 1
+  # read the rows, keeping a copy of them until there are too many to cache
+  rows = []
+  for row in run():
+    if rows is not None:
+      rows.append(row)
+      if len(rows) > query_cache_rows:
+        rows = None
+    yield row
+  if rows is None:
+    query_cache_stats["uncached"] += 1
+    return
+  if memory_key is not None:
+    remember_rows(memory_key, version, rows)
+  if persist:
+    save_rows(conn, saved_key, version, rows)
+
+# cache_stats takes in a database connection and returns a dictionary of how the query cache has been used since the
+# program started, along with the number of results cached in memory and in the database and the current data_version
+def cache_stats(conn):
+  stats = dict(query_cache_stats)
+  looked_up = stats["hits"] + stats["disk_hits"] + stats["misses"]
+  stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / looked_up if looked_up else 0.0
+  with query_cache_lock:
+    stats["memory_entries"] = len(query_cache)
+  stats["saved_entries"] = conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+  stats["data_version"] = data_version(conn)
+  return stats
+
+# clear_cache takes in a database connection and forgets every cached result, in memory and in the database
+def clear_cache(conn):
+  with query_cache_lock:
+    query_cache.clear()
+  with conn:
+    conn.execute("DELETE FROM query_cache")
+
+# format_rows takes in a list of rows from the logs table and returns them as a formatted string
+def format_rows(rows):
+  # collect the lines for every row and join them together once at the end
+  lines = []
+  for row in rows:
+    # for every field of the row (skipping the id)
+    for i in range(1, len(row)):
+      lines.append(dict_legend[i] + format_field(i, row[i]) + "\n")
+    # two newlines separate each row
+    lines.append("\n\n")
+  return "".join(lines)
+
+# write_output takes in a cursor and an SQL condition with its parameters and writes every matching row to output.txt
+# the rows are read and written a page at a time so memory stays constant no matter how many rows match
+# returns the number of rows written, and stops early if cancelled is given and returns True
+# start and end limit the search to the partitions holding that time range (see search_pages)
+def write_output(cursor, condition, params, filename="output.txt", cancelled=None, start=None, end=None):
+  written = 0
+  # the rows are written to a temporary file first so that searches running at the same time do not mix their output
+  temp_filename = f"{filename}.{threading.get_ident()}.tmp"
+  try:
+    with metrics.profile_operation("search"), open(temp_filename, "w", buffering=1024 * 1024) as file:
+      for rows in search_pages(cursor, condition, params, output_page_size, start, end):
+        if cancelled and cancelled():
+          break
+        with metrics.timer("format", len(rows)):
+          text = format_rows(rows)
+        with metrics.timer("write", len(rows)):
+          file.write(text)
+        written += len(rows)
+  # throw the partial results away if the search failed or was cancelled, otherwise replace the output file with them
+  except BaseException:
+    os.remove(temp_filename)
+    raise
+  if cancelled and cancelled():
+    os.remove(temp_filename)
+  else:
+    os.replace(temp_filename, filename)
+  return written
+
+# searchFile performs a search in the database based on a given term and category and the cursor for the SQL database
+# every result is written to output.txt and a generator of result pages (see search_pages) is returned
+def searchFile(cursor, term, cat):
+  # create an SQL condition for the category and term, and find the days it can match
+  condition, params = search_condition(term, cat)
+  start, end = search_span(term, cat)
+  # write the results to output.txt
+  write_output(cursor, condition, params, start=start, end=end)
+  # return the pages of results
+  return search_pages(cursor, condition, params, start=start, end=end)
+
+# range_condition takes in the two ends of a range and a category and returns an SQL condition along with its parameters
+# a time range runs from the start of the first time to the end of the second (see parse_time), so
+# '10/Oct/2024:13:00' to '13:15' covers 13:00:00 to 13:15:59 on the 10th
+def range_condition(term, term2, cat):
+  try:
+    if cat == "timestamp":
+      return 'timestamp BETWEEN ? AND ?', (parse_time(term)[0], parse_time(term2, term)[1])
+    return f'{cat} BETWEEN ? AND ?', (int(term), int(term2))
+  # if either end of the range is not a number, there are no results
+  except ValueError:
+    return '0', ()
+
+# search_span takes in a search term (and the end of a range if there is one) and a category and returns the time
+# range (start, end) that the search can match, so only the partitions holding it need to be searched
+# only timestamp searches are limited to a time range, every other search returns (None, None)
+def search_span(term, cat, term2=None):
+  if cat != "timestamp":
+    return None, None
+  try:
+    if term2 is None:
+      return parse_time(term)
+    return parse_time(term)[0], parse_time(term2, term)[1]
+  # an invalid timestamp matches nothing (see search_condition), so there is nothing to limit
+  except ValueError:
+    return None, None
+
+# searchFileRange performs a search in the database based on a range of terms (defined by term1 and term2) and category and the cursor for the SQL database
+# every result is written to output.txt and a generator of result pages (see search_pages) is returned
+def searchFileRange(cursor, term, term2, cat):
+  # create an SQL condition to retrieve items based on a range in a category, and find the days it can match
+  condition, params = range_condition(term, term2, cat)
+  start, end = search_span(term, cat, term2)
+  # write the results to output.txt
+  write_output(cursor, condition, params, start=start, end=end)
+  # return the pages of results
+  return search_pages(cursor, condition, params, start=start, end=end)
+
+### HEADLESS API ###
+
+# default_db_path returns the path of logs.db within the sploosh folder of the current working directory
+def default_db_path():
+  return os.path.join(os.getcwd(), data_directory, "logs.db")
+
+# connect takes in the path of a database (logs.db in the sploosh folder by default) and returns a connection to it
+# with every table set up, creating the folder that holds it if needed
+def connect(db_path=None):
+  db_path = db_path or default_db_path()
+  os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+  conn = sqlite3.connect(db_path, timeout=30)
+  setup_database(conn)
+  return conn
+
+# ingest takes in a database connection and a file path and loads the parts of the file that have not been loaded yet
+# returns a dictionary of statistics about the load (see load_file for the other parameters)
+def ingest(conn, path, progress=None, workers=None, cancelled=None, log_format=None, host=None):
+  return load_file(conn, path, progress, workers, cancelled, log_format, host)
+
+# ingest_many takes in a database connection and a list of file paths, folders and glob patterns and loads the parts of
+# every file they name that have not been loaded yet, returning a list of (path, statistics) (see load_files)
+def ingest_many(conn, paths, progress=None, workers=None, cancelled=None, log_format=None, host=None):
+  return load_files(conn, paths, progress, workers, cancelled, log_format, host)
+
+# sources takes in a cursor and returns a list of (path, host, rows) for every file rows have been loaded from
+def sources(cursor):
+  conn = cursor.connection
+  totals = Counter()
+  for rows in fan_out(conn, partition_tables(conn), "SELECT source_id, COUNT(*) FROM {table} GROUP BY 1"):
+    totals.update(dict(rows))
+  return [(path, host, totals[source]) for source, path, host in conn.execute("SELECT id, path, host FROM sources ORDER BY host, path")]
+
+# search takes in a cursor, a column and a search term and yields every matching row of the logs table in file order
+# if term2 is given, the rows with a value between term and term2 in the column are yielded instead
+# if host is given, only the rows loaded from the files of that host are yielded
+def search(cursor, cat, term, term2=None, host=None):
+  if term2 is None:
+    condition, params = search_condition(term, cat)
+  else:
+    condition, params = range_condition(term, term2, cat)
+  if host is not None:
+    extra, extra_params = host_condition(host)
+    condition, params = f"({condition}) AND {extra}", tuple(params) + extra_params
+  start, end = search_span(term, cat, term2)
+  for rows in search_pages(cursor, condition, params, output_page_size, start, end):
+    yield from rows
+
+### END OF HEADLESS API ###
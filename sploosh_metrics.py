@@ -0,0 +1,214 @@
+# Project Name: Sploosh
+#
+# sploosh_metrics.py
+# Instrumentation for Sploosh. sploosh_engine.py times each stage of loading a
+# file (reading, parsing, storing values, inserting, adding up rollups, committing
+# and indexing) and of answering a query (running it and writing its output), and
+# keeps counters such as the number of rejected lines. Queries also record how long
+# they took in a latency histogram. summary() returns everything as a dictionary
+# (the command line interface writes it as JSON) and format_summary() as a few
+# lines of text (shown in the GUI with "Show Stats").
+#
+# For a closer look at a slow operation, set the SPLOOSH_PROFILE environment
+# variable to a folder (or use --profile with sploosh_cli.py). Every load, count and
+# search is then run under cProfile and tracemalloc, and a report of where its time
+# and memory went is written to that folder.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import io
+import time
+import threading
+import itertools
+import contextlib
+
+# upper bounds in milliseconds of the buckets of the query latency histograms, the last bucket holds everything slower
+latency_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# number of functions and memory allocation sites listed in a profile report
+profile_lines = 25
+
+# folder that profile reports are written to, profiling is off while it is None
+profile_directory = os.environ.get("SPLOOSH_PROFILE") or None
+
+# total time, number of calls and number of items (ex. lines or rows) handled by each stage
+stages = {}
+
+# counters of things that happen while loading and querying (ex. rejected lines)
+counters = {}
+
+# histograms of how long each kind of query took (see record_latency)
+latencies = {}
+
+# the lock is held while the totals are updated, since the GUI loads and queries on several threads at once
+metrics_lock = threading.Lock()
+
+# per-thread state, used to know whether the current thread is already being profiled
+profile_local = threading.local()
+
+# numbers added to the names of profile reports so that reports written in the same second do not overwrite each other
+profile_ids = itertools.count(1)
+
+# reset forgets every timing, counter and histogram recorded so far
+def reset():
+  with metrics_lock:
+    stages.clear()
+    counters.clear()
+    latencies.clear()
+
+# add_time takes in the name of a stage, a number of seconds and the number of items handled and adds them to the stage's totals
+def add_time(stage, seconds, items=0):
+  with metrics_lock:
+    totals = stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "items": 0})
+    totals["calls"] += 1
+    totals["seconds"] += seconds
+    totals["items"] += items
+
+# count_event takes in the name of a counter and adds amount to it
+def count_event(name, amount=1):
+  with metrics_lock:
+    counters[name] = counters.get(name, 0) + amount
+
+# timer takes in the name of a stage and the number of items it handles and times the block of a with statement,
+# adding the time to the stage's totals (ex. with timer("parse", len(lines)): ...)
+@contextlib.contextmanager
+def timer(stage, items=0):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    add_time(stage, time.perf_counter() - start, items)
+
+# record_latency takes in the kind of query (ex. "count") and how many seconds it took and adds it to the kind's histogram
+def record_latency(kind, seconds):
+  milliseconds = seconds * 1000
+  # find the first bucket the latency fits in
+  bucket = next((i for i, bound in enumerate(latency_buckets) if milliseconds <= bound), len(latency_buckets))
+  with metrics_lock:
+    histogram = latencies.setdefault(kind, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "buckets": [0] * (len(latency_buckets) + 1)})
+    histogram["count"] += 1
+    histogram["seconds"] += seconds
+    histogram["max_seconds"] = max(histogram["max_seconds"], seconds)
+    histogram["buckets"][bucket] += 1
+
+# timed_pages takes in the kind of query and an iterable of pages (or rows) of results and yields them, recording the
+# time spent producing them (but not the time spent by the caller between them) as one query in the latency histogram
+# the query is recorded once the iterable runs out, or is closed early
+def timed_pages(kind, pages):
+  seconds = 0.0
+  pages = iter(pages)
+  try:
+    while True:
+      start = time.perf_counter()
+      try:
+        page = next(pages)
+      except StopIteration:
+        seconds += time.perf_counter() - start
+        return
+      seconds += time.perf_counter() - start
+      yield page
+  finally:
+    record_latency(kind, seconds)
+
+# percentile_bound takes in a latency histogram and a percentile and returns the upper bound in milliseconds of the
+# bucket holding that percentile (None if it is in the last bucket, which has no upper bound)
+def percentile_bound(histogram, point):
+  target = histogram["count"] * point / 100.0
+  total = 0
+  for i, requests in enumerate(histogram["buckets"]):
+    total += requests
+    if total >= target and requests:
+      return latency_buckets[i] if i < len(latency_buckets) else None
+  return None
+
+# bucket_label takes in the number of a histogram bucket and returns its label (ex. '<=5ms' or '>10000ms')
+def bucket_label(i):
+  return f"<={latency_buckets[i]}ms" if i < len(latency_buckets) else f">{latency_buckets[-1]}ms"
+
+# summary returns a dictionary of every stage's totals and throughput, the counters, and the latency histogram of
+# every kind of query along with its mean, maximum and approximate 50th, 95th and 99th percentiles
+def summary():
+  with metrics_lock:
+    result = {"stages": {}, "counters": dict(counters), "latency": {}}
+    for stage, totals in stages.items():
+      entry = dict(totals)
+      entry["items_per_sec"] = totals["items"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+      result["stages"][stage] = entry
+    for kind, histogram in latencies.items():
+      result["latency"][kind] = {
+        "count": histogram["count"],
+        "mean_ms": histogram["seconds"] * 1000 / histogram["count"],
+        "max_ms": histogram["max_seconds"] * 1000,
+        "p50_ms": percentile_bound(histogram, 50),
+        "p95_ms": percentile_bound(histogram, 95),
+        "p99_ms": percentile_bound(histogram, 99),
+        "buckets": {bucket_label(i): requests for i, requests in enumerate(histogram["buckets"]) if requests}
+      }
+  # the headline rates of a load
+  result["lines_parsed_per_sec"] = result["stages"].get("parse", {}).get("items_per_sec", 0.0)
+  result["rows_inserted_per_sec"] = result["stages"].get("insert", {}).get("items_per_sec", 0.0)
+  result["rejected_lines"] = result["counters"].get("rejected_lines", 0)
+  return result
+
+# format_summary returns the summary as a few lines of text, with the stages that took the most time first
+def format_summary():
+  stats = summary()
+  if not stats["stages"] and not stats["latency"]:
+    return "Nothing has been timed yet."
+  lines = []
+  if "parse" in stats["stages"]:
+    lines.append(f"Parsed {stats['lines_parsed_per_sec']:.0f} lines/sec, inserted {stats['rows_inserted_per_sec']:.0f} rows/sec, "
+                 f"{stats['rejected_lines']} lines rejected")
+  for stage, totals in sorted(stats["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+    lines.append(f"  {stage}: {totals['seconds']:.3f}s over {totals['calls']} calls")
+  for kind, latency in stats["latency"].items():
+    p95 = "?" if latency["p95_ms"] is None else f"<={latency['p95_ms']}"
+    lines.append(f"  {kind}: {latency['count']} queries, mean {latency['mean_ms']:.1f}ms, p95 {p95}ms, max {latency['max_ms']:.1f}ms")
+  return "\n".join(lines)
+
+# profile_operation takes in the name of an operation (ex. "load") and, while profile_directory is set, runs the block of
+# a with statement under cProfile and tracemalloc and writes a report of where its time and memory went to a file in
+# profile_directory, otherwise it does nothing
+# an operation started inside one that is already being profiled on the same thread is part of the outer report
+@contextlib.contextmanager
+def profile_operation(name):
+  if profile_directory is None or getattr(profile_local, "active", False):
+    yield
+    return
+  # the profilers are only imported when profiling is turned on
+  import cProfile
+  import pstats
+  import tracemalloc
+  profile_local.active = True
+  # tracemalloc traces every thread, so another thread may already have started it
+  started_tracing = not tracemalloc.is_tracing()
+  if started_tracing:
+    tracemalloc.start()
+  tracemalloc.reset_peak()
+  profiler = cProfile.Profile()
+  start = time.perf_counter()
+  profiler.enable()
+  try:
+    yield
+  finally:
+    profiler.disable()
+    seconds = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    if started_tracing:
+      tracemalloc.stop()
+    profile_local.active = False
+    # write the slowest functions and the largest allocations to the report
+    report = io.StringIO()
+    report.write(f"{name}: {seconds:.3f}s, peak traced memory {peak / 1024 / 1024:.1f} MB\n\n")
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(profile_lines)
+    report.write("Largest allocations still held at the end:\n")
+    for stat in snapshot.statistics("lineno")[:profile_lines]:
+      report.write(f"  {stat}\n")
+    os.makedirs(profile_directory, exist_ok=True)
+    path = os.path.join(profile_directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{next(profile_ids)}.txt")
+    with open(path, "w") as file:
+      file.write(report.getvalue())
@@ -0,0 +1,294 @@
+# Project Name: Sploosh
+#
+# sploosh_parsers.py
+# Parsers that turn lines of an access log into rows for the logs table.
+#
+# A parser is any function that takes in one line and returns a row tuple (in the
+# order of the logs table's columns) or None if the line cannot be read. The
+# default parser reads the Combined Log Format (with an optional response time on
+# the end, as written by Sploosh's own test logs) with plain string splitting, and
+# falls back to a regular expression for lines that do not split cleanly, such as
+# HTTP/2 requests, a "-" for the size or referrer or the Common Log Format.
+# Other layouts can be described with an nginx log_format string, which is compiled
+# into a parser of its own by compile_log_format.
+#
+# The default parser is used for the layouts it reads, not for its speed: it parses
+# about as many lines per second as the original regular expression did (while also
+# converting the fields for the logs table), so large files are loaded faster by
+# parsing them in several worker processes (see sploosh_engine.parallel_load).
+# Run this file on a log file to compare the speed of the parsers:
+#   python sploosh_parsers.py access.log
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import re as regex
+import gc
+import sys
+import time
+import calendar
+from datetime import datetime
+
+# regex pattern for logs
+# this is the original pattern, which only reads HTTP/1.1 lines with every field filled in
+# it is no longer used to load files, but is kept as the starting point for benchmark
+re_pat = regex.compile(
+    r'(?P<ip>[\d\.]+) - - \[(?P<timestamp>[^\]]+)\] "(?P<method>[A-Z]+) (?P<endpoint>[^ ]+) HTTP/1.1" '
+    r'(?P<status>\d+) (?P<packet_size>\d+) "(?P<referrer>[^"]+)" "(?P<user_agent>[^"]+)" (?P<response_time>\d+)'
+)
+
+# relaxed pattern used for lines the default parser cannot split, it accepts any protocol (or none), a user name with
+# spaces in it, '-' for the size, quotes escaped with a backslash, and lines without a referrer and user agent (Common Log Format)
+relaxed_pattern = regex.compile(
+    r'(\S+) \S+ .*?\[([^\]]+)\] "([A-Za-z]+) (\S+)(?: [A-Z]+/[\d.]+)?" (\d{3}) (\d+|-)'
+    r'(?: "((?:[^"\\]|\\.)*)" "((?:[^"\\]|\\.)*)")?(?: (\d+))?\s*$'
+)
+
+# month abbreviations used by access log timestamps and their numbers
+month_numbers = {
+  "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+  "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
+}
+
+# cache of the epoch time at midnight for each day (ex. '10/Oct/2024') seen while parsing timestamps
+day_cache = {}
+
+# cache of the epoch time of each timestamp (ex. '10/Oct/2024:13:55:36 -0700') seen by the default parser
+# busy logs repeat the same second over and over, so most lines are a single lookup
+second_cache = {}
+
+# most timestamps kept in second_cache, it is emptied once it holds this many (about a day of seconds)
+second_cache_size = 100000
+
+# named log formats that can be used instead of writing out an nginx log_format string
+log_formats = {
+  "combined": '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"',
+  "common": '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent'
+}
+
+# nginx variables that can be read into the logs table, with the field each one fills and the pattern it matches
+# ('request' is split into the method and endpoint, and request_time is in seconds and is stored in milliseconds)
+nginx_variables = {
+  "remote_addr": ("ip_addr", r"\S+"),
+  "time_local": ("timestamp", r"[^\]]+"),
+  "time_iso8601": ("iso_time", r"\S+"),
+  "msec": ("epoch_time", r"\d+(?:\.\d+)?"),
+  "request": ("request", r'(?:[^"\\]|\\.)*'),
+  "request_method": ("method", r"[A-Za-z]+"),
+  "request_uri": ("endpoint", r"\S+"),
+  "uri": ("endpoint", r"\S+"),
+  "status": ("status", r"\d{3}"),
+  "body_bytes_sent": ("packet_size", r"\d+|-"),
+  "bytes_sent": ("packet_size", r"\d+|-"),
+  "http_referer": ("referrer", r'(?:[^"\\]|\\.)*'),
+  "http_user_agent": ("user_agent", r'(?:[^"\\]|\\.)*'),
+  "request_time": ("response_time", r"\d+(?:\.\d+)?|-")
+}
+
+# pattern for a variable in an nginx log_format string (ex. $status or ${status})
+nginx_variable_pattern = regex.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+# parsers compiled by get_parser for each log format, so each format is only compiled once
+parser_cache = {}
+
+# parse_timestamp takes in an access log timestamp (ex. '10/Oct/2024:13:55:36 -0700') and returns it as seconds since the epoch
+# raises ValueError if the timestamp is not in the proper format
+def parse_timestamp(text):
+  try:
+    # the day part of the timestamp is converted once and cached since it repeats for every line of that day
+    day = text[:11]
+    base = day_cache.get(day)
+    if base is None:
+      base = calendar.timegm((int(day[7:11]), month_numbers[day[3:6]], int(day[0:2]), 0, 0, 0))
+      day_cache[day] = base
+    # add on the time of day
+    seconds = base + int(text[12:14]) * 3600 + int(text[15:17]) * 60 + int(text[18:20])
+    # subtract the timezone offset (if there is one) to get UTC
+    offset = text[21:26]
+    if offset:
+      sign = -1 if offset[0] == '-' else 1
+      seconds -= sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+    return seconds
+  except (KeyError, IndexError) as error:
+    raise ValueError(f"invalid timestamp: {text}") from error
+
+# parse_relaxed takes in a line and reads it with relaxed_pattern, returning a row tuple or None if it is not a log line
+def parse_relaxed(line):
+  match = relaxed_pattern.match(line)
+  if not match:
+    return None
+  ip_addr, timestamp, method, endpoint, status, packet_size, referrer, user_agent, response_time = match.groups()
+  try:
+    return (ip_addr, parse_timestamp(timestamp), method, endpoint, int(status), 0 if packet_size == "-" else int(packet_size),
+            "-" if referrer is None else referrer, "-" if user_agent is None else user_agent, None if response_time is None else int(response_time))
+  except ValueError:
+    return None
+
+# parse_default takes in a line in the Combined Log Format (optionally followed by a response time) and returns a row tuple,
+# or None if it is not a log line
+# the line is cut up at its quotes and spaces and the timestamp is looked up in second_cache, anything that does not
+# split into the expected pieces is passed to parse_relaxed
+def parse_default(line):
+  try:
+    head, request, middle, referrer, gap, user_agent, tail = line.split('"')
+    method, endpoint, protocol = request.split(" ")
+    status, packet_size = middle.split()
+    if gap != " " or head[-2:] != "] " or protocol[:5] != "HTTP/":
+      return parse_relaxed(line)
+    # the timestamp sits between ' [' and '] ' at the end of the head (ex. '10.0.0.1 - - [10/Oct/2024:13:55:36 -0700] ')
+    stamp = head[head.index(" [") + 2:-2]
+    timestamp = second_cache.get(stamp)
+    if timestamp is None:
+      if len(stamp) != 26:
+        return parse_relaxed(line)
+      if len(second_cache) >= second_cache_size:
+        second_cache.clear()
+      timestamp = second_cache[stamp] = parse_timestamp(stamp)
+    return (head[:head.index(" ")], timestamp, method, endpoint, int(status), 0 if packet_size == "-" else int(packet_size),
+            referrer, user_agent, int(tail) if tail else None)
+  except ValueError:
+    return parse_relaxed(line)
+
+# nginx_field_value takes in a field read by a compiled log format and the text matched for it and returns the value to store
+def nginx_field_value(field, text):
+  if field == "timestamp":
+    return parse_timestamp(text)
+  if field == "iso_time":
+    return int(datetime.fromisoformat(text).timestamp())
+  if field == "epoch_time":
+    return int(float(text))
+  if field == "status":
+    return int(text)
+  if field == "packet_size":
+    return 0 if text == "-" else int(text)
+  if field == "response_time":
+    return None if text == "-" else round(float(text) * 1000)
+  return text
+
+# compile_log_format takes in an nginx log_format string (ex. '$remote_addr [$time_local] "$request" $status') or the
+# name of one of the log_formats and returns a parser for lines written in that format
+# fields the format does not have are stored as '-' (or None for the response time), and variables that are not in
+# nginx_variables are matched but not stored, raises ValueError if the format has no time in it
+def compile_log_format(log_format):
+  log_format = log_formats.get(log_format, log_format)
+  pattern = ""
+  fields = []
+  position = 0
+  for match in nginx_variable_pattern.finditer(log_format):
+    pattern += regex.escape(log_format[position:match.start()])
+    name = match.group(1) or match.group(2)
+    quoted = log_format[:match.start()].endswith('"')
+    if name in nginx_variables:
+      field, variable_pattern = nginx_variables[name]
+      fields.append(field)
+      pattern += f"({variable_pattern})"
+    else:
+      # unknown variables are skipped over, up to the closing quote if they are quoted
+      pattern += r'(?:[^"\\]|\\.)*' if quoted else r"\S*"
+    position = match.end()
+  pattern += regex.escape(log_format[position:]) + r"\s*$"
+  if not {"timestamp", "iso_time", "epoch_time"} & set(fields):
+    raise ValueError(f"log format has no time in it: {log_format}")
+  compiled = regex.compile(pattern)
+  columns = ("ip_addr", "timestamp", "method", "endpoint", "status", "packet_size", "referrer", "user_agent", "response_time")
+
+  # parse takes in a line and returns a row tuple, or None if the line does not match the format
+  def parse(line):
+    match = compiled.match(line)
+    if not match:
+      return None
+    values = {"ip_addr": "-", "method": "-", "endpoint": "-", "status": None, "packet_size": 0, "referrer": "-", "user_agent": "-", "response_time": None}
+    try:
+      for field, text in zip(fields, match.groups()):
+        value = nginx_field_value(field, text)
+        if field in ("iso_time", "epoch_time"):
+          field = "timestamp"
+        # the request line holds the method, the endpoint and (usually) the protocol
+        if field == "request":
+          parts = value.split(" ")
+          if len(parts) < 2:
+            return None
+          values["method"], values["endpoint"] = parts[0], parts[1]
+        else:
+          values[field] = value
+    except ValueError:
+      return None
+    return tuple(values[column] for column in columns)
+  return parse
+
+# get_parser takes in a log format (None for the default parser, the name of one of the log_formats or an nginx
+# log_format string) and returns its parser
+def get_parser(log_format=None):
+  if not log_format:
+    return parse_default
+  if log_format not in parser_cache:
+    parser_cache[log_format] = compile_log_format(log_format)
+  return parser_cache[log_format]
+
+# parse_lines takes in a parser and a list of lines and returns a list of the row tuple (or None) for every line
+# the garbage collector is paused while the lines are parsed, since the thousands of new strings and tuples
+# would otherwise set off collections that look through every object over and over without freeing any
+def parse_lines(parser, lines):
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    return [parser(line) for line in lines]
+  finally:
+    if enabled:
+      gc.enable()
+
+# regex_groupdict takes in a line and splits it up with re_pat into its nine fields, the way lines were first read
+def regex_groupdict(line):
+  match = re_pat.match(line)
+  if not match:
+    return None
+  fields = match.groupdict()
+  ip = fields['ip']
+  timestamp = fields['timestamp']
+  method = fields['method']
+  endpoint = fields['endpoint']
+  status = fields['status']
+  packet_size = fields['packet_size']
+  referrer = fields['referrer']
+  user_agent = fields['user_agent']
+  response_time = fields['response_time']
+  return (ip, timestamp, method, endpoint, status, packet_size, referrer, user_agent, response_time)
+
+# regex_typed takes in a line and reads it with re_pat, converting the timestamp and numbers like the default parser does
+def regex_typed(line):
+  match = re_pat.match(line)
+  if not match:
+    return None
+  ip, timestamp, method, endpoint, status, packet_size, referrer, user_agent, response_time = match.groups()
+  return (ip, parse_timestamp(timestamp), method, endpoint, int(status), int(packet_size), referrer, user_agent, int(response_time))
+
+# benchmark takes in a list of lines and returns the lines per second of each way of parsing them, best of repeat runs
+# 'regex' is re_pat with groupdict (fields left as text), 'regex typed' is re_pat with the fields converted for the
+# logs table, and 'default' is the default parser run through parse_lines
+# the parsers take turns on every round and are timed by CPU time, so a busy machine slows all of them alike
+def benchmark(lines, repeat=5):
+  runs = {
+    "regex": lambda: [regex_groupdict(line) for line in lines],
+    "regex typed": lambda: [regex_typed(line) for line in lines],
+    "default": lambda: parse_lines(parse_default, lines)
+  }
+  best = {}
+  for _ in range(repeat):
+    for name, run in runs.items():
+      start = time.process_time()
+      run()
+      seconds = time.process_time() - start
+      best[name] = min(best.get(name, seconds), seconds)
+  return {name: len(lines) / seconds if seconds > 0 else 0.0 for name, seconds in best.items()}
+
+# main function - runs benchmark on the log file given on the command line
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print("usage: python sploosh_parsers.py access.log", file=sys.stderr)
+    sys.exit(2)
+  with open(sys.argv[1], encoding="utf-8", errors="replace") as file:
+    lines = file.read().splitlines()
+  results = benchmark(lines)
+  for name, lines_per_sec in results.items():
+    print(f"{name:>12}: {lines_per_sec:12.0f} lines/sec ({lines_per_sec / results['regex']:.2f}x)")
@@ -0,0 +1,86 @@
+# Project Name: Sploosh
+#
+# tests/conftest.py
+# Shared fixtures for the tests. Makes the modules at the top of the repository
+# importable, gives every test its own logs.db in a temporary folder and writes
+# small access logs made up of lines from log_line.
+#
+# Run the tests from the top of the repository with:
+#   python -m pytest tests
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sploosh_engine as engine
+
+# time of the first line of every test log (10/Oct/2024:00:00:00 +0000)
+first_time = 1728518400
+
+# log_line takes in a time (in seconds since the epoch) and the fields of a request and returns a line of an access
+# log in the Combined Log Format followed by a response time, as written by Sploosh's own test logs
+def log_line(seconds=first_time, ip="10.0.0.1", method="GET", endpoint="/index.html", status=200, size=100,
+             referrer="-", agent="curl/8.0", response_time=5):
+  return f'{ip} - - [{engine.format_timestamp(seconds)}] "{method} {endpoint} HTTP/1.1" {status} {size} "{referrer}" "{agent}" {response_time}'
+
+# write_log takes in a file path and a list of lines and writes them to the file, each followed by a newline unless
+# newline is False for the last one, and returns the path
+# the file is dated a minute back unless fresh is True, so its last line is not taken as still being written
+def write_log(path, lines, newline=True, fresh=False, mode="w"):
+  with open(path, mode, encoding="utf-8", newline="\n") as file:
+    file.write("\n".join(lines) + ("\n" if newline and lines else ""))
+  if not fresh:
+    past = time.time() - 60
+    os.utime(path, (past, past))
+  return str(path)
+
+# day_lines takes in a number of days and a number of lines per day and returns the lines of a log covering those days,
+# with the status, endpoint and user agent of each line cycling through a few values
+def day_lines(days, per_day):
+  lines = []
+  for day in range(days):
+    for i in range(per_day):
+      lines.append(log_line(first_time + day * engine.partition_size + i * (engine.partition_size // per_day),
+                            ip=f"10.0.{day}.{i % 7}", endpoint=f"/page/{i % 5}", status=(200, 404, 500)[i % 3],
+                            agent=("curl/8.0", "Googlebot/2.1")[i % 2], size=100 + i))
+  return lines
+
+# fixture providing log_line to the tests
+@pytest.fixture
+def line():
+  return log_line
+
+# fixture providing write_log to the tests
+@pytest.fixture
+def write():
+  return write_log
+
+# fixture providing day_lines to the tests
+@pytest.fixture
+def days():
+  return day_lines
+
+# fixture providing a connection to a new logs.db in a temporary folder, which is also the working folder of the test
+# (searches write output.txt there)
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  connection = engine.connect(str(tmp_path / "logs.db"))
+  yield connection
+  connection.close()
+
+# rows takes in a connection and returns the number of rows in the logs
+def rows(conn):
+  return conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+# fixture providing rows to the tests
+@pytest.fixture
+def count_rows():
+  return rows
@@ -0,0 +1,174 @@
+# Project Name: Sploosh
+#
+# tests/test_loading.py
+# Tests for loading log files into logs.db: loading only what was added since
+# the last load, rotated and compressed files, lines that are still being
+# written, and undoing a load that is cancelled or fails.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import os
+import gzip
+import pytest
+import sploosh_engine as engine
+
+# test_appended_lines_only checks that loading a file again only loads the lines added to it since
+def test_appended_lines_only(conn, tmp_path, write, days, count_rows):
+  lines = days(1, 100)
+  path = write(tmp_path / "access.log", lines[:60])
+  assert engine.ingest(conn, path, workers=1)["rows"] == 60
+  assert engine.ingest(conn, path, workers=1)["rows"] == 0
+  write(path, lines[60:], mode="a")
+  stats = engine.ingest(conn, path, workers=1)
+  assert stats["rows"] == 40 and stats["start"] > 0
+  assert count_rows(conn) == 100
+
+# test_renamed_file checks that a file renamed by logrotate is not loaded again, and that the new file written in
+# its place is loaded from the start
+def test_renamed_file(conn, tmp_path, write, days, count_rows):
+  lines = days(2, 50)
+  path = write(tmp_path / "access.log", lines[:50])
+  engine.ingest(conn, path, workers=1)
+  os.rename(path, tmp_path / "access.log.1")
+  write(path, lines[50:])
+  results = engine.ingest_many(conn, [str(tmp_path)], workers=1)
+  assert sorted(stats["rows"] for path, stats in results) == [0, 50]
+  assert count_rows(conn) == 100
+
+# test_compressed_rotation checks that a file compressed after being rotated (as with delaycompress) is recognised as
+# the file already loaded, and that the rest of the folder is still loaded
+def test_compressed_rotation(conn, tmp_path, write, days, count_rows):
+  lines = days(3, 1000)
+  path = write(tmp_path / "access.log", lines[:2000])
+  engine.ingest(conn, path, workers=1)
+  # rotate the file, then compress it on the next rotation, keeping its time as gzip does
+  os.rename(path, tmp_path / "access.log.1")
+  with open(tmp_path / "access.log.1", "rb") as source, gzip.open(tmp_path / "access.log.1.gz", "wb") as target:
+    target.write(source.read())
+  info = os.stat(tmp_path / "access.log.1")
+  os.utime(tmp_path / "access.log.1.gz", (info.st_atime, info.st_mtime - 60))
+  os.remove(tmp_path / "access.log.1")
+  write(path, lines[2000:])
+  engine.ingest_many(conn, [str(tmp_path)], workers=1)
+  assert count_rows(conn) == 3000
+  # nothing is loaded a second time
+  engine.ingest_many(conn, [str(tmp_path)], workers=1)
+  assert count_rows(conn) == 3000
+
+# test_compressed_loaded_once checks that a compressed file is only loaded once, with one or more workers
+@pytest.mark.parametrize("workers", [1, 2])
+def test_compressed_loaded_once(conn, tmp_path, write, days, count_rows, workers):
+  lines = days(2, 100)
+  with gzip.open(tmp_path / "old.log.gz", "wt", encoding="utf-8") as file:
+    file.write("\n".join(lines[:100]) + "\n")
+  write(tmp_path / "access.log", lines[100:])
+  engine.ingest_many(conn, [str(tmp_path)], workers=workers)
+  engine.ingest_many(conn, [str(tmp_path)], workers=workers)
+  assert count_rows(conn) == 200
+
+# test_replaced_file checks that a file that was truncated or replaced by a different file is loaded from the start
+def test_replaced_file(conn, tmp_path, write, line, count_rows):
+  path = write(tmp_path / "access.log", [line(1728518400 + i) for i in range(20)])
+  engine.ingest(conn, path, workers=1)
+  write(path, [line(1728518400 + i, ip="10.9.9.9") for i in range(5)])
+  assert engine.ingest(conn, path, workers=1)["rows"] == 5
+  assert count_rows(conn) == 25
+
+# test_unterminated_last_line checks that a last line without a newline is loaded once the file is no longer being
+# written to, but left for the next load while it may still be
+def test_unterminated_last_line(conn, tmp_path, write, days, count_rows):
+  lines = days(1, 10)
+  path = write(tmp_path / "old.log", lines, newline=False)
+  assert engine.ingest(conn, path, workers=1)["rows"] == 10
+  path = write(tmp_path / "new.log", lines, newline=False, fresh=True)
+  assert engine.ingest(conn, path, workers=1)["rows"] == 9
+  # the writer finishes the line
+  write(path, [""], mode="a")
+  assert engine.ingest(conn, path, workers=1)["rows"] == 1
+  assert count_rows(conn) == 20
+
+# test_vertical_tab_in_line checks that characters Python treats as line breaks (ex. a vertical tab inside of a user
+# agent) do not split a line in two
+def test_vertical_tab_in_line(conn, tmp_path, write, line, count_rows):
+  path = write(tmp_path / "access.log", [line(agent="bad\x0bagent"), line(agent="ok\x1cagent")])
+  stats = engine.ingest(conn, path, workers=1)
+  assert stats["rows"] == 2 and stats["rejected"] == 0
+
+# test_appended_lines checks that load_appended (used when following a file) carries on from the end of the last load
+# and only takes complete lines
+def test_appended_lines(conn, tmp_path, write, days, count_rows):
+  lines = days(1, 10)
+  path = write(tmp_path / "access.log", lines[:5])
+  engine.ingest(conn, path, workers=1)
+  write(path, lines[5:], newline=False, mode="a")
+  assert len(engine.load_appended(conn, os.path.abspath(path))) == 4
+  write(path, [""], mode="a")
+  assert len(engine.load_appended(conn, os.path.abspath(path))) == 1
+  assert count_rows(conn) == 10
+
+# test_folder_with_other_files checks that a folder holding files that are not logs loads with several workers
+def test_folder_with_other_files(conn, tmp_path, write, days, count_rows):
+  lines = days(2, 50)
+  write(tmp_path / "a.log", lines[:50])
+  write(tmp_path / "b.log", lines[50:])
+  write(tmp_path / "README.txt", ["not a log"])
+  results = engine.ingest_many(conn, [str(tmp_path)], workers=2)
+  assert len(results) == 3
+  assert count_rows(conn) == 100
+
+# test_cancel_undoes_load checks that cancelling a load removes every row it added and that the next load then loads
+# the whole file
+def test_cancel_undoes_load(conn, tmp_path, write, days, count_rows, monkeypatch):
+  monkeypatch.setattr(engine, "batch_size", 10)
+  path = write(tmp_path / "access.log", days(1, 100))
+  checks = []
+  # cancel once a few batches have been committed
+  def cancelled():
+    checks.append(True)
+    return len(checks) > 3
+  stats = engine.ingest(conn, path, workers=1, cancelled=cancelled)
+  assert stats["cancelled"]
+  assert count_rows(conn) == 0
+  assert engine.ingest(conn, path, workers=1)["rows"] == 100
+  assert count_rows(conn) == 100
+
+# test_cancel_keeps_other_sources checks that undoing a cancelled load only removes its own rows, and not the rows
+# another connection added from a different file while it was running
+def test_cancel_keeps_other_sources(conn, tmp_path, write, days, count_rows, monkeypatch):
+  monkeypatch.setattr(engine, "batch_size", 10)
+  lines = days(2, 100)
+  path = write(tmp_path / "access.log", lines[:100])
+  other_path = os.path.abspath(write(tmp_path / "other.log", lines[100:]))
+  other = engine.connect(str(tmp_path / "logs.db"))
+  checks = []
+  # the other file is loaded part way through, then the load is cancelled
+  def cancelled():
+    checks.append(True)
+    if len(checks) == 3:
+      engine.load_appended(other, other_path)
+    return len(checks) > 5
+  try:
+    assert engine.ingest(conn, path, workers=1, cancelled=cancelled)["cancelled"]
+  finally:
+    other.close()
+  assert count_rows(conn) == 100
+  assert dict((source, rows) for source, host, rows in engine.sources(conn.cursor())) == {os.path.abspath(path): 0, other_path: 100}
+
+# test_error_undoes_load checks that a load that stops with an error removes the rows it added, so the next load does
+# not load them twice
+def test_error_undoes_load(conn, tmp_path, write, days, count_rows, monkeypatch):
+  monkeypatch.setattr(engine, "batch_size", 10)
+  path = write(tmp_path / "access.log", days(1, 100))
+  checks = []
+  # fail once a few batches have been committed
+  def cancelled():
+    checks.append(True)
+    if len(checks) > 3:
+      raise KeyboardInterrupt
+    return False
+  with pytest.raises(KeyboardInterrupt):
+    engine.ingest(conn, path, workers=1, cancelled=cancelled)
+  assert count_rows(conn) == 0
+  assert engine.ingest(conn, path, workers=1)["rows"] == 100
@@ -0,0 +1,92 @@
+# Project Name: Sploosh
+#
+# tests/test_parsers.py
+# Tests for the line parsers in sploosh_parsers.py: the default parser, the
+# relaxed regular expression it falls back to and compiled nginx log formats.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+import pytest
+import sploosh_parsers as parsers
+
+# a Combined Log Format line with a response time on the end and the row it is read as
+combined = '10.0.0.1 - - [10/Oct/2024:13:55:36 -0700] "GET /index.html HTTP/1.1" 200 2326 "https://example.com/" "Mozilla/5.0 (X11)" 45'
+combined_row = ("10.0.0.1", 1728593736, "GET", "/index.html", 200, 2326, "https://example.com/", "Mozilla/5.0 (X11)", 45)
+
+# test_default_reads_combined checks that a normal line is read into every column, with its time turned into UTC
+def test_default_reads_combined():
+  assert parsers.parse_default(combined) == combined_row
+
+# test_default_without_response_time checks that a line without a response time stores None for it
+def test_default_without_response_time():
+  assert parsers.parse_default(combined.rsplit(" ", 1)[0]) == combined_row[:-1] + (None,)
+
+# test_default_timezones checks that the same moment written in two timezones is read as the same time
+def test_default_timezones():
+  east = combined.replace("13:55:36 -0700", "22:55:36 +0200")
+  assert parsers.parse_default(east)[1] == combined_row[1]
+
+# test_default_matches_regex checks that the default parser reads normal lines the same as the original regular expression
+@pytest.mark.parametrize("line", [
+  combined,
+  combined.replace("GET", "POST").replace("200", "503"),
+  '192.168.1.20 - - [01/Jan/2025:00:00:00 +0000] "DELETE /api/v1/users/7 HTTP/1.1" 404 0 "-" "curl/8.0" 1000'
+])
+def test_default_matches_regex(line):
+  assert parsers.parse_default(line) == parsers.regex_typed(line)
+
+# test_default_falls_back checks that lines that do not split cleanly are still read through parse_relaxed
+@pytest.mark.parametrize("line, row", [
+  # HTTP/2 and a '-' for the size
+  ('10.0.0.1 - - [10/Oct/2024:20:55:36 +0000] "GET / HTTP/2.0" 304 - "-" "curl/8.0"',
+   ("10.0.0.1", 1728593736, "GET", "/", 304, 0, "-", "curl/8.0", None)),
+  # Common Log Format, with no referrer or user agent
+  ('10.0.0.1 - - [10/Oct/2024:20:55:36 +0000] "GET /a HTTP/1.0" 200 12',
+   ("10.0.0.1", 1728593736, "GET", "/a", 200, 12, "-", "-", None)),
+  # a quote escaped inside of the user agent
+  ('10.0.0.1 - - [10/Oct/2024:20:55:36 +0000] "GET /a HTTP/1.1" 200 12 "-" "say \\"hi\\"" 7',
+   ("10.0.0.1", 1728593736, "GET", "/a", 200, 12, "-", 'say \\"hi\\"', 7)),
+  # a user name with a space in it
+  ('10.0.0.1 - john smith [10/Oct/2024:20:55:36 +0000] "GET /a HTTP/1.1" 200 12 "-" "curl/8.0" 7',
+   ("10.0.0.1", 1728593736, "GET", "/a", 200, 12, "-", "curl/8.0", 7))
+])
+def test_default_falls_back(line, row):
+  assert parsers.parse_default(line) == row
+
+# test_default_rejects checks that lines that are not log lines are read as None
+@pytest.mark.parametrize("line", [
+  "",
+  "hello world",
+  '10.0.0.1 - - [10/Xyz/2024:20:55:36 +0000] "GET / HTTP/1.1" 200 1 "-" "-" 5',
+  '10.0.0.1 - - [10/Oct/2024:20:55:36 +0000]x "GET / HTTP/1.1" 200 1 "-" "-" 5',
+  '10.0.0.1 - - [10/Oct/2024:20:55:36 +0000] "GET / HTTP/1.1" abc 1 "-" "-" 5'
+])
+def test_default_rejects(line):
+  assert parsers.parse_default(line) is None
+
+# test_relaxed_reads_common checks parse_relaxed on its own with a Common Log Format line
+def test_relaxed_reads_common():
+  assert parsers.parse_relaxed('1.2.3.4 - - [10/Oct/2024:20:55:36 +0000] "PUT /x" 201 -') == ("1.2.3.4", 1728593736, "PUT", "/x", 201, 0, "-", "-", None)
+
+# test_second_cache_is_bounded checks that the cache of timestamps is emptied once it is full without changing the results
+def test_second_cache_is_bounded(monkeypatch):
+  monkeypatch.setattr(parsers, "second_cache_size", 10)
+  parsers.second_cache.clear()
+  for second in range(30):
+    line = combined.replace("13:55:36", f"13:55:{second:02d}")
+    assert parsers.parse_default(line)[1] == combined_row[1] - 36 + second
+    assert len(parsers.second_cache) <= 10
+
+# test_nginx_format checks that an nginx log_format string is compiled into a parser of its own
+def test_nginx_format():
+  parse = parsers.get_parser('$remote_addr [$time_local] "$request" $status $request_time')
+  assert parse('10.0.0.1 [10/Oct/2024:20:55:36 +0000] "GET /x HTTP/1.1" 200 0.250') == (
+    "10.0.0.1", 1728593736, "GET", "/x", 200, 0, "-", "-", 250)
+  assert parse("not a line") is None
+
+# test_nginx_format_needs_time checks that a format without a time in it is refused
+def test_nginx_format_needs_time():
+  with pytest.raises(ValueError):
+    parsers.compile_log_format("$remote_addr $status")
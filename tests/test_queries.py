@@ -0,0 +1,168 @@
+# Project Name: Sploosh
+#
+# tests/test_queries.py
+# Tests for counting and searching logs split across several day partitions,
+# and for the query cache being emptied when new logs are loaded.
+#
+# Authors:  Noah Bender
+#           Joseph Dabkowski
+
+# import statement(s)
+from collections import Counter
+import pytest
+import sploosh_engine as engine
+import sploosh_parsers as parsers
+
+# fixture providing a connection to a database holding five days of logs, with the lines of the days mixed together
+# so the ids of every partition overlap, along with the rows the lines are read as (in file order)
+@pytest.fixture
+def loaded(conn, tmp_path, write, days):
+  lines = days(5, 200)
+  # take the lines of the days in turn so every partition holds ids from across the whole file
+  lines = [lines[day * 200 + i] for i in range(200) for day in range(5)]
+  engine.ingest(conn, write(tmp_path / "access.log", lines), workers=1)
+  return conn, [parsers.parse_default(line) for line in lines]
+
+# expected_counts takes in a list of rows and the index of a column and returns the counts of the values of the column,
+# most common first and then in order of value, the same as count
+def expected_counts(rows, index):
+  return sorted(Counter(row[index] for row in rows).items(), key=lambda item: (-item[1], item[0]))
+
+# test_partitions checks that the logs are split into one partition for every day
+def test_partitions(loaded):
+  conn, rows = loaded
+  assert [table[3] for table in engine.partitions(conn.cursor())] == [200] * 5
+
+# test_count_across_partitions checks that counting over every partition adds up the counts of each one
+@pytest.mark.parametrize("term, index", [("status", 4), ("endpoint", 3), ("user_agent", 7), ("ip_addr", 0)])
+def test_count_across_partitions(loaded, term, index):
+  conn, rows = loaded
+  assert list(engine.count(conn.cursor(), term)) == expected_counts(rows, index)
+
+# test_count_top_n checks that only the most common values are returned when top_n is given
+def test_count_top_n(loaded):
+  conn, rows = loaded
+  assert list(engine.count(conn.cursor(), "ip_addr", 4)) == expected_counts(rows, 0)[:4]
+
+# test_count_with_filter checks that a condition limits the rows counted
+def test_count_with_filter(loaded):
+  conn, rows = loaded
+  condition, params = engine.search_condition("Googlebot", "user_agent")
+  counted = list(engine.count(conn.cursor(), "status", None, condition, params))
+  assert counted == expected_counts([row for row in rows if "Googlebot" in row[7]], 4)
+
+# test_count_one_partition checks that a count over a time range within a single day only counts that day
+@pytest.mark.parametrize("top_n", [None, 2])
+def test_count_one_partition(loaded, top_n):
+  conn, rows = loaded
+  start = engine.partition_size * (1728518400 // engine.partition_size + 2)
+  end = start + engine.partition_size - 1
+  condition, params = "timestamp BETWEEN ? AND ?", (start, end)
+  counted = list(engine.count(conn.cursor(), "endpoint", top_n, condition, params, start, end))
+  expected = expected_counts([row for row in rows if start <= row[1] <= end], 3)
+  assert counted == (expected[:top_n] if top_n else expected)
+
+# test_count_unknown_column checks that only real columns can be counted
+def test_count_unknown_column(loaded):
+  conn, rows = loaded
+  with pytest.raises(ValueError):
+    list(engine.count(conn.cursor(), "status; DROP TABLE logs"))
+
+# test_search_across_partitions checks that a search returns every matching row of every partition, in file order
+def test_search_across_partitions(loaded):
+  conn, rows = loaded
+  found = list(engine.search(conn.cursor(), "endpoint", "/page/3"))
+  assert [row[0] for row in found] == sorted(row[0] for row in found)
+  assert [row[1:] for row in found] == [row for row in rows if row[3] == "/page/3"]
+
+# test_search_time_range checks that a range of times only returns the rows within it
+def test_search_time_range(loaded):
+  conn, rows = loaded
+  found = list(engine.search(conn.cursor(), "timestamp", "11/Oct/2024:12:00", "12/Oct/2024:11:59"))
+  start = 1728518400 + engine.partition_size + 12 * 3600
+  assert [row[1:] for row in found] == [row for row in rows if start <= row[1] < start + engine.partition_size]
+
+# test_search_pages_after checks that reading the pages of a search after the last id of each page gives the same rows
+# as reading every page at once, as the search window of the GUI does
+def test_search_pages_after(loaded):
+  conn, rows = loaded
+  condition, params = engine.search_condition("200", "status")
+  every_page = [row for page in engine.search_pages(conn.cursor(), condition, params, 30) for row in page]
+  paged, after = [], None
+  while True:
+    page = next(engine.search_pages(conn.cursor(), condition, params, 30, after=after), [])
+    if not page:
+      break
+    paged += page
+    after = page[-1][0]
+  assert len(every_page) == sum(row[4] == 200 for row in rows)
+  assert paged == every_page
+
+# test_write_output checks that every matching row is written to the output file
+def test_write_output(loaded):
+  conn, rows = loaded
+  condition, params = engine.search_condition("500", "status")
+  written = engine.write_output(conn.cursor(), condition, params)
+  assert written == sum(row[4] == 500 for row in rows)
+  with open("output.txt") as file:
+    assert file.read().count("\n\n\n") == written
+
+# test_cache_emptied_on_ingest checks that a count run again is read from the cache, and that loading more logs
+# throws the cached result away so the new rows are counted
+def test_cache_emptied_on_ingest(loaded, tmp_path, write, line):
+  conn, rows = loaded
+  first = list(engine.count(conn.cursor(), "status"))
+  hits = engine.cache_stats(conn)["hits"]
+  assert list(engine.count(conn.cursor(), "status")) == first
+  assert engine.cache_stats(conn)["hits"] == hits + 1
+  version = engine.cache_stats(conn)["data_version"]
+  write(tmp_path / "access.log", [line(1728518400 + i, status=418) for i in range(3)], mode="a")
+  engine.ingest(conn, str(tmp_path / "access.log"), workers=1)
+  assert engine.cache_stats(conn)["data_version"] > version
+  assert list(engine.count(conn.cursor(), "status")) == sorted(first + [(418, 3)], key=lambda item: (-item[1], item[0]))
+
+# test_cache_emptied_on_undo checks that undoing a load throws cached results away as well
+def test_cache_emptied_on_undo(loaded, tmp_path, write, line):
+  conn, rows = loaded
+  first = list(engine.search(conn.cursor(), "status", "418"))
+  path = write(tmp_path / "more.log", [line(1728518400 + i, status=418) for i in range(3)])
+  engine.ingest(conn, path, workers=1)
+  assert len(list(engine.search(conn.cursor(), "status", "418"))) == 3
+  engine.delete_rows_after(conn, len(rows))
+  assert list(engine.search(conn.cursor(), "status", "418")) == first == []
+
+# test_searches_not_saved checks that only counts are saved in the query_cache table, and searches only in memory
+def test_searches_not_saved(loaded):
+  conn, rows = loaded
+  list(engine.search(conn.cursor(), "status", "404"))
+  assert engine.cache_stats(conn)["saved_entries"] == 0
+  list(engine.count(conn.cursor(), "status"))
+  assert [key.startswith('["count"') for (key,) in conn.execute("SELECT key FROM query_cache")] == [True]
+
+# test_saved_counts_shared checks that a count saved by one connection is read by another connection to the same database
+def test_saved_counts_shared(loaded, tmp_path):
+  conn, rows = loaded
+  first = list(engine.count(conn.cursor(), "method"))
+  engine.query_cache.clear()
+  other = engine.connect(str(tmp_path / "logs.db"))
+  try:
+    disk_hits = engine.cache_stats(other)["disk_hits"]
+    assert list(engine.count(other.cursor(), "method")) == first
+    assert engine.cache_stats(other)["disk_hits"] == disk_hits + 1
+  finally:
+    other.close()
+
+# test_memory_databases_kept_apart checks that results cached for one in-memory database are not returned for another
+def test_memory_databases_kept_apart(tmp_path, write, line, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  first, second = engine.connect(":memory:"), engine.connect(":memory:")
+  try:
+    engine.ingest(first, write(tmp_path / "a.log", [line(status=200)]), workers=1)
+    engine.ingest(second, write(tmp_path / "b.log", [line(status=404), line(status=404)]), workers=1)
+    assert list(engine.count(first.cursor(), "status")) == [(200, 1)]
+    assert list(engine.count(second.cursor(), "status")) == [(404, 2)]
+    assert len(list(engine.search(first.cursor(), "status", "200"))) == 1
+    assert list(engine.search(second.cursor(), "status", "200")) == []
+  finally:
+    first.close()
+    second.close()